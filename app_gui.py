@@ -7,7 +7,7 @@ import ui_constants as const
 import sys
 import subprocess
 # --- LIBRERÍAS DE TERCEROS ---
-from PIL import Image, ImageTk
+# PIL se importa al cargar el logo, después de mostrar la ventana.
 from cryptography.fernet import Fernet
 from mysql.connector import Error as MySQLError
 from datetime import datetime
@@ -16,14 +16,24 @@ from datetime import datetime
 from db_manager import DatabaseManager
 from services import ServicesManager
 from config_handler import load_key
-from contactos_tab import ContactosTab
-from multas_tab import MultasTab
-from mensajes_tab import MensajesTab
 from settings_window import SettingsWindow
+from log_sink import ConsoleLogSink
+from progress_reporter import ProgressReporter, format_progress
+from report_cache import ReportCache
+from startup_timer import startup_timer
+# Las pestañas (y sus dependencias, como phonenumbers o tkcalendar) se importan
+# la primera vez que se muestran; ver App._build_tab.
 
 # Añade este import
 
 
+# Pestañas que necesitan la BD; se habilitan cuando el pool está listo
+DB_TABS = ("Contactos", "Multas", "Mensajes y Envío")
+
+# Tamaño de bloque para copiar la salida de mysqldump / la entrada de mysql
+BACKUP_CHUNK_SIZE = 64 * 1024
+
+
 def resource_path(relative_path):
     """ Obtiene la ruta absoluta al recurso, funciona para desarrollo y para PyInstaller """
     try:
@@ -66,23 +76,21 @@ class App:
             self.root.destroy()
             return
 
-        try:
-            self.db_manager = DatabaseManager(self.config, self.fernet)
-            log_message = "Pool de DB conectado"
-        except MySQLError as e:
-            messagebox.showerror(
-                "Error Crítico de BD", f"No se pudo crear el pool de conexiones a MySQL: {e}")
-            self.db_manager = None
-            log_message = f"Error de BD: {e}"
+        # La conexión a la BD se establece en segundo plano (ver _conectar_bd_task);
+        # mientras tanto db_manager es None y las pestañas que la usan están deshabilitadas.
+        self.db_manager = None
+        self.scheduler = None
+        self.db_status = tk.StringVar(value="BD: conectando...")
+        self._db_init_stop = threading.Event()
 
         self.services_manager = ServicesManager(self.config, self.fernet)
+        self.report_cache = ReportCache.from_config(self.config)
 
         # Variables de estado que pertenecen a la App principal
         self.stats_total_contacts = tk.StringVar(value="--")
         self.stats_pending_fines = tk.StringVar(value="--")
         self.stats_monthly_revenue = tk.StringVar(value="--")
         self.multa_descripciones = []  # Usado por MultasTab, pero cargado centralmente
-        self.driver = None  # Driver de Selenium, gestionado centralmente
         self.console_visible = True
 
         self.menubar = tk.Menu(self.root)
@@ -102,14 +110,80 @@ class App:
 
         self.create_widgets()
         self.log_to_console("¡Aplicación Iniciada!")
-        self.log_to_console(log_message)
+        startup_timer.mark("ventana principal")
+        # El logo (PIL) se carga cuando la ventana ya es interactiva
+        self.root.after_idle(self._on_first_idle)
+
+        threading.Thread(target=self._conectar_bd_task, daemon=True).start()
+
+    def _conectar_bd_task(self):
+        """
+        Crea el pool de conexiones y verifica el esquema fuera del hilo de Tk.
+        Si falla, reintenta con espera exponencial (2, 4, 8... s, hasta el máximo configurado).
+        """
+        max_delay = self.config.getfloat(
+            'mysql', 'connect_retry_max_delay', fallback=60)
+        attempt = 0
+        while not self._db_init_stop.is_set():
+            attempt += 1
+            try:
+                db_manager = DatabaseManager(self.config, self.fernet)
+                db_manager.init_db()
+                self.root.after(0, self._on_db_ready, db_manager)
+                return
+            except Exception as e:
+                delay = min(max_delay, 2 ** attempt)
+                self.log_to_console(
+                    f"Error de BD (intento {attempt}): {e}. Reintentando en {delay:.0f} s...", "error")
+                self.root.after(0, self.db_status.set,
+                                f"BD: sin conexión, reintento en {delay:.0f} s")
+                # wait() devuelve True si la app se está cerrando
+                if self._db_init_stop.wait(delay):
+                    return
+                self.root.after(0, self.db_status.set,
+                                f"BD: conectando (intento {attempt + 1})...")
+
+    def _on_db_ready(self, db_manager):
+        """Se ejecuta en el hilo de Tk cuando el pool está listo: habilita las pestañas y lanza las cargas iniciales."""
+        self.db_manager = db_manager
+        self.db_status.set("BD: conectada")
+        self.log_to_console("Pool de DB conectado")
+        self._set_db_tabs_state(enabled=True)
+
+        # Las pestañas ya construidas no pudieron cargar sus datos al crearse
+        if self.contactos_tab:
+            self.contactos_tab._cargar_contactos_thread()
+        if self.multas_tab:
+            self.multas_tab._cargar_multas_thread()
+        if self.mensajes_tab:
+            self.mensajes_tab._cargar_mensajes_thread()
 
         # Cargas iniciales que gestiona la App
-        if self.db_manager:
-            self.db_manager.init_db()
-            self._cargar_dashboard_stats_thread()
-            # La carga de descripciones se gestiona aquí porque es un recurso compartido
-            self.root.after(250, self._cargar_descripciones_thread)
+        self._cargar_dashboard_stats_thread()
+        # La carga de descripciones se gestiona aquí porque es un recurso compartido
+        self.root.after(250, self._cargar_descripciones_thread)
+        if self.config.getboolean('scheduler', 'enabled', fallback=True):
+            self._iniciar_programador()
+
+    def _iniciar_programador(self):
+        """Lanza en segundo plano el envío de las campañas programadas (campaign_scheduler.py)."""
+        # Se importa aquí, como las pestañas, para no retrasar el arranque
+        from campaign_scheduler import CampaignScheduler
+        try:
+            self.scheduler = CampaignScheduler.from_config(
+                self.services_manager, self.db_manager, log=self.log_to_console)
+        except ValueError as e:
+            self.log_to_console(
+                f"Programador de campañas desactivado: {e}", "error")
+            return
+        threading.Thread(target=self.scheduler.run, daemon=True).start()
+
+    def _set_db_tabs_state(self, enabled):
+        """Habilita o deshabilita los botones de las pestañas que dependen de la BD."""
+        for name in DB_TABS:
+            self.sidebar_buttons[name].config(
+                state=tk.NORMAL if enabled else tk.DISABLED,
+                disabledforeground=const.DISABLED_BUTTON_FG)
 
     def create_widgets(self):
 
@@ -130,55 +204,31 @@ class App:
         self.content_frames = {}
         self.sidebar_buttons = {}
         tab_names = ["Inicio", "Contactos", "Multas", "Mensajes y Envío"]
+        self.sidebar_frame = sidebar_frame
 
-        # Creamos el Dashboard
+        # Creamos el Dashboard. Las demás pestañas se construyen al mostrarse por primera vez.
         self.content_frames["Inicio"] = tk.Frame(
             self.content_area, bg=const.ACTIVE_TAB_BG)
         self.populate_dashboard_frame()
-
-        # Instanciamos nuestras clases personalizadas para cada pestaña
-        self.contactos_tab = ContactosTab(self.content_area, controller=self)
-        self.content_frames["Contactos"] = self.contactos_tab
-
-        self.multas_tab = MultasTab(self.content_area, controller=self)
-        self.content_frames["Multas"] = self.multas_tab
-
-        self.mensajes_tab = MensajesTab(self.content_area, controller=self)
-        self.content_frames["Mensajes y Envío"] = self.mensajes_tab
+        self.content_frames["Inicio"].grid(row=0, column=0, sticky="nsew")
+        self.contactos_tab = None
+        self.multas_tab = None
+        self.mensajes_tab = None
 
         for name in tab_names:
             button = tk.Button(sidebar_frame, text=name, font=("Segoe UI", 11, "bold"), bg=const.BUTTON_NORMAL_BG, fg=const.BUTTON_FG,
                                activebackground=const.BUTTON_ACTIVE_BG, activeforeground=const.BUTTON_FG, relief="flat", borderwidth=0, anchor="w", padx=20, pady=10)
             button.pack(fill="x", pady=2)
             self.sidebar_buttons[name] = button
-            self.content_frames[name].grid(row=0, column=0, sticky="nsew")
-
-        # Logo
-        try:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            logo_path = resource_path(
-                os.path.join('assets', 'logo_sidebar.png'))
-            logo_image_original = Image.open(logo_path)
-            logo_image_resized = logo_image_original.resize(
-                (150, 150), Image.Resampling.LANCZOS)
-            self.logo_photo = ImageTk.PhotoImage(logo_image_resized)
-            logo_label = tk.Label(
-                sidebar_frame, image=self.logo_photo, bg=const.SIDEBAR_BG)
-            logo_label.pack(side=tk.BOTTOM, pady=20, padx=10)
-        except Exception as e:
-            self.log_to_console(
-                f"Advertencia: No se pudo cargar el logo: {e}", "warning")
-
-        # Lógica para mostrar pestañas
-        def show_content(name):
-            for btn in self.sidebar_buttons.values():
-                btn.config(bg=const.BUTTON_NORMAL_BG)
-            self.sidebar_buttons[name].config(bg=const.BUTTON_ACTIVE_BG)
-            self.content_frames[name].tkraise()
 
         for name in tab_names:
             self.sidebar_buttons[name].config(
-                command=lambda n=name: show_content(n))
+                command=lambda n=name: self.show_content(n))
+        self._set_db_tabs_state(enabled=False)
+
+        self.db_status_label = tk.Label(sidebar_frame, textvariable=self.db_status, bg=const.SIDEBAR_BG,
+                                        fg=const.BUTTON_FG, font=("Segoe UI", 9), anchor="w", padx=20)
+        self.db_status_label.pack(fill="x", pady=(10, 0))
 
         # Consola
         self.console_container = tk.Frame(main_frame, bg=const.MAIN_BG)
@@ -186,13 +236,89 @@ class App:
         self.log_area = scrolledtext.ScrolledText(
             self.console_container, state='disabled', height=8, bg="#34495E", fg="#ECF0F1", relief="flat")
         self.log_area.pack(fill="both", expand=True)
+        self.log_sink = ConsoleLogSink(
+            self.root, self.log_area,
+            max_lines=self.config.getint(
+                'app', 'console_max_lines', fallback=1000),
+            log_file=self.config.get('app', 'log_file', fallback='') or None,
+            log_max_bytes=self.config.getint(
+                'app', 'log_max_bytes', fallback=1_000_000),
+            log_backup_count=self.config.getint(
+                'app', 'log_backup_count', fallback=3))
+        self.log_sink.start()
         console_button_style = const.BUTTON_STYLE.copy()
         console_button_style['bg'] = const.SIDEBAR_BG
         self.toggle_console_button = tk.Button(
             self.console_container, text="Ocultar Consola", **console_button_style, command=self.toggle_console_visibility)
         self.toggle_console_button.pack(fill='x', pady=(5, 0))
 
-        show_content("Inicio")
+        # Barra de estado para tareas largas (importaciones, exportaciones, reportes, backups)
+        job_status_frame = tk.Frame(main_frame, bg=const.MAIN_BG)
+        job_status_frame.pack(side="bottom", fill="x", padx=10)
+        self.job_status_label = tk.Label(
+            job_status_frame, text="", bg=const.MAIN_BG, anchor="w", font=("Segoe UI", 9))
+        self.job_status_label.pack(side="left", fill="x", expand=True)
+        self.job_progress_bar = ttk.Progressbar(
+            job_status_frame, orient="horizontal", mode="determinate", length=250)
+        self.job_progress_bar.pack(side="right", pady=2)
+
+        self.show_content("Inicio")
+
+    def show_content(self, name):
+        """Muestra una pestaña, construyéndola si es la primera vez."""
+        if name not in self.content_frames:
+            self._build_tab(name)
+        for btn in self.sidebar_buttons.values():
+            btn.config(bg=const.BUTTON_NORMAL_BG)
+        self.sidebar_buttons[name].config(bg=const.BUTTON_ACTIVE_BG)
+        self.content_frames[name].tkraise()
+
+    def _build_tab(self, name):
+        """
+        Importa y construye una pestaña. Cada pestaña lanza su consulta inicial
+        al construirse, así que la BD solo se consulta para lo que el usuario abre.
+        """
+        build_start = time.perf_counter()
+        if name == "Contactos":
+            from contactos_tab import ContactosTab
+            self.contactos_tab = ContactosTab(
+                self.content_area, controller=self)
+            frame = self.contactos_tab
+        elif name == "Multas":
+            from multas_tab import MultasTab
+            self.multas_tab = MultasTab(self.content_area, controller=self)
+            frame = self.multas_tab
+        else:
+            from mensajes_tab import MensajesTab
+            self.mensajes_tab = MensajesTab(
+                self.content_area, controller=self)
+            frame = self.mensajes_tab
+        frame.grid(row=0, column=0, sticky="nsew")
+        self.content_frames[name] = frame
+        self.log_to_console(
+            f"Pestaña '{name}' construida en {(time.perf_counter() - build_start) * 1000:.0f} ms.")
+
+    def _on_first_idle(self):
+        """Se ejecuta cuando la ventana principal ya se mostró y acepta eventos."""
+        startup_timer.mark("ventana interactiva")
+        self.log_to_console(startup_timer.report())
+        self._cargar_logo()
+
+    def _cargar_logo(self):
+        try:
+            from PIL import Image, ImageTk
+            logo_path = resource_path(
+                os.path.join('assets', 'logo_sidebar.png'))
+            logo_image_original = Image.open(logo_path)
+            logo_image_resized = logo_image_original.resize(
+                (150, 150), Image.Resampling.LANCZOS)
+            self.logo_photo = ImageTk.PhotoImage(logo_image_resized)
+            logo_label = tk.Label(
+                self.sidebar_frame, image=self.logo_photo, bg=const.SIDEBAR_BG)
+            logo_label.pack(side=tk.BOTTOM, pady=20, padx=10)
+        except Exception as e:
+            self.log_to_console(
+                f"Advertencia: No se pudo cargar el logo: {e}", "warning")
 
     def open_settings_window(self):
         """Abre la ventana de configuración."""
@@ -212,15 +338,32 @@ class App:
         toplevel_window.geometry(f'+{x}+{y}')
 
     def log_to_console(self, message, level="info"):
-        if not hasattr(self, 'log_area'):
+        """
+        Escribe un mensaje en la consola. Es seguro llamarlo desde hilos de trabajo:
+        el mensaje se encola y el sumidero lo inserta en el hilo de Tk.
+        """
+        if not hasattr(self, 'log_sink'):
+            print(f"[{level.upper()}] {message}")
             return
-        timestamp = time.strftime("[%H:%M:%S]")
-        formatted_message = f"{timestamp} {message}\n"
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, formatted_message)
-        self.log_area.see(tk.END)
-        self.log_area.config(state='disabled')
-        print(f"[{level.upper()}] {message}")
+        self.log_sink.write(message, level)
+
+    def create_progress_reporter(self, title, total=0, unit="filas"):
+        """
+        Crea un ProgressReporter que muestra su avance en la barra de estado de tareas.
+        Se puede llamar desde cualquier hilo; el refresco siempre ocurre en el hilo de Tk.
+        """
+        def on_update(snapshot):
+            self.job_status_label.config(text=format_progress(snapshot))
+            if snapshot['total']:
+                self.job_progress_bar.config(
+                    mode="determinate", value=snapshot['percent'])
+            elif snapshot['finished']:
+                self.job_progress_bar.config(mode="determinate", value=100)
+            else:
+                self.job_progress_bar.config(mode="indeterminate")
+                self.job_progress_bar.step(5)
+
+        return ProgressReporter(on_update, root=self.root, title=title, total=total, unit=unit)
 
     def _cargar_descripciones_thread(self):
         threading.Thread(
@@ -371,7 +514,10 @@ class App:
     def _crear_backup_task(self, filepath):
         """Ejecuta mysqldump para crear un archivo .sql con los datos de la BD."""
         import subprocess  # Importamos aquí para no cargarlo si no se usa
+        import tempfile
 
+        progreso = self.create_progress_reporter(
+            "Backup", unit="bytes").start()
         try:
             # Obtenemos los datos de la configuración
             host = self.config['mysql']['host']
@@ -390,26 +536,39 @@ class App:
                 db_name
             ]
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                # Ejecutamos el comando y redirigimos la salida al archivo
-                process = subprocess.run(command, stdout=f, stderr=subprocess.PIPE,
-                                         text=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-
+            # La salida se copia por bloques para poder informar el avance;
+            # stderr va a un temporal para que no se bloquee el proceso si crece.
+            with open(filepath, 'wb') as f, tempfile.TemporaryFile() as err_file:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=err_file,
+                                           creationflags=subprocess.CREATE_NO_WINDOW)
+                for chunk in iter(lambda: process.stdout.read(BACKUP_CHUNK_SIZE), b''):
+                    f.write(chunk)
+                    progreso.advance(len(chunk))
+                process.stdout.close()
+                returncode = process.wait()
+                if returncode != 0:
+                    err_file.seek(0)
+                    raise subprocess.CalledProcessError(
+                        returncode, command[0], stderr=err_file.read().decode('utf-8', errors='replace'))
+
+            progreso.finish()
             self.root.after(0, lambda: messagebox.showinfo(
                 "Backup Exitoso", f"La base de datos se ha guardado correctamente en:\n{filepath}", parent=self.root))
-            self.root.after(
-                0, lambda: self.log_to_console("Backup completado con éxito."))
+            self.log_to_console("Backup completado con éxito.")
 
         except FileNotFoundError:
+            progreso.finish("Error")
             self.root.after(0, lambda: messagebox.showerror(
                 "Error de Comando", "El comando 'mysqldump' no se encontró.\nAsegúrate de que MySQL esté instalado y en el PATH del sistema.", parent=self.root))
         except subprocess.CalledProcessError as e:
+            progreso.finish("Error")
             # Si mysqldump falla (ej. contraseña incorrecta), el error estará en stderr
-            self.root.after(0, lambda: messagebox.showerror(
-                "Error en Backup", f"Ocurrió un error al ejecutar mysqldump:\n{e.stderr}", parent=self.root))
+            self.root.after(0, lambda err=e: messagebox.showerror(
+                "Error en Backup", f"Ocurrió un error al ejecutar mysqldump:\n{err.stderr}", parent=self.root))
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror(
-                "Error Inesperado", f"Ocurrió un error inesperado durante el backup:\n{e}", parent=self.root))
+            progreso.finish("Error")
+            self.root.after(0, lambda err=e: messagebox.showerror(
+                "Error Inesperado", f"Ocurrió un error inesperado durante el backup:\n{err}", parent=self.root))
 
     def restaurar_backup(self):
         """Pide confirmación y un archivo .sql para restaurar la BD."""
@@ -439,7 +598,10 @@ class App:
     def _restaurar_backup_task(self, filepath):
         """Ejecuta el cliente mysql para importar los datos desde un archivo .sql."""
         import subprocess  # Importamos aquí para no cargarlo si no se usa
+        import tempfile
 
+        progreso = self.create_progress_reporter(
+            "Restauración", total=os.path.getsize(filepath), unit="bytes").start()
         try:
             host = self.config['mysql']['host']
             user = self.config['mysql']['user']
@@ -455,39 +617,73 @@ class App:
                 db_name
             ]
 
-            with open(filepath, 'r', encoding='utf-8') as f:
-                # Ejecutamos el comando y le pasamos el contenido del archivo como entrada
-                process = subprocess.run(command, stdin=f, stderr=subprocess.PIPE,
-                                         text=True, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-
+            # Le pasamos el archivo al cliente por bloques para informar el avance
+            with open(filepath, 'rb') as f, tempfile.TemporaryFile() as err_file:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=err_file,
+                                           creationflags=subprocess.CREATE_NO_WINDOW)
+                try:
+                    for chunk in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b''):
+                        process.stdin.write(chunk)
+                        progreso.advance(len(chunk))
+                except BrokenPipeError:
+                    # El cliente terminó antes de tiempo; el error real está en stderr
+                    pass
+                finally:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                returncode = process.wait()
+                # Aunque falle a medias, la restauración pudo cambiar las multas, y
+                # las versiones de datos vuelven a las del backup: una época nueva
+                # invalida los reportes en caché de todos los equipos; la caché
+                # local, además, se vacía para liberar el disco.
+                self.report_cache.clear()
+                if self.db_manager:
+                    self.db_manager.renew_data_epoch()
+                if returncode != 0:
+                    err_file.seek(0)
+                    raise subprocess.CalledProcessError(
+                        returncode, command[0], stderr=err_file.read().decode('utf-8', errors='replace'))
+
+            progreso.finish()
             self.root.after(0, lambda: messagebox.showinfo(
                 "Restauración Exitosa", "La base de datos se ha restaurado correctamente.", parent=self.root))
-            self.root.after(0, lambda: self.log_to_console(
-                "Restauración completada. Recargando datos..."))
+            self.log_to_console("Restauración completada. Recargando datos...")
 
-            # Recargamos los datos en todas las pestañas para reflejar los cambios
+            # Recargamos los datos en las pestañas ya construidas para reflejar los cambios
             self.root.after(
                 100, self._cargar_dashboard_stats_thread)
-            self.root.after(
-                200, self.contactos_tab._cargar_contactos_thread)
-            self.root.after(
-                300, self.multas_tab._cargar_multas_thread)
-            self.root.after(
-                400, self.mensajes_tab._cargar_mensajes_thread)
+            if self.contactos_tab:
+                self.root.after(
+                    200, self.contactos_tab._cargar_contactos_thread)
+            if self.multas_tab:
+                self.root.after(
+                    300, self.multas_tab._cargar_multas_thread)
+            if self.mensajes_tab:
+                self.root.after(
+                    400, self.mensajes_tab._cargar_mensajes_thread)
 
         except FileNotFoundError:
+            progreso.finish("Error")
             self.root.after(0, lambda: messagebox.showerror(
                 "Error de Comando", "El comando 'mysql' no se encontró.\nAsegúrate de que MySQL esté instalado y en el PATH del sistema.", parent=self.root))
         except subprocess.CalledProcessError as e:
-            self.root.after(0, lambda: messagebox.showerror(
-                "Error en Restauración", f"Ocurrió un error al ejecutar mysql:\n{e.stderr}", parent=self.root))
+            progreso.finish("Error")
+            self.root.after(0, lambda err=e: messagebox.showerror(
+                "Error en Restauración", f"Ocurrió un error al ejecutar mysql:\n{err.stderr}", parent=self.root))
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror(
-                "Error Inesperado", f"Ocurrió un error inesperado durante la restauración:\n{e}", parent=self.root))
+            progreso.finish("Error")
+            self.root.after(0, lambda err=e: messagebox.showerror(
+                "Error Inesperado", f"Ocurrió un error inesperado durante la restauración:\n{err}", parent=self.root))
 
     def on_closing(self):
         if messagebox.askyesno("Confirmar Salida", "¿Estás seguro de que quieres cerrar el programa?"):
-            if self.driver:
-                self.driver.quit()
+            self._db_init_stop.set()
+            if self.scheduler:
+                self.scheduler.stop()
+            self.services_manager.shutdown()
             # Aquí podríamos cerrar el pool de la BD si lo implementamos
+            if hasattr(self, 'log_sink'):
+                self.log_sink.close()
             self.root.destroy()
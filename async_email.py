@@ -0,0 +1,289 @@
+# async_email.py
+"""
+Módulo con el backend asyncio para el envío masivo de emails
+('[smtp] backend = asyncio').
+
+Un único bucle de eventos, en un hilo propio, mantiene muchas sesiones SMTP
+concurrentes con aiosmtplib, sin necesitar un hilo por conexión. La interfaz
+es la de EmailDispatcher:
+- submit() se bloquea mientras la cola está llena (contrapresión), así que la
+  lectura de destinatarios va al ritmo del envío;
+- cancel() se puede llamar desde la interfaz: descarta lo pendiente e
+  interrumpe las esperas del limitador de tasa, del breaker y de los
+  reintentos. Los envíos que están en curso terminan, para no dejar un
+  mensaje a medio entregar.
+
+aiosmtplib es opcional. Sin él, crear_dispatcher() usa el backend de hilos.
+"""
+
+import asyncio
+import threading
+import time
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+from email_dispatcher import DailyQuota, EmailResult, QuotaExceededError, TokenBucket, enviados_24h
+from retry_policy import CircuitBreaker, RetryPolicy, enviar_con_reintentos_async, esperar_async
+from smtp_session import RECONNECT_CODES
+
+_STOP = object()
+
+
+class AsyncSMTPSession:
+    """
+    Equivalente asíncrono de SMTPSession: una conexión reutilizable para muchos
+    mensajes, que se reconecta sola y comprueba con NOOP las conexiones inactivas.
+    Cada sesión la usa una sola corrutina a la vez.
+    """
+
+    def __init__(self, server, port, sender_email, password, max_messages=100,
+                 keepalive_interval=60, timeout=30, security='ssl'):
+        self.server = server
+        self.port = port
+        self.sender_email = sender_email
+        self.password = password
+        self.max_messages = max_messages
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        self.security = security
+
+        self._smtp = None
+        self._sent_in_connection = 0
+        self._last_activity = 0.0
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    async def _connect(self):
+        smtp = aiosmtplib.SMTP(hostname=self.server, port=self.port, timeout=self.timeout,
+                               use_tls=self.security == 'ssl',
+                               start_tls=self.security == 'starttls')
+        await smtp.connect()
+        try:
+            await smtp.login(self.sender_email, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._sent_in_connection = 0
+        self._last_activity = time.monotonic()
+        self.connections_opened += 1
+
+    async def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            await self._smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    async def _ensure_connected(self):
+        if self._smtp is not None:
+            if self.max_messages and self._sent_in_connection >= self.max_messages:
+                await self._disconnect()
+            elif (self.keepalive_interval
+                  and time.monotonic() - self._last_activity > self.keepalive_interval):
+                try:
+                    await self._smtp.noop()
+                    self._last_activity = time.monotonic()
+                except (aiosmtplib.SMTPException, OSError):
+                    self._smtp.close()
+                    self._smtp = None
+        if self._smtp is None:
+            await self._connect()
+
+    async def send_message(self, msg):
+        """
+        Envía un mensaje reutilizando la conexión. Como SMTPSession, reintenta
+        una vez si el servidor cerró la conexión o respondió 421/451/454.
+        """
+        for attempt in range(2):
+            await self._ensure_connected()
+            try:
+                await self._smtp.send_message(msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if attempt:
+                    raise
+                continue
+            except aiosmtplib.SMTPResponseException as e:
+                if e.code not in RECONNECT_CODES or attempt:
+                    raise
+                await self._disconnect()
+                continue
+            self._sent_in_connection += 1
+            self._last_activity = time.monotonic()
+            self.messages_sent += 1
+            return
+
+    async def close(self):
+        await self._disconnect()
+
+
+class AsyncEmailDispatcher:
+    """
+    Envía emails con 'connections' sesiones SMTP concurrentes en un bucle de
+    eventos propio. Misma interfaz y mismos resultados (EmailResult) que
+    EmailDispatcher; 'on_result' se llama desde el hilo del bucle.
+    """
+
+    def __init__(self, services_manager, connections=20, per_second=0, per_day=0,
+                 on_result=None, queue_size=None, retry_policy=None, breaker=None, log=None,
+                 already_sent=0):
+        if aiosmtplib is None:
+            raise RuntimeError("El backend asyncio de email requiere el paquete 'aiosmtplib'.")
+        self.services_manager = services_manager
+        self.connections = max(1, connections)
+        self.bucket = TokenBucket(per_second)
+        self.quota = DailyQuota(per_day, already_sent)
+        self.on_result = on_result
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breaker = breaker
+        self.log = log or (lambda message, level="info": print(message))
+        self.queue_size = queue_size or self.connections * 50
+
+        self._loop = None
+        self._thread = None
+        self._queue = None
+        self._stop = None
+        self._tasks = []
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self.results = []
+        self.sent = 0
+        self.failed = 0
+
+    @classmethod
+    def from_config(cls, services_manager, on_result=None, log=None, connections=None, db_manager=None):
+        """
+        Crea un dispatcher con los valores de la sección [smtp] de config.ini.
+        'connections' sustituye al valor configurado sin modificar la configuración.
+        Con 'db_manager', la cuota diaria parte de los emails enviados en las
+        últimas 24 horas.
+        """
+        config = services_manager.config
+        per_day = config.getint('smtp', 'max_per_day', fallback=0)
+        return cls(
+            services_manager,
+            connections=connections or config.getint('smtp', 'async_connections', fallback=20),
+            per_second=config.getfloat('smtp', 'max_per_second', fallback=0),
+            per_day=per_day,
+            on_result=on_result,
+            retry_policy=RetryPolicy.from_config(config, 'smtp'),
+            breaker=CircuitBreaker.from_config(config, 'smtp', "Email", log=log),
+            log=log,
+            already_sent=enviados_24h(db_manager) if per_day else 0)
+
+    # --- Control desde otros hilos ---
+
+    def _call(self, coro):
+        """Ejecuta una corrutina en el bucle y espera su resultado."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="smtp-asyncio", daemon=True)
+        self._thread.start()
+        self._call(self._setup())
+        return self
+
+    def submit(self, contact_id, email, subject, body, attachments=None):
+        """Encola un email ya personalizado. Se bloquea si la cola está llena."""
+        if self._cancelled.is_set():
+            # Se informa como cancelado para que quien lo encoló no lo espere
+            self._record(EmailResult(contact_id, email, False, "Envío cancelado.", 0.0, 0))
+            return
+        self._call(self._queue.put((contact_id, email, subject, body, attachments)))
+
+    def cancel(self):
+        """Descarta los emails pendientes; los envíos en curso terminan."""
+        self._cancelled.set()
+        if self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def close(self):
+        """Espera a que se envíen los emails encolados, cierra las conexiones y el bucle."""
+        self._call(self._finish())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    # --- Dentro del bucle ---
+
+    async def _setup(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stop = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker())
+                       for _ in range(self.connections)]
+
+    async def _finish(self):
+        for _ in self._tasks:
+            await self._queue.put(_STOP)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    def _record(self, result):
+        with self._lock:
+            self.results.append(result)
+            if result.ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if self.on_result:
+            self.on_result(result)
+
+    async def _take_token(self):
+        """Espera un token del limitador; False si se canceló mientras tanto."""
+        while True:
+            wait = self.bucket.reserve()
+            if wait <= 0:
+                return True
+            if await esperar_async(self._stop, wait):
+                return False
+
+    async def _worker(self):
+        session = [None]
+
+        async def send(email, subject, body, attachments):
+            if session[0] is None:
+                session[0] = self.services_manager.open_async_email_session()
+            await self.services_manager.send_email_async(
+                email, subject, body, session=session[0], attachments=attachments)
+
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _STOP:
+                    break
+                contact_id, email, subject, body, attachments = item
+                # Token y cuota se gastan una vez por email, no por reintento
+                if self._stop.is_set() or not await self._take_token():
+                    self._record(EmailResult(
+                        contact_id, email, False, "Envío cancelado.", 0.0, 0))
+                    continue
+                try:
+                    self.quota.consume()
+                except QuotaExceededError as e:
+                    # El resto de la cola tampoco se podrá enviar hoy; sigue pendiente.
+                    self._cancelled.set()
+                    self._stop.set()
+                    self._record(EmailResult(contact_id, email, False, str(e), 0.0, 0))
+                    continue
+                started = time.monotonic()
+                try:
+                    attempts = await enviar_con_reintentos_async(
+                        lambda: send(email, subject, body, attachments), self.retry_policy, self.breaker,
+                        self._stop, self.log, descripcion=f"email a {email}")
+                except Exception as e:
+                    self._record(EmailResult(contact_id, email, False, str(e),
+                                             time.monotonic() - started, getattr(e, 'attempts', 1)))
+                else:
+                    self._record(EmailResult(
+                        contact_id, email, True, None, time.monotonic() - started, attempts))
+        finally:
+            if session[0] is not None:
+                await session[0].close()
@@ -0,0 +1,457 @@
+# benchmark_envios.py
+"""
+Banco de pruebas local para medir el rendimiento de los envíos sin mandar
+correos ni mensajes de WhatsApp reales.
+
+Levanta en este mismo proceso:
+- un servidor SMTP de descarte en 127.0.0.1, que acepta los mensajes sin
+  entregarlos (con latencia y fallos transitorios opcionales);
+- una página estática servida por HTTP que imita el flujo de envío de WhatsApp
+  Web (enlace 'send?phone=...&text=...', compositor, botón de enviar y marca de
+  enviado), sobre la que trabaja el navegador de Selenium.
+
+Los destinatarios son sintéticos y se envían con el mismo CampaignRunner y los
+mismos pipelines que usa la pestaña de mensajes. Al terminar se muestra el
+número de mensajes por segundo, la latencia por etapa y los fallos.
+
+Uso:
+    python benchmark_envios.py --contactos 1000 --canales email
+    python benchmark_envios.py --contactos 200 --canales email,whatsapp --sin-ventana
+"""
+
+import argparse
+import configparser
+import http.server
+import random
+import re
+import socketserver
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from cryptography.fernet import Fernet
+
+from config_handler import CONFIG_FILE
+from progress_reporter import ProgressReporter, format_progress
+from send_pipeline import CampaignRunner, EmailPipeline, WhatsAppPipeline
+from services import ServicesManager
+import webdriver_cache
+
+ASUNTO = "Aviso de multas pendientes - {cedula_rif}"
+CUERPO_EMAIL = ("Estimado/a {nombre_contacto}:\n\nSegún nuestros registros tiene "
+                "{cantidad_multas_pendientes} multa(s) pendiente(s) por {total_adeudado} Bs. "
+                "Expedientes: {expedientes_pendientes}.\n\nAtentamente, INEA.")
+MENSAJE_WHATSAPP = "Hola {nombre_contacto}, tiene {cantidad_multas_pendientes} multa(s) pendiente(s)."
+
+# Emails y teléfonos dentro de los mensajes de error
+DESTINO_RE = re.compile(r"[\w.+-]+@[\w.-]+|\+?\d{7,}")
+
+
+# --- Servidor SMTP de descarte ---
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Habla el SMTP justo para smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, NOOP, RSET y QUIT."""
+
+    def _reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply("220 sar-pm-benchmark ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self._reply("250-sar-pm-benchmark")
+                self._reply("250-AUTH PLAIN")
+                self._reply("250 8BITMIME")
+            elif verb == 'HELO':
+                self._reply("250 sar-pm-benchmark")
+            elif verb == 'AUTH':
+                self._reply("235 2.7.0 Authentication successful")
+            elif verb == 'RCPT':
+                self._reply(sink.rcpt(command))
+            elif verb == 'DATA':
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self._reply(sink.data())
+            elif verb in ('MAIL', 'RSET', 'NOOP'):
+                self._reply("250 OK")
+            elif verb == 'QUIT':
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    # Cola de conexiones amplia: el benchmark abre muchas sesiones a la vez
+    request_queue_size = 256
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    Servidor SMTP local que descarta los mensajes y los cuenta.
+
+    Args:
+        latency (float): Segundos que tarda en aceptar cada mensaje.
+        failure_rate (float): Proporción de destinatarios rechazados con 451
+            (transitorio, se reintenta).
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._server = _SinkServer(("127.0.0.1", 0), _SMTPSinkHandler)
+        self._server.sink = self
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def rcpt(self, command):
+        if "<rechazo" in command:
+            with self._lock:
+                self.rejected += 1
+            return "550 5.1.1 Mailbox unavailable"
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.rejected += 1
+            return "451 4.3.0 Try again later"
+        return "250 OK"
+
+    def data(self):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.received += 1
+        return "250 2.0.0 Queued"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Página que imita WhatsApp Web ---
+
+WHATSAPP_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>WhatsApp (benchmark)</title></head>
+<body>
+<div id="side">Chats (simulado)</div>
+<div id="main"><div id="messages"></div></div>
+<script>
+const ABRIR_MS = __ABRIR_MS__, ENVIO_MS = __ENVIO_MS__;
+
+function abrirChat(url) {
+    const params = new URL(url, location.href).searchParams;
+    const phone = params.get('phone') || '', text = params.get('text') || '';
+    document.getElementById('messages').innerHTML = '';
+    document.querySelectorAll('footer, [data-animate-modal-popup]').forEach(e => e.remove());
+    setTimeout(() => {
+        if (phone.startsWith('0')) {
+            const popup = document.createElement('div');
+            popup.setAttribute('data-animate-modal-popup', 'true');
+            popup.innerText = 'El número de teléfono compartido a través de la dirección URL no es válido.';
+            document.body.appendChild(popup);
+            return;
+        }
+        const footer = document.createElement('footer');
+        const composer = document.createElement('div');
+        composer.setAttribute('contenteditable', 'true');
+        composer.innerText = text;
+        const button = document.createElement('button');
+        button.setAttribute('aria-label', 'Send');
+        button.innerText = 'Enviar';
+        button.onclick = enviar;
+        footer.append(composer, button);
+        document.body.appendChild(footer);
+    }, ABRIR_MS);
+}
+
+function enviar() {
+    const composer = document.querySelector('footer div[contenteditable="true"]');
+    const message = document.createElement('div');
+    message.className = 'message-out';
+    const text = document.createElement('span');
+    text.innerText = composer.innerText;
+    const icon = document.createElement('span');
+    icon.setAttribute('data-icon', 'msg-time');
+    message.append(text, icon);
+    document.getElementById('messages').appendChild(message);
+    composer.innerText = '';
+    setTimeout(() => icon.setAttribute('data-icon', 'msg-check'), ENVIO_MS);
+}
+
+// Como WhatsApp Web, abre los enlaces 'send' dentro de la aplicación.
+document.addEventListener('click', (event) => {
+    const link = event.target.closest('a');
+    if (!link || new URL(link.href).pathname !== '/send') { return; }
+    event.preventDefault();
+    abrirChat(link.href);
+}, true);
+
+if (location.pathname === '/send') { abrirChat(location.href); }
+</script>
+</body></html>
+"""
+
+
+class WhatsAppStandIn:
+    """Sirve la página simulada de WhatsApp Web en 127.0.0.1."""
+
+    def __init__(self, open_delay=0.15, sent_delay=0.3):
+        page = (WHATSAPP_PAGE.replace("__ABRIR_MS__", str(int(open_delay * 1000)))
+                .replace("__ENVIO_MS__", str(int(sent_delay * 1000)))).encode('utf-8')
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Destinatarios sintéticos ---
+
+def destinatarios_sinteticos(n, invalid_rate=0.0, seed=1):
+    """
+    Genera 'n' contactos con el formato de iter_campaign_recipients. Una
+    proporción 'invalid_rate' tiene destinos que el banco de pruebas rechaza
+    (email 'rechazo...' y teléfono que empieza por 0).
+    """
+    rng = random.Random(seed)
+    for i in range(n):
+        invalido = rng.random() < invalid_rate
+        yield {
+            'id': f"V-{i:08d}",
+            'nombre': f"Contacto Sintético {i}",
+            'email': f"{'rechazo' if invalido else 'contacto'}{i}@benchmark.local",
+            'telefono': f"+0{i:010d}" if invalido else f"+58412{i % 10_000_000:07d}",
+        }
+
+
+class _ResumenesSinteticos:
+    """Sustituye a DatabaseManager.get_pending_fine_summaries con datos generados."""
+
+    def get_pending_fine_summaries(self, cedulas):
+        return {cedula: {'cantidad': 2, 'total': 1500.0, 'expedientes': "EXP-1, EXP-2",
+                         'fecha_mas_antigua': None} for cedula in cedulas}
+
+
+# --- Medición ---
+
+def _percentil(valores, q):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * q))]
+
+
+class _Medidor:
+    """Envuelve el callback del runner para guardar la latencia y el error de cada envío."""
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self.latencias = {}
+        self.fallos = {}
+        self.reintentos = {}
+        self.errores = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        with self._lock:
+            self.latencias.setdefault(result.channel, []).append(result.elapsed)
+            self.reintentos[result.channel] = self.reintentos.get(
+                result.channel, 0) + max(0, result.attempts - 1)
+            if not result.ok:
+                self.fallos[result.channel] = self.fallos.get(result.channel, 0) + 1
+                # Sin el destino, para agrupar los errores del mismo tipo
+                error = DESTINO_RE.sub("<destino>", result.error or "")
+                self.errores[f"{result.channel}: {error[:70]}"] += 1
+        self.on_result(result)
+
+    def resumen(self, canal, duracion):
+        latencias = sorted(self.latencias.get(canal, []))
+        total = len(latencias)
+        fallos = self.fallos.get(canal, 0)
+        media = sum(latencias) / total if total else 0.0
+        return (f"{total - fallos} enviados, {fallos} con error, "
+                f"{self.reintentos.get(canal, 0)} reintentos · {total / duracion:.1f} msg/s · "
+                f"latencia media {media:.3f}s, p50 {_percentil(latencias, 0.5):.3f}s, "
+                f"p95 {_percentil(latencias, 0.95):.3f}s, máx {latencias[-1] if latencias else 0:.3f}s")
+
+
+# --- Configuración y ejecución ---
+
+def _configuracion(args, sink, standin, driver_path):
+    """
+    Copia de config.ini apuntando a los servicios locales. Se trabaja solo en
+    memoria: nunca se guarda, para no tocar la configuración real.
+    """
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    for section in ('smtp', 'selenium'):
+        if not config.has_section(section):
+            config.add_section(section)
+    fernet = Fernet(Fernet.generate_key())
+
+    smtp = config['smtp']
+    smtp['server'] = "127.0.0.1"
+    smtp['port'] = str(sink.port if sink else 0)
+    smtp['security'] = 'none'
+    smtp['sender_email'] = "benchmark@sar-pm.local"
+    smtp['password'] = fernet.encrypt(b"benchmark").decode()
+    smtp['backend'] = args.backend
+    smtp['connections'] = str(args.conexiones)
+    smtp['async_connections'] = str(args.conexiones)
+    smtp['max_per_second'] = str(args.email_por_segundo)
+    smtp['max_per_day'] = '0'
+
+    selenium = config['selenium']
+    selenium.setdefault('browser', 'firefox')
+    if args.navegador:
+        selenium['browser'] = args.navegador
+    selenium['whatsapp_base_url'] = standin.url if standin else ''
+    selenium['whatsapp_navigation'] = args.navegacion
+    selenium['inter_message_delay'] = str(args.wa_pausa)
+    selenium['whatsapp_min_delay'] = str(args.wa_pausa)
+    selenium['page_load_timeout'] = '30'
+    selenium['element_wait_time'] = '10'
+    # Perfil temporal ya "vinculado" (la página simulada no pide código QR)
+    selenium['profile_mode'] = 'lean'
+    selenium['automation_profile_dir'] = tempfile.mkdtemp(prefix="sar_pm_benchmark_")
+    selenium['automation_profile_paired'] = 'true'
+    selenium['headless_after_pairing'] = 'true' if args.sin_ventana else 'false'
+    if driver_path:
+        selenium['driver_path'] = driver_path
+    return config, fernet
+
+
+def ejecutar(args):
+    canales = [canal.strip() for canal in args.canales.split(',') if canal.strip()]
+    sink = SMTPSink(args.smtp_latencia, args.smtp_fallos).start() if 'email' in canales else None
+    standin = WhatsAppStandIn(args.wa_abrir, args.wa_confirmar).start() if 'whatsapp' in canales else None
+
+    driver_path = None
+    if standin:
+        # Se resuelve con la configuración real (y su caché) antes de copiarla.
+        real = configparser.ConfigParser()
+        real.read(CONFIG_FILE)
+        browser = (args.navegador or real.get('selenium', 'browser', fallback='firefox')).lower()
+        if real.has_section('selenium'):
+            driver_path, _ = webdriver_cache.resolve_driver_path(real, browser)
+
+    config, fernet = _configuracion(args, sink, standin, driver_path)
+    services = ServicesManager(config, fernet)
+    log = (lambda message, level="info": print(f"\n[{level.upper()}] {message}")) if args.detalle \
+        else (lambda message, level="info": None)
+
+    progreso = ProgressReporter(lambda snapshot: print("\r" + format_progress(snapshot), end="", flush=True),
+                                title="Benchmark", total=args.contactos, unit="contactos", max_rate_hz=2)
+    runner = CampaignRunner(services, _ResumenesSinteticos(), (ASUNTO, CUERPO_EMAIL, MENSAJE_WHATSAPP),
+                            progress=progreso, log=log)
+    medidor = _Medidor(runner.on_result)
+    driver = None
+    try:
+        if 'email' in canales:
+            runner.add_pipeline(EmailPipeline(services, medidor, log=log))
+        if standin:
+            driver = services.whatsapp_session.acquire(log=log)
+            if driver is None:
+                raise RuntimeError("El navegador está desactivado ('browser = none').")
+            runner.add_pipeline(WhatsAppPipeline.from_config(services, driver, medidor, log=log))
+
+        progreso.start()
+        started = time.perf_counter()
+        runner.run(destinatarios_sinteticos(args.contactos, args.invalidos))
+        duracion = time.perf_counter() - started
+        progreso.finish()
+    finally:
+        if driver is not None:
+            services.whatsapp_session.release()
+        services.shutdown()
+        if sink:
+            sink.close()
+        if standin:
+            standin.close()
+
+    total = sum(len(latencias) for latencias in medidor.latencias.values())
+    print()
+    print(f"{args.contactos:,} contactos sintéticos · canales {', '.join(canales)} · "
+          f"{duracion:.2f} s · {total / duracion:.1f} msg/s en total")
+    if 'email' in runner.pipelines:
+        print(f"  Email: {medidor.resumen('email', duracion)}")
+        print(f"    servidor SMTP local: {sink.received} mensajes recibidos, {sink.rejected} destinatarios rechazados")
+    if 'whatsapp' in runner.pipelines:
+        print(f"  WhatsApp: {medidor.resumen('whatsapp', duracion)}")
+        print(f"    etapas: {runner.pipelines['whatsapp'].timings.summary()}")
+    if medidor.errores:
+        print("  Errores más frecuentes:")
+        for error, veces in medidor.errores.most_common(5):
+            print(f"    {veces} × {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mide el rendimiento de los envíos contra servicios locales simulados.")
+    parser.add_argument("--contactos", type=int, default=500, help="Destinatarios sintéticos (500).")
+    parser.add_argument("--canales", default="email", help="'email', 'whatsapp' o 'email,whatsapp' (email).")
+    parser.add_argument("--invalidos", type=float, default=0.02,
+                        help="Proporción de destinos inválidos (0.02).")
+    parser.add_argument("--backend", choices=("threads", "asyncio"), default="threads",
+                        help="Backend de envío de email (threads).")
+    parser.add_argument("--conexiones", type=int, default=4, help="Conexiones SMTP simultáneas (4).")
+    parser.add_argument("--email-por-segundo", type=float, default=0,
+                        help="Límite de emails por segundo; 0 sin límite (0).")
+    parser.add_argument("--smtp-latencia", type=float, default=0.02,
+                        help="Segundos que tarda el servidor en aceptar cada mensaje (0.02).")
+    parser.add_argument("--smtp-fallos", type=float, default=0.0,
+                        help="Proporción de rechazos transitorios 451 (0).")
+    parser.add_argument("--navegador", help="Navegador para WhatsApp (por defecto el de config.ini).")
+    parser.add_argument("--navegacion", choices=("in_app", "url"), default="in_app",
+                        help="Modo de apertura de chats de WhatsApp (in_app).")
+    parser.add_argument("--sin-ventana", action="store_true", help="Navegador sin ventana.")
+    parser.add_argument("--wa-pausa", type=float, default=0.0,
+                        help="Pausa inicial entre mensajes de WhatsApp (0).")
+    parser.add_argument("--wa-abrir", type=float, default=0.15,
+                        help="Segundos que tarda la página simulada en abrir un chat (0.15).")
+    parser.add_argument("--wa-confirmar", type=float, default=0.3,
+                        help="Segundos hasta la marca de enviado en la página simulada (0.3).")
+    parser.add_argument("--detalle", action="store_true", help="Muestra el registro de cada envío.")
+    ejecutar(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# browser_profile.py
+"""
+Módulo con las opciones del navegador que usa Selenium para WhatsApp Web.
+
+Con 'profile_mode = operator' se abre el perfil configurado del operador
+('firefox_profile_path' o 'chrome_user_data_dir'), con sus extensiones,
+imágenes y multimedia, como hasta ahora.
+
+Con 'profile_mode = lean' se usa un perfil dedicado a la automatización
+('automation_profile_dir'), que se crea la primera vez y conserva la sesión de
+WhatsApp entre arranques. En ese perfil se desactivan las imágenes, la
+reproducción automática de multimedia y las extensiones, y se limita la caché
+a 'cache_size_mb'. Si 'headless_after_pairing' está activo, una vez vinculada
+la sesión (escaneado el código QR) el navegador se arranca sin ventana.
+"""
+
+import os
+
+from config_handler import guardar_configuracion
+
+DEFAULT_PROFILE_DIR = "perfil_whatsapp"
+
+
+def lean_mode(config):
+    return config.get('selenium', 'profile_mode', fallback='operator').strip().lower() == 'lean'
+
+
+def profile_dir(config):
+    """Ruta absoluta del perfil de automatización; se crea si no existe."""
+    path = config.get('selenium', 'automation_profile_dir', fallback='').strip() or DEFAULT_PROFILE_DIR
+    path = os.path.abspath(os.path.expanduser(path))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_paired(config):
+    return config.getboolean('selenium', 'automation_profile_paired', fallback=False)
+
+
+def set_paired(config, paired):
+    """Recuerda en config.ini si el perfil de automatización tiene la sesión vinculada."""
+    value = 'true' if paired else 'false'
+    if config.get('selenium', 'automation_profile_paired', fallback='false') == value:
+        return
+    config.set('selenium', 'automation_profile_paired', value)
+    try:
+        guardar_configuracion(config)
+    except OSError:
+        pass
+
+
+def use_headless(config):
+    """Sin ventana solo en modo lean, si se pidió y la sesión ya está vinculada."""
+    return (lean_mode(config) and is_paired(config)
+            and config.getboolean('selenium', 'headless_after_pairing', fallback=False))
+
+
+def _cache_size_mb(config):
+    return max(0, config.getint('selenium', 'cache_size_mb', fallback=50))
+
+
+def apply_firefox(config, options, headless):
+    """Configura 'options' (FirefoxOptions) para el perfil indicado por config."""
+    if not lean_mode(config):
+        if config['selenium'].get('firefox_profile_path'):
+            options.add_argument(
+                f"-profile {config['selenium']['firefox_profile_path']}")
+        return
+    # Con '-profile' Firefox usa la carpeta tal cual (no una copia temporal),
+    # así la sesión de WhatsApp sobrevive a los reinicios.
+    options.add_argument("-profile")
+    options.add_argument(profile_dir(config))
+    cache_kb = _cache_size_mb(config) * 1024
+    prefs = {
+        'permissions.default.image': 2,
+        'media.autoplay.default': 5,
+        'media.autoplay.blocking_policy': 2,
+        'extensions.enabledScopes': 0,
+        'extensions.autoDisableScopes': 15,
+        'browser.cache.disk.smart_size.enabled': False,
+        'browser.cache.disk.capacity': cache_kb,
+        'browser.cache.memory.capacity': min(cache_kb, 32768),
+        'browser.sessionstore.resume_from_crash': False,
+    }
+    for name, value in prefs.items():
+        options.set_preference(name, value)
+    if headless:
+        options.add_argument("-headless")
+
+
+def apply_chrome(config, options, headless):
+    """Configura 'options' (ChromeOptions) para el perfil indicado por config."""
+    if not lean_mode(config):
+        if config['selenium'].get('chrome_user_data_dir'):
+            options.add_argument(
+                f"--user-data-dir={config['selenium']['chrome_user_data_dir']}")
+            options.add_argument(
+                f"--profile-directory={config['selenium'].get('chrome_profile_directory', 'Default')}")
+        return
+    options.add_argument(f"--user-data-dir={profile_dir(config)}")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument("--autoplay-policy=user-gesture-required")
+    options.add_argument("--mute-audio")
+    options.add_argument(f"--disk-cache-size={_cache_size_mb(config) * 1024 * 1024}")
+    options.add_experimental_option(
+        'prefs', {'profile.managed_default_content_settings.images': 2})
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,900")
+
+
+def after_start(driver, browser, headless):
+    """
+    Ajustes tras arrancar. Chrome sin ventana se anuncia como 'HeadlessChrome'
+    y WhatsApp Web lo rechaza, así que se le da el agente de usuario normal.
+    """
+    if not headless or browser == 'firefox':
+        return
+    user_agent = driver.execute_script("return navigator.userAgent;")
+    driver.execute_cdp_cmd('Network.setUserAgentOverride', {
+        'userAgent': user_agent.replace("HeadlessChrome", "Chrome")})
@@ -0,0 +1,283 @@
+# campaign_scheduler.py
+"""
+Módulo con el programador de campañas.
+
+Una campaña programada ya está en la bandeja de salida (outbox) y se envía poco
+a poco, en tramos de 'slot_minutes', en lugar de todo de golpe:
+- solo dentro del horario permitido ('send_window' y 'send_days' de
+  [scheduler]); fuera de él no sale ningún mensaje;
+- sin superar la cuota diaria de cada canal ('[smtp] max_per_day',
+  '[selenium] whatsapp_max_per_day'). Los envíos se cuentan en la BD sobre
+  las últimas 24 horas, como hacen los proveedores (Gmail), así que la cuota
+  se respeta aunque se reinicie la aplicación o envíen varias campañas;
+- repartiendo lo que queda de cuota de forma uniforme hasta el cierre del
+  horario, para no gastarla en una ráfaga al abrir.
+Dentro de cada tramo, los pipelines siguen aplicando sus propios límites de
+ritmo ('max_per_second' del email, pausa adaptativa de WhatsApp).
+
+La programación se guarda en la BD (estado 'programada' y 'programada_desde'
+de la campaña), así que sobrevive a reinicios. Una campaña que quedó
+'enviando' porque el proceso terminó a mitad de un tramo vuelve a
+'programada' cuando lleva 'stale_minutes' sin actividad. La usan la
+aplicación, en un hilo de fondo, y enviar_campana.py --programador.
+"""
+
+import math
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time as dtime, timedelta
+
+from mysql.connector import Error as MySQLError
+
+from send_pipeline import CampaignRunner, EmailPipeline, WhatsAppPipeline
+
+CANCELADO = "Envío cancelado."
+DIAS = ('lun', 'mar', 'mie', 'jue', 'vie', 'sab', 'dom')
+
+
+class SendWindow:
+    """Horario permitido: de 'start' a 'end' (mismo día) en los días 'weekdays' (0 = lunes)."""
+
+    def __init__(self, start=dtime(8, 0), end=dtime(20, 0), weekdays=range(5)):
+        if start >= end:
+            raise ValueError("El horario de envío debe empezar antes de terminar (p. ej. 08:00-20:00).")
+        self.start = start
+        self.end = end
+        self.weekdays = frozenset(weekdays)
+        if not self.weekdays:
+            raise ValueError("El horario de envío necesita al menos un día.")
+
+    @classmethod
+    def from_config(cls, config):
+        """Lee 'send_window' (HH:MM-HH:MM) y 'send_days' (0-6 o lun...dom) de [scheduler]."""
+        ventana = config.get('scheduler', 'send_window', fallback='08:00-20:00')
+        try:
+            inicio, fin = (datetime.strptime(parte.strip(), '%H:%M').time()
+                           for parte in ventana.split('-'))
+        except ValueError:
+            raise ValueError(f"'send_window' inválido: '{ventana}' (formato HH:MM-HH:MM).") from None
+        dias = []
+        for dia in config.get('scheduler', 'send_days', fallback='0,1,2,3,4').split(','):
+            dia = dia.strip().lower()
+            if dia:
+                dias.append(DIAS.index(dia[:3]) if dia[:3] in DIAS else int(dia))
+        return cls(inicio, fin, dias)
+
+    def is_open(self, now):
+        return now.weekday() in self.weekdays and self.start <= now.time() < self.end
+
+    def closes_at(self, now):
+        """Cierre del horario en curso (solo tiene sentido si is_open(now))."""
+        return datetime.combine(now.date(), self.end)
+
+    def next_open(self, now):
+        """Siguiente apertura del horario a partir de 'now' ('now' si ya está abierto)."""
+        if self.is_open(now):
+            return now
+        for dias in range(8):
+            fecha = now.date() + timedelta(days=dias)
+            apertura = datetime.combine(fecha, self.start)
+            if fecha.weekday() in self.weekdays and apertura >= now:
+                return apertura
+        raise AssertionError("Sin días de envío")
+
+    def __str__(self):
+        dias = ",".join(DIAS[dia] for dia in sorted(self.weekdays))
+        return f"{self.start:%H:%M}-{self.end:%H:%M} ({dias})"
+
+
+class CampaignScheduler:
+    """
+    Envía las campañas programadas por tramos, dentro del horario y de las cuotas.
+
+    Uso:
+        programador = CampaignScheduler.from_config(services_manager, db_manager, log)
+        threading.Thread(target=programador.run, daemon=True).start()
+        ...
+        programador.stop()
+    """
+
+    def __init__(self, services_manager, db_manager, window, quotas=None, slot_minutes=15,
+                 stale_minutes=30, log=None):
+        """
+        Args:
+            window (SendWindow): Horario permitido.
+            quotas (dict): {canal: máximo de mensajes en 24 horas}; 0 o ausente = sin cuota.
+            slot_minutes (float): Duración de cada tramo de envío.
+            stale_minutes (int): Minutos sin actividad tras los que una campaña
+                'enviando' se da por abandonada y se vuelve a programar.
+            log (callable, opcional): log(mensaje, nivel), seguro entre hilos.
+        """
+        self.services_manager = services_manager
+        self.db_manager = db_manager
+        self.window = window
+        self.quotas = {canal: limite for canal, limite in (quotas or {}).items() if limite}
+        self.slot = timedelta(minutes=slot_minutes)
+        self.stale_minutes = stale_minutes
+        self.log = log or (lambda message, level="info": print(message))
+        self.enviados = 0
+        self._stop_event = threading.Event()
+        self._runner = None
+        self._runner_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, services_manager, db_manager, log=None):
+        config = services_manager.config
+        return cls(
+            services_manager, db_manager, SendWindow.from_config(config),
+            quotas={'email': config.getint('smtp', 'max_per_day', fallback=0),
+                    'whatsapp': config.getint('selenium', 'whatsapp_max_per_day', fallback=0)},
+            slot_minutes=config.getfloat('scheduler', 'slot_minutes', fallback=15),
+            stale_minutes=config.getint('scheduler', 'stale_minutes', fallback=30),
+            log=log)
+
+    # --- Planificación ---
+
+    def presupuesto(self, canal, now, enviados_24h):
+        """
+        Mensajes de 'canal' que se pueden enviar en el tramo que empieza en 'now':
+        la cuota que queda, repartida de forma uniforme hasta el cierre del
+        horario. None si el canal no tiene cuota.
+        """
+        limite = self.quotas.get(canal)
+        if not limite:
+            return None
+        disponible = max(0, limite - enviados_24h)
+        restante = (self.window.closes_at(now) - now).total_seconds()
+        fraccion = min(1.0, self.slot.total_seconds() / restante) if restante > 0 else 1.0
+        return min(disponible, math.ceil(disponible * fraccion))
+
+    def estimar_fin(self, pendientes, now=None, enviados_24h=None):
+        """
+        Fecha aproximada en que terminaría una campaña con 'pendientes'
+        ({canal: n}) mensajes, teniendo en cuenta horario y cuotas (no el ritmo
+        de cada canal ni otras campañas). Los canales sin cuota terminan en el
+        primer horario disponible.
+
+        Args:
+            enviados_24h (dict, opcional): {canal: n} ya enviados en las últimas
+                24 horas (DatabaseManager.count_sent_since); se descuentan de la
+                cuota del primer día.
+        """
+        now = now or datetime.now()
+        enviados_24h = enviados_24h or {}
+        fin = self.window.next_open(now)
+        for canal, total in pendientes.items():
+            limite = self.quotas.get(canal)
+            if not limite or not total:
+                continue
+            # El primer día queda lo que no se gastó; después, un día por cada 'limite' mensajes
+            resto = max(0, total - max(0, limite - enviados_24h.get(canal, 0)))
+            apertura = self.window.next_open(now)
+            for _ in range(math.ceil(resto / limite)):
+                apertura = self.window.next_open(self.window.closes_at(apertura) + timedelta(seconds=1))
+            fin = max(fin, self.window.closes_at(apertura))
+        return fin
+
+    # --- Ejecución ---
+
+    @contextmanager
+    def _sesion(self, canales):
+        """Runner con un pipeline por canal; reserva WhatsApp Web mientras dura el tramo."""
+        runner = CampaignRunner(self.services_manager, self.db_manager, log=self.log)
+        whatsapp_session = None
+        try:
+            if 'email' in canales:
+                runner.add_pipeline(EmailPipeline(self.services_manager, runner.on_result, log=self.log,
+                                                  db_manager=self.db_manager))
+            if 'whatsapp' in canales:
+                driver = self.services_manager.whatsapp_session.acquire(log=self.log)
+                whatsapp_session = self.services_manager.whatsapp_session
+                if driver is None:
+                    self.log("Programador: WhatsApp no disponible; sus mensajes siguen pendientes.", "warning")
+                else:
+                    runner.add_pipeline(WhatsAppPipeline.from_config(
+                        self.services_manager, driver, runner.on_result, log=self.log))
+            with self._runner_lock:
+                self._runner = runner
+            yield runner
+        finally:
+            with self._runner_lock:
+                self._runner = None
+            if whatsapp_session is not None:
+                whatsapp_session.release()
+
+    def ejecutar_tramo(self, now=None):
+        """
+        Envía la parte que toca de las campañas programadas que ya pueden empezar,
+        de la más antigua a la más nueva, compartiendo el presupuesto del tramo.
+        Devuelve cuántos mensajes se enviaron o intentaron.
+        """
+        now = now or datetime.now()
+        enviados_24h = self.db_manager.count_sent_since(24)
+        presupuestos = {canal: self.presupuesto(canal, now, enviados_24h.get(canal, 0))
+                        for canal in ('email', 'whatsapp')}
+        total = 0
+        for campana in self.db_manager.get_scheduled_campaigns():
+            if self._stop_event.is_set():
+                break
+            canales = [canal for canal in campana['canales'].split(',')
+                       if canal and presupuestos.get(canal) != 0]
+            if not canales or not self.db_manager.claim_scheduled_campaign(campana['id']):
+                continue
+            # Lo que se canceló al cerrar la aplicación en el tramo anterior vuelve a la cola
+            self.db_manager.requeue_failed_outbox(campana['id'], error=CANCELADO)
+            try:
+                with self._sesion(canales) as runner:
+                    runner.drenar(campana['id'], limites=presupuestos, estado_si_quedan='programada')
+                    resumen = runner.summary()['channels']
+            except Exception as e:
+                # P. ej. el navegador no arrancó: se intenta de nuevo en el próximo tramo
+                self.db_manager.set_campaign_status(campana['id'], 'programada')
+                self.log(f"Programador: no se pudo enviar la campaña '{campana['nombre']}' "
+                         f"(#{campana['id']}): {e}", "error")
+                continue
+            for canal, stats in resumen.items():
+                usados = stats['sent'] + stats['failed']
+                total += usados
+                if presupuestos.get(canal) is not None:
+                    presupuestos[canal] = max(0, presupuestos[canal] - usados)
+                if usados:
+                    nombre_canal = "Emails" if canal == "email" else "WhatsApp"
+                    self.log(f"Programador · campaña '{campana['nombre']}' (#{campana['id']}) · "
+                             f"{nombre_canal}: {stats['sent']} enviados, {stats['failed']} con error.")
+        self.enviados += total
+        return total
+
+    def run(self, hasta_terminar=False):
+        """
+        Bucle del programador: un tramo cada 'slot_minutes' mientras el horario
+        está abierto. Con 'hasta_terminar' vuelve cuando no quedan campañas
+        programadas; si no, hasta stop().
+        """
+        self.log(f"Programador de campañas activo · horario {self.window}.")
+        while not self._stop_event.is_set():
+            now = datetime.now()
+            try:
+                # Campañas de un proceso que terminó a mitad de tramo (al arrancar y en cada vuelta)
+                recuperadas = self.db_manager.release_stale_campaigns(self.stale_minutes)
+                if recuperadas:
+                    self.log(f"Programador: {recuperadas} campaña(s) interrumpida(s) vuelven a la cola.",
+                             "warning")
+                if hasta_terminar and not self.db_manager.get_scheduled_campaigns(solo_vencidas=False):
+                    self.log("Programador: no quedan campañas programadas.")
+                    return
+                if not self.window.is_open(now):
+                    # Se revisa cada cierto tiempo por si cambian las campañas o el horario
+                    espera = min(self.window.next_open(now) - now, self.slot)
+                else:
+                    fin_tramo = min(now + self.slot, self.window.closes_at(now))
+                    self.ejecutar_tramo(now)
+                    espera = fin_tramo - datetime.now()
+            except MySQLError as e:
+                self.log(f"Programador: error de BD, se reintenta en el próximo tramo: {e}", "error")
+                espera = self.slot
+            if espera.total_seconds() > 0 and self._stop_event.wait(espera.total_seconds()):
+                return
+
+    def stop(self):
+        """Detiene el bucle; el tramo en curso descarta lo que aún no salió."""
+        self._stop_event.set()
+        with self._runner_lock:
+            if self._runner:
+                self._runner.cancel()
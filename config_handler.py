@@ -11,11 +11,17 @@ Contiene todas las funciones relacionadas con:
 
 import os
 import configparser
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from cryptography.fernet import Fernet
 
 KEY_FILE = "secret.key"
+CONFIG_FILE = "config.ini"
+
+# Serializa las escrituras de config.ini (la ventana de configuración y los
+# hilos que guardan valores en caché, como la ruta del WebDriver).
+_config_write_lock = threading.Lock()
 
 
 def generate_key():
@@ -88,6 +94,18 @@ def leer_configuracion():
         return None
 
 
+def guardar_configuracion(config):
+    """
+    Escribe la configuración en config.ini. Se escribe primero en un archivo
+    temporal y luego se reemplaza, para no dejar un config.ini a medias.
+    """
+    temp_path = CONFIG_FILE + ".tmp"
+    with _config_write_lock:
+        with open(temp_path, 'w', encoding='utf-8') as configfile:
+            config.write(configfile)
+        os.replace(temp_path, CONFIG_FILE)
+
+
 def crear_config_inicial(fernet):
     """
     Crea un archivo config.ini con valores de ejemplo y contraseñas cifradas.
@@ -101,27 +119,92 @@ def crear_config_inicial(fernet):
         'host': 'localhost',
         'user': 'root',
         'password': encrypt_value(fernet, 'tu_clave_mysql'),
-        'database': 'automatizacion_db'
+        'database': 'automatizacion_db',
+        'connect_timeout': '5',
+        'connect_retry_max_delay': '60'
     }
     sample_config['smtp'] = {
         'server': 'smtp.gmail.com',
         'port': '465',
         'sender_email': 'tu_email@gmail.com',
-        'password': encrypt_value(fernet, 'tu_clave_de_app')
+        'password': encrypt_value(fernet, 'tu_clave_de_app'),
+        'security': 'ssl',
+        'max_messages_per_connection': '100',
+        'keepalive_interval': '60',
+        'timeout': '30',
+        'connections': '4',
+        'backend': 'threads',
+        'async_connections': '20',
+        'max_per_second': '5',
+        'max_per_day': '0',
+        'retry_max_attempts': '3',
+        'retry_base_delay': '2',
+        'retry_max_delay': '60',
+        'breaker_failure_rate': '0.5',
+        'breaker_window': '20',
+        'breaker_min_calls': '5',
+        'breaker_cooldown': '120'
     }
     sample_config['selenium'] = {
         'browser': 'firefox',
         'browser_binary_location': '',
         'firefox_profile_path': '',
+        'profile_mode': 'operator',
+        'automation_profile_dir': 'perfil_whatsapp',
+        'automation_profile_paired': 'false',
+        'cache_size_mb': '50',
+        'headless_after_pairing': 'false',
+        'pairing_timeout': '120',
         'implicit_wait_time': '10',
         'page_load_timeout': '30',
         'element_wait_time': '20',
-        'inter_message_delay': '3'
+        'inter_message_delay': '3',
+        'whatsapp_base_url': 'https://web.whatsapp.com/',
+        'whatsapp_navigation': 'in_app',
+        'whatsapp_in_app_timeout': '5',
+        'whatsapp_sent_timeout': '15',
+        'whatsapp_min_delay': '1',
+        'whatsapp_max_delay': '20',
+        'whatsapp_max_per_day': '0',
+        'driver_path': '',
+        'driver_cache_path': '',
+        'driver_cache_version': '',
+        'driver_cache_browser': '',
+        'retry_max_attempts': '2',
+        'retry_base_delay': '5',
+        'retry_max_delay': '60',
+        'breaker_failure_rate': '0.6',
+        'breaker_window': '10',
+        'breaker_min_calls': '5',
+        'breaker_cooldown': '300'
     }
     sample_config['login'] = {
         'user': 'admin',
         'password': encrypt_value(fernet, 'admin')
     }
+    sample_config['app'] = {
+        'console_max_lines': '1000',
+        'log_file': 'sar_pm.log',
+        'log_max_bytes': '1000000',
+        'log_backup_count': '3'
+    }
+    sample_config['scheduler'] = {
+        'enabled': 'true',
+        'send_window': '08:00-20:00',
+        'send_days': 'lun,mar,mie,jue,vie',
+        'slot_minutes': '15',
+        'stale_minutes': '30'
+    }
+    sample_config['history'] = {
+        'dedup_days': '0'
+    }
+    sample_config['pdf'] = {
+        'statement_dir': 'estados_cuenta',
+        'statement_workers': '0',
+        'report_rows_per_volume': '50000',
+        'report_cache_dir': 'reportes_cache',
+        'report_cache_mb': '200'
+    }
     sample_config['test_recipient'] = {
         'email': 'tu_email_de_prueba@ejemplo.com',
         'telefono': '+1234567890'
@@ -6,6 +6,7 @@ import re
 import phonenumbers
 from mysql.connector import IntegrityError, Error as MySQLError
 import ui_constants as const
+from db_manager import IMPORT_CHUNK_SIZE
 
 
 class ContactosTab(ttk.Frame):
@@ -118,6 +119,8 @@ class ContactosTab(ttk.Frame):
                   command=self.delete_selected_contact).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame_contactos, text="Actualizar", **const.BUTTON_STYLE,
                   command=self._cargar_contactos_thread).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame_contactos, text="Historial de Envíos", **const.BUTTON_STYLE,
+                  command=self.ver_historial_envios).pack(side=tk.LEFT, padx=5)
 
         ie_frame_contactos = ttk.Frame(contact_management_frame)
         ie_frame_contactos.pack(pady=5)
@@ -216,6 +219,11 @@ class ContactosTab(ttk.Frame):
                 "Operación cancelada: sin conexión a la BD.", "error")
             return
 
+        threading.Thread(target=self._import_contacts_task,
+                         args=(filepath,), daemon=True).start()
+
+    def _import_contacts_task(self, filepath):
+        """Lee el CSV e inserta los contactos por lotes, informando el avance."""
         try:
             with open(filepath, mode='r', newline='', encoding='utf-8-sig') as csvfile:
                 reader = csv.DictReader(csvfile)
@@ -231,22 +239,30 @@ class ContactosTab(ttk.Frame):
                             (cedula_rif, nombre, email, telefono, direccion))
 
             if not contacts_to_add:
-                messagebox.showwarning(
-                    "Importar CSV", "No se encontraron contactos válidos en el archivo.", parent=self.controller.root)
+                self.controller.root.after(0, lambda: messagebox.showwarning(
+                    "Importar CSV", "No se encontraron contactos válidos en el archivo.", parent=self.controller.root))
                 return
 
-            inserted_count = self.controller.db_manager.import_contacts_from_list(
-                contacts_to_add)
-
-            messagebox.showinfo(
+            progreso = self.controller.create_progress_reporter(
+                "Importación de contactos", total=len(contacts_to_add)).start()
+            try:
+                # Una sola transacción: si falla, no queda ningún contacto importado
+                inserted_count = self.controller.db_manager.import_contacts_from_list(
+                    contacts_to_add, progress=progreso)
+            except Exception:
+                progreso.finish("Error")
+                raise
+            progreso.finish()
+
+            self.controller.root.after(0, lambda: messagebox.showinfo(
                 "Importación Exitosa",
                 f"Se han importado {inserted_count} nuevos contactos.\nSe ignoraron {len(contacts_to_add) - inserted_count} duplicados.",
                 parent=self.controller.root
-            )
-            self._cargar_contactos_thread()
+            ))
+            self.controller.root.after(0, self._cargar_contactos_thread)
         except Exception as e:
-            messagebox.showerror("Error de Importación",
-                                 f"Ocurrió un error: {e}", parent=self.controller.root)
+            self.controller.root.after(0, lambda err=e: messagebox.showerror(
+                "Error de Importación", f"Ocurrió un error: {err}", parent=self.controller.root))
 
     def export_to_csv(self):
         if not self.controller.db_manager:
@@ -264,21 +280,35 @@ class ContactosTab(ttk.Frame):
         if not filepath:
             return
 
+        threading.Thread(target=self._export_contacts_task,
+                         args=(filepath,), daemon=True).start()
+
+    def _export_contacts_task(self, filepath):
+        """Escribe todos los contactos en el CSV por lotes, informando el avance."""
+        progreso = None
         try:
             contacts = self.controller.db_manager.get_all_contacts_for_export()
+            progreso = self.controller.create_progress_reporter(
+                "Exportación de contactos", total=len(contacts)).start()
 
             with open(filepath, mode='w', newline='', encoding='utf-8-sig') as csvfile:
                 fieldnames = ['cedula_rif', 'nombre',
                               'email', 'telefono', 'direccion']
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
-                writer.writerows(contacts)
-
-            messagebox.showinfo(
-                "Exportación Exitosa", f"Se han exportado {len(contacts)} contactos.", parent=self.controller.root)
+                for start in range(0, len(contacts), IMPORT_CHUNK_SIZE):
+                    lote = contacts[start:start + IMPORT_CHUNK_SIZE]
+                    writer.writerows(lote)
+                    progreso.advance(len(lote))
+            progreso.finish()
+
+            self.controller.root.after(0, lambda: messagebox.showinfo(
+                "Exportación Exitosa", f"Se han exportado {len(contacts)} contactos.", parent=self.controller.root))
         except Exception as e:
-            messagebox.showerror("Error de Exportación",
-                                 f"Ocurrió un error: {e}", parent=self.controller.root)
+            if progreso:
+                progreso.finish("Error")
+            self.controller.root.after(0, lambda err=e: messagebox.showerror(
+                "Error de Exportación", f"Ocurrió un error: {err}", parent=self.controller.root))
 
     def on_tree_click(self, event):
         region = self.tree.identify_region(event.x, event.y)
@@ -594,6 +624,56 @@ class ContactosTab(ttk.Frame):
             self.controller.root.after(0, lambda: self.controller.log_to_console(
                 f"Error al eliminar contactos: {e}", "error"))
 
+    def ver_historial_envios(self):
+        selected_items = self.tree.selection()
+        if len(selected_items) != 1:
+            messagebox.showwarning(
+                "Advertencia", "Selecciona un contacto para ver su historial de envíos.", parent=self.controller.root)
+            return
+        if not self.controller.db_manager:
+            return
+        values = self.tree.item(selected_items[0], 'values')
+        threading.Thread(target=self._cargar_historial_task,
+                         args=(values[1], values[2]), daemon=True).start()
+
+    def _cargar_historial_task(self, cedula_rif, nombre):
+        try:
+            envios = self.controller.db_manager.get_send_history(cedula_rif)
+            self.controller.root.after(
+                0, self._mostrar_historial, cedula_rif, nombre, envios)
+        except MySQLError as e:
+            self.controller.root.after(0, lambda err=e: self.controller.log_to_console(
+                f"Error al cargar el historial de envíos: {err}", "error"))
+
+    def _mostrar_historial(self, cedula_rif, nombre, envios):
+        """Muestra los envíos a un contacto, del más reciente al más antiguo."""
+        window = tk.Toplevel(self.controller.root)
+        window.title(f"Historial de Envíos: {nombre} ({cedula_rif})")
+        window.geometry("900x400")
+        window.transient(self.controller.root)
+        self.controller._center_toplevel(window)
+
+        columns = ('Fecha', 'Canal', 'Mensaje', 'Campaña', 'Destino', 'Resultado')
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for column, width in zip(columns, (130, 80, 150, 180, 160, 200)):
+            tree.heading(column, text=column)
+            tree.column(column, width=width, anchor='w')
+        vsb = ttk.Scrollbar(window, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=vsb.set)
+        vsb.pack(side='right', fill='y')
+        tree.pack(side='left', fill='both', expand=True)
+
+        for envio in envios:
+            campana = envio['campana'] or (f"#{envio['campana_id']} (eliminada)"
+                                           if envio['campana_id'] else "-")
+            resultado = "Enviado" if envio['exito'] else f"Error: {envio['error'] or ''}"
+            tree.insert('', tk.END, values=(
+                envio['enviado_en'].strftime('%Y-%m-%d %H:%M'),
+                "Email" if envio['canal'] == 'email' else "WhatsApp",
+                envio['plantilla'] or "-", campana, envio['destino'], resultado))
+        if not envios:
+            tree.insert('', tk.END, values=("", "", "Sin envíos registrados.", "", "", ""))
+
     def get_selected_contacts(self):
         """
         Devuelve una lista de diccionarios de los contactos seleccionados (checkbox marcado).
@@ -616,3 +696,10 @@ class ContactosTab(ttk.Frame):
             contacts_to_send.append(contact_dict)
 
         return contacts_to_send
+
+    def get_recipient_filters(self):
+        """
+        Devuelve los filtros de la búsqueda activa, para que una campaña pueda
+        resolver en la BD todos los contactos que coinciden (no solo la página visible).
+        """
+        return {'search_term': self.search_term}
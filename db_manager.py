@@ -7,10 +7,17 @@ La aplicación principal no ejecutará consultas SQL directamente, sino que llam
 a los métodos de esta clase.
 """
 
+import json
+import uuid
+
 import mysql.connector
 from mysql.connector import pooling, Error
 from config_handler import decrypt_value
 
+# Filas por executemany al importar (y por escritura al exportar a CSV), para
+# informar el avance; la importación completa sigue siendo una sola transacción
+IMPORT_CHUNK_SIZE = 1000
+
 
 class DatabaseManager:
     """
@@ -38,7 +45,10 @@ class DatabaseManager:
                 host=config['mysql']['host'],
                 user=config['mysql']['user'],
                 password=db_password,  # <--- Usamos la contraseña descifrada
-                database=config['mysql']['database']
+                database=config['mysql']['database'],
+                # Sin esto, un host caído bloquea hasta el timeout del sistema operativo
+                connection_timeout=config.getint(
+                    'mysql', 'connect_timeout', fallback=5)
             )
             print("Pool de conexiones a MySQL creado exitosamente.")
         except Error as e:
@@ -55,7 +65,8 @@ class DatabaseManager:
 
     def init_db(self):
         """
-        Crea las tablas 'contactos', 'multas' y 'mensajes' si no existen.
+        Crea las tablas 'contactos', 'multas', 'mensajes', 'campanas', 'outbox',
+        'historial_envios' y 'versiones_datos' si no existen.
         """
         # Sentencias SQL para crear cada tabla
         contactos_sql = """
@@ -76,6 +87,7 @@ class DatabaseManager:
                 fecha_multa DATE,
                 fecha_pago DATE DEFAULT NULL,
                 multa_pendiente BOOLEAN DEFAULT TRUE,
+                INDEX idx_multas_fecha (fecha_multa),
                 FOREIGN KEY (cedula_rif) REFERENCES contactos(cedula_rif) ON DELETE CASCADE
             )
         """
@@ -88,15 +100,181 @@ class DatabaseManager:
                 mensaje_whatsapp TEXT
             )
         """
+        campanas_sql = """
+            CREATE TABLE IF NOT EXISTS campanas (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                nombre VARCHAR(255) NOT NULL,
+                canales VARCHAR(50) NOT NULL,
+                estado ENUM('preparando', 'enviando', 'pausada', 'completada', 'programada')
+                    NOT NULL DEFAULT 'preparando',
+                programada_desde DATETIME DEFAULT NULL,
+                plantilla VARCHAR(255) DEFAULT NULL,
+                filtros TEXT,
+                asunto_email TEXT,
+                cuerpo_email TEXT,
+                mensaje_whatsapp TEXT,
+                adjuntar_estado BOOLEAN NOT NULL DEFAULT FALSE,
+                creada_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+                actualizada_en DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_campanas_estado (estado)
+            )
+        """
+        # Un mensaje ya personalizado por destinatario y canal. La clave única sobre
+        # (campana_id, canal, contenido_hash) hace que volver a encolar sea idempotente
+        # y el índice (campana_id, estado, id) sirve para drenar y para las estadísticas.
+        outbox_sql = """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                campana_id INT NOT NULL,
+                cedula_rif VARCHAR(20) DEFAULT NULL,
+                canal ENUM('email', 'whatsapp') NOT NULL,
+                destino VARCHAR(255) NOT NULL,
+                asunto TEXT,
+                cuerpo TEXT,
+                adjunto VARCHAR(500) DEFAULT NULL,
+                contenido_hash CHAR(64) NOT NULL,
+                estado ENUM('pendiente', 'enviado', 'fallido') NOT NULL DEFAULT 'pendiente',
+                intentos SMALLINT NOT NULL DEFAULT 0,
+                ultimo_error TEXT,
+                creado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+                actualizado_en DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                enviado_en DATETIME DEFAULT NULL,
+                UNIQUE KEY uq_outbox_mensaje (campana_id, canal, contenido_hash),
+                INDEX idx_outbox_estado (campana_id, estado, id),
+                INDEX idx_outbox_enviado (enviado_en),
+                INDEX idx_outbox_contacto (campana_id, cedula_rif),
+                FOREIGN KEY (campana_id) REFERENCES campanas(id) ON DELETE CASCADE
+            )
+        """
+        # Un contador por tabla que se incrementa en cada cambio hecho desde la
+        # aplicación; la caché de reportes (report_cache.py) lo usa como versión.
+        # La 'epoca' cambia al restaurar un backup, que devuelve el contador a un
+        # valor que otros equipos pueden tener ya en su caché.
+        versiones_sql = """
+            CREATE TABLE IF NOT EXISTS versiones_datos (
+                tabla VARCHAR(50) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0,
+                epoca CHAR(32) NOT NULL DEFAULT ''
+            )
+        """
+        # Un registro por envío intentado. Sin claves foráneas: el historial se conserva
+        # aunque se borre el contacto o la campaña. El índice (cedula_rif, enviado_en,
+        # exito, canal) cubre tanto el historial de un contacto como la exclusión de contactados
+        # recientemente (_build_campaign_filter).
+        historial_sql = """
+            CREATE TABLE IF NOT EXISTS historial_envios (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                cedula_rif VARCHAR(20) NOT NULL,
+                canal ENUM('email', 'whatsapp') NOT NULL,
+                plantilla VARCHAR(255) DEFAULT NULL,
+                campana_id INT DEFAULT NULL,
+                destino VARCHAR(255) NOT NULL,
+                exito BOOLEAN NOT NULL,
+                error TEXT,
+                enviado_en DATETIME NOT NULL,
+                INDEX idx_historial_contacto (cedula_rif, enviado_en, exito, canal)
+            )
+        """
 
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(contactos_sql)
             cursor.execute(multas_sql)
             cursor.execute(mensajes_sql)
+            cursor.execute(campanas_sql)
+            cursor.execute(outbox_sql)
+            cursor.execute(historial_sql)
+            cursor.execute(versiones_sql)
+            # Bandejas de salida creadas antes de los estados de cuenta adjuntos
+            self._add_column_if_missing(
+                cursor, 'outbox', 'adjunto', "VARCHAR(500) DEFAULT NULL AFTER cuerpo")
+            # ... y antes del programador de campañas
+            cursor.execute(
+                "SELECT COLUMN_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'campanas' AND COLUMN_NAME = 'estado'")
+            if "'programada'" not in cursor.fetchone()[0]:
+                cursor.execute(
+                    "ALTER TABLE campanas MODIFY estado ENUM('preparando', 'enviando', 'pausada', "
+                    "'completada', 'programada') NOT NULL DEFAULT 'preparando'")
+            self._add_column_if_missing(
+                cursor, 'campanas', 'programada_desde', "DATETIME DEFAULT NULL AFTER estado")
+            # ... y antes del historial de envíos
+            self._add_column_if_missing(
+                cursor, 'campanas', 'plantilla', "VARCHAR(255) DEFAULT NULL AFTER programada_desde")
+            self._add_index_if_missing(cursor, 'outbox', 'idx_outbox_enviado', "enviado_en")
+            # ... y antes de los reportes por lotes (iter_fines_for_report)
+            self._add_index_if_missing(cursor, 'multas', 'idx_multas_fecha', "fecha_multa")
+            # ... y antes de guardar cómo se preparó cada campaña (para terminar de encolarla)
+            for column, definition in (('filtros', "TEXT AFTER plantilla"),
+                                       ('asunto_email', "TEXT AFTER filtros"),
+                                       ('cuerpo_email', "TEXT AFTER asunto_email"),
+                                       ('mensaje_whatsapp', "TEXT AFTER cuerpo_email"),
+                                       ('adjuntar_estado',
+                                        "BOOLEAN NOT NULL DEFAULT FALSE AFTER mensaje_whatsapp")):
+                self._add_column_if_missing(cursor, 'campanas', column, definition)
+            self._add_index_if_missing(cursor, 'outbox', 'idx_outbox_contacto', "campana_id, cedula_rif")
+            # ... y antes de la época de las versiones de datos
+            self._add_column_if_missing(
+                cursor, 'versiones_datos', 'epoca', "CHAR(32) NOT NULL DEFAULT '' AFTER version")
         db.close()
         print("Tablas de la BD verificadas/creadas.")
 
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    def _add_index_if_missing(self, cursor, table, index, columns):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            (table, index))
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+    def _bump_data_version(self, cursor, tabla='multas'):
+        """Incrementa la versión de los datos de 'tabla', dentro de la transacción en curso."""
+        cursor.execute(
+            "INSERT INTO versiones_datos (tabla, version) VALUES (%s, 1) "
+            "ON DUPLICATE KEY UPDATE version = version + 1", (tabla,))
+
+    def get_data_version(self, tabla='multas'):
+        """
+        Versión de los datos de 'tabla' ('época:contador'): cambia con cada alta,
+        modificación o baja hecha desde la aplicación y al restaurar un backup
+        (renew_data_epoch). Los cambios de contactos también cuentan para
+        'multas', porque los reportes muestran sus nombres y borrarlos borra sus multas.
+        """
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute("SELECT epoca, version FROM versiones_datos WHERE tabla = %s", (tabla,))
+            fila = cursor.fetchone()
+        db.close()
+        return f"{fila[0]}:{fila[1]}" if fila else ":0"
+
+    def renew_data_epoch(self, tablas=('multas',)):
+        """
+        Cambia la época de las versiones de datos tras restaurar un backup: el
+        contador vuelve al valor del backup, y sin una época nueva los demás
+        equipos que comparten la BD servirían reportes de su caché que ya no
+        corresponden a los datos.
+        """
+        epoca = uuid.uuid4().hex
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            # Un backup anterior a la columna la elimina al recrear la tabla
+            self._add_column_if_missing(
+                cursor, 'versiones_datos', 'epoca', "CHAR(32) NOT NULL DEFAULT '' AFTER version")
+            cursor.execute("UPDATE versiones_datos SET epoca = %s", (epoca,))
+            cursor.executemany(
+                "INSERT INTO versiones_datos (tabla, version, epoca) VALUES (%s, 0, %s) "
+                "ON DUPLICATE KEY UPDATE epoca = VALUES(epoca)", [(tabla, epoca) for tabla in tablas])
+            db.commit()
+        db.close()
+
     # --- Métodos para Contactos ---
 
     def get_contacts(self, search_term, page, per_page):
@@ -149,6 +327,7 @@ class DatabaseManager:
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(query, params)
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -161,6 +340,7 @@ class DatabaseManager:
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(query, tuple(cedulas_list))
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -176,19 +356,19 @@ class DatabaseManager:
         db.close()
         return contacts
 
-    def import_contacts_from_list(self, contacts_to_add):
+    def import_contacts_from_list(self, contacts_to_add, progress=None):
         """
         Importa una lista de contactos. Ignora duplicados.
         Devuelve el número de filas insertadas.
+
+        Las filas se envían en lotes de IMPORT_CHUNK_SIZE dentro de una sola
+        transacción: si un lote falla, no queda ningún contacto importado.
+
+        Args:
+            progress (ProgressReporter, opcional): Recibe el avance por lote.
         """
-        db = self._get_connection()
-        with db.cursor() as cursor:
-            query = "INSERT IGNORE INTO contactos (cedula_rif, nombre, email, telefono, direccion) VALUES (%s, %s, %s, %s, %s)"
-            cursor.executemany(query, contacts_to_add)
-            db.commit()
-            rowcount = cursor.rowcount
-        db.close()
-        return rowcount
+        query = "INSERT IGNORE INTO contactos (cedula_rif, nombre, email, telefono, direccion) VALUES (%s, %s, %s, %s, %s)"
+        return self._import_in_one_transaction(query, contacts_to_add, progress)
 
     # --- Métodos para Multas ---
 
@@ -222,49 +402,152 @@ class DatabaseManager:
         db.close()
         return multas
 
-    # En db_manager.py, dentro de la clase DatabaseManager
-
-    def get_fines_for_report(self, start_date=None, end_date=None, status='all', cedula_rif=None):
+    def _build_report_filter(self, start_date=None, end_date=None, status='all', cedula_rif=None):
         """
-        Obtiene una lista de multas para un reporte, basado en filtros avanzados.
+        Construye la cláusula WHERE de los reportes de multas.
 
         Args:
             start_date (str, opcional): Fecha de inicio en formato 'YYYY-MM-DD'.
             end_date (str, opcional): Fecha de fin en formato 'YYYY-MM-DD'.
-            status (str, opcional): 'all', 'paid', or 'pending'.
+            status (str, opcional): 'all', 'pagada' o 'pendiente'.
             cedula_rif (str, opcional): Cédula o RIF específico del contacto.
 
         Returns:
-            list: Una lista de diccionarios, donde cada uno es una multa.
+            tuple: (cláusula SQL que empieza por ' AND ...' o vacía, lista de parámetros).
         """
-        query = "SELECT * FROM multas WHERE 1=1"
+        where = ""
         params = []
 
         if start_date:
-            query += " AND fecha_multa >= %s"
+            where += " AND fecha_multa >= %s"
             params.append(start_date)
 
         if end_date:
-            query += " AND fecha_multa <= %s"
+            where += " AND fecha_multa <= %s"
             params.append(end_date)
 
         if status == 'pagada':
-            query += " AND multa_pendiente = FALSE"
+            where += " AND multa_pendiente = FALSE"
         elif status == 'pendiente':
-            query += " AND multa_pendiente = TRUE"
+            where += " AND multa_pendiente = TRUE"
 
         if cedula_rif and cedula_rif.strip():
-            query += " AND cedula_rif = %s"
+            where += " AND cedula_rif = %s"
             params.append(cedula_rif.strip())
 
-        query += " ORDER BY fecha_multa DESC"
+        return where, params
+
+    def iter_fines_for_report(self, start_date=None, end_date=None, status='all', cedula_rif=None,
+                              chunk_size=2000):
+        """
+        Recorre las multas de un reporte (filtros de _build_report_filter) en
+        lotes: de la fecha más reciente a la más antigua y, con la misma fecha,
+        por expediente descendente; las que no tienen fecha van al final.
+
+        Como iter_campaign_recipients, pagina por clave (fecha_multa, expediente_nro)
+        en lugar de OFFSET, sobre idx_multas_fecha, y cada lote usa su propia conexión
+        del pool; así el reporte no retiene una conexión mientras dibuja las páginas.
+
+        Yields:
+            list: Lotes de diccionarios de multas.
+        """
+        where, params = self._build_report_filter(start_date, end_date, status, cedula_rif)
+        con_fecha = (f"SELECT * FROM multas WHERE fecha_multa IS NOT NULL{where} {{despues}}"
+                     "ORDER BY fecha_multa DESC, expediente_nro DESC LIMIT %s")
+        sin_fecha = (f"SELECT * FROM multas WHERE fecha_multa IS NULL{where} {{despues}}"
+                     "ORDER BY expediente_nro DESC LIMIT %s")
+        ultima = None
+        for query in (con_fecha, sin_fecha):
+            while True:
+                if ultima is None:
+                    sql, extra = query.format(despues=""), []
+                elif ultima['fecha_multa'] is not None:
+                    sql = query.format(despues="AND (fecha_multa < %s OR (fecha_multa = %s AND expediente_nro < %s)) ")
+                    extra = [ultima['fecha_multa'], ultima['fecha_multa'], ultima['expediente_nro']]
+                else:
+                    sql, extra = query.format(despues="AND expediente_nro < %s "), [ultima['expediente_nro']]
+                db = self._get_connection()
+                with db.cursor(dictionary=True) as cursor:
+                    cursor.execute(sql, tuple(params + extra + [chunk_size]))
+                    lote = cursor.fetchall()
+                db.close()
+
+                if lote:
+                    yield lote
+                if len(lote) < chunk_size:
+                    break
+                ultima = lote[-1]
+            # Las multas sin fecha se recorren desde el principio
+            ultima = None
+
+    def get_fines_summary(self, agrupar, start_date=None, end_date=None, status='all', cedula_rif=None):
+        """
+        Totales de las multas de un reporte agrupados en la BD (GROUP BY ... WITH
+        ROLLUP), sin leer las filas de detalle. Mismos filtros que iter_fines_for_report.
+
+        Args:
+            agrupar (str): 'estado' (clave: 1 pendiente, 0 pagada), 'mes' (clave
+                AAAAMM, 0 sin fecha), 'contacto' (cédula/RIF, con 'nombre'),
+                'descripcion' (el texto del expediente tras el primer espacio, como en
+                get_fine_descriptions; '' sin descripción) o 'uc' (clave: U/C, -1 sin U/C).
+
+        Returns:
+            tuple: (grupos, total). Cada grupo y el total son diccionarios con 'clave',
+                'multas', 'pagadas', 'pendientes', 'bs_pagado', 'bs_pendiente' y
+                'bs_total'. Los grupos van ordenados por clave (los contactos, por
+                monto pendiente de mayor a menor); 'total' es la fila del ROLLUP.
+        """
+        expresiones = {
+            'estado': "COALESCE(multa_pendiente, TRUE)",
+            'mes': "COALESCE(YEAR(fecha_multa) * 100 + MONTH(fecha_multa), 0)",
+            'contacto': "cedula_rif",
+            'descripcion': ("CASE WHEN LOCATE(' ', expediente_nro) > 0 "
+                            "THEN SUBSTRING(expediente_nro, LOCATE(' ', expediente_nro) + 1) ELSE '' END"),
+            'uc': "COALESCE(uc, -1)",
+        }
+        if agrupar not in expresiones:
+            raise ValueError(f"Agrupación de reporte desconocida: '{agrupar}'.")
+        where, params = self._build_report_filter(start_date, end_date, status, cedula_rif)
+        query = f"""
+            SELECT {expresiones[agrupar]} AS clave,
+                   COUNT(*) AS multas,
+                   SUM(multa_pendiente = FALSE) AS pagadas,
+                   SUM(multa_pendiente = TRUE) AS pendientes,
+                   SUM(CASE WHEN multa_pendiente THEN 0 ELSE COALESCE(bs, 0) END) AS bs_pagado,
+                   SUM(CASE WHEN multa_pendiente THEN COALESCE(bs, 0) ELSE 0 END) AS bs_pendiente,
+                   SUM(COALESCE(bs, 0)) AS bs_total
+            FROM multas WHERE 1=1{where}
+            GROUP BY clave WITH ROLLUP
+        """
+        if agrupar == 'contacto':
+            # El nombre se une después de agrupar: contactos no entra en el GROUP BY
+            query = (f"SELECT r.*, c.nombre FROM ({query}) r "
+                     "LEFT JOIN contactos c ON c.cedula_rif = r.clave")
 
         db = self._get_connection()
         with db.cursor(dictionary=True) as cursor:
             cursor.execute(query, tuple(params))
-            multas = cursor.fetchall()
+            filas = cursor.fetchall()
         db.close()
-        return multas
+
+        grupos = []
+        total = None
+        for fila in filas:
+            for campo in ('multas', 'pagadas', 'pendientes'):
+                fila[campo] = int(fila[campo] or 0)
+            if fila['clave'] is None:
+                total = fila
+            else:
+                grupos.append(fila)
+        if agrupar == 'contacto':
+            grupos.sort(key=lambda fila: (-fila['bs_pendiente'], fila['clave']))
+        else:
+            grupos.sort(key=lambda fila: fila['clave'])
+        if total is None:
+            # Sin multas, el ROLLUP no devuelve filas
+            total = {'clave': None, 'multas': 0, 'pagadas': 0, 'pendientes': 0,
+                     'bs_pagado': 0, 'bs_pendiente': 0, 'bs_total': 0}
+        return grupos, total
 
     def add_fine(self, expediente, cedula, uc, fecha_multa, es_pagada, monto_bs, fecha_pago):
         """
@@ -285,6 +568,7 @@ class DatabaseManager:
                     f"El contacto con Cédula/RIF '{cedula}' no existe.")
 
             cursor.execute(query, params)
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -294,6 +578,7 @@ class DatabaseManager:
         with db.cursor() as cursor:
             query = "UPDATE multas SET uc = %s, fecha_multa = %s WHERE expediente_nro = %s"
             cursor.execute(query, (uc, fecha, expediente))
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -305,6 +590,7 @@ class DatabaseManager:
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(query, (monto, fecha, expediente))
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -316,6 +602,7 @@ class DatabaseManager:
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(query, (expediente,))
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -328,6 +615,7 @@ class DatabaseManager:
         db = self._get_connection()
         with db.cursor() as cursor:
             cursor.execute(query, tuple(expedientes_list))
+            self._bump_data_version(cursor)
             db.commit()
         db.close()
 
@@ -351,27 +639,17 @@ class DatabaseManager:
 
     def get_preset_messages(self):
         """
-        Obtiene todos los mensajes predefinidos de la base de datos.
+        Obtiene todos los mensajes predefinidos de la base de datos, con sus textos,
+        para que la interfaz pueda cambiar de mensaje sin volver a consultar.
         """
         db = self._get_connection()
         with db.cursor(dictionary=True) as cursor:
-            cursor.execute("SELECT id, nombre FROM mensajes ORDER BY nombre")
+            cursor.execute(
+                "SELECT id, nombre, asunto_email, cuerpo_email, mensaje_whatsapp FROM mensajes ORDER BY nombre")
             messages = cursor.fetchall()
         db.close()
         return messages
 
-    def get_message_details(self, message_id):
-        """
-        Obtiene los detalles completos de un mensaje predefinido por su ID.
-        """
-        db = self._get_connection()
-        with db.cursor(dictionary=True) as cursor:
-            cursor.execute(
-                "SELECT * FROM mensajes WHERE id = %s", (message_id,))
-            message = cursor.fetchone()
-        db.close()
-        return message
-
     def save_message(self, name, subject, email_body, whatsapp_msg):
         """
         Guarda un nuevo mensaje predefinido.
@@ -417,33 +695,564 @@ class DatabaseManager:
             return {row[0] for row in cursor.fetchall()}
         # La conexión se cierra automáticamente si hay un error gracias al 'with'
 
-    def import_fines_from_list(self, fines_list):
-        """Inserta una lista de multas. Ignora duplicados y devuelve el número de filas insertadas."""
+    def import_fines_from_list(self, fines_list, progress=None):
+        """
+        Inserta una lista de multas. Ignora duplicados y devuelve el número de filas insertadas.
+
+        Como import_contacts_from_list, todo va en una sola transacción.
+
+        Args:
+            progress (ProgressReporter, opcional): Recibe el avance por lote.
+        """
+        query = "INSERT IGNORE INTO multas (expediente_nro, cedula_rif, uc, bs, fecha_multa, fecha_pago, multa_pendiente) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+        return self._import_in_one_transaction(query, fines_list, progress, bump_version=True)
+
+    def _import_in_one_transaction(self, query, filas, progress=None, bump_version=False):
+        """
+        Ejecuta 'query' con executemany en lotes de IMPORT_CHUNK_SIZE y confirma
+        una sola vez al final; ante cualquier error deshace todos los lotes.
+        Devuelve el número de filas insertadas.
+        """
+        rowcount = 0
+        db = self._get_connection()
+        try:
+            with db.cursor() as cursor:
+                for start in range(0, len(filas), IMPORT_CHUNK_SIZE):
+                    lote = filas[start:start + IMPORT_CHUNK_SIZE]
+                    cursor.executemany(query, lote)
+                    rowcount += max(cursor.rowcount, 0)
+                    if progress:
+                        progress.advance(len(lote))
+                if bump_version:
+                    self._bump_data_version(cursor)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return rowcount
+
+    def get_pending_fine_summaries(self, cedulas):
+        """
+        Resume en una sola consulta las multas pendientes de varios contactos.
+
+        Returns:
+            dict: {cedula_rif: {'cantidad', 'total', 'fecha_mas_antigua', 'expedientes'}},
+                solo para los contactos que tienen multas pendientes. 'expedientes'
+                es la lista separada por comas, de la más antigua a la más reciente.
+        """
+        if not cedulas:
+            return {}
+        placeholders = ','.join(['%s'] * len(cedulas))
+        query = (
+            "SELECT cedula_rif, COUNT(*) AS cantidad, SUM(bs) AS total, "
+            "MIN(fecha_multa) AS fecha_mas_antigua, "
+            "GROUP_CONCAT(expediente_nro ORDER BY fecha_multa SEPARATOR ', ') AS expedientes "
+            f"FROM multas WHERE multa_pendiente = TRUE AND cedula_rif IN ({placeholders}) "
+            "GROUP BY cedula_rif"
+        )
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            # El límite por defecto de GROUP_CONCAT (1024 bytes) cortaría la lista
+            cursor.execute("SET SESSION group_concat_max_len = 65535")
+            cursor.execute(query, tuple(cedulas))
+            resumenes = {row['cedula_rif']: row for row in cursor.fetchall()}
+        db.close()
+        return resumenes
+
+    def get_fines_for_contacts(self, cedulas):
+        """
+        Obtiene en una sola consulta las multas (pagadas y pendientes) de varios
+        contactos, para los estados de cuenta.
+
+        Returns:
+            dict: {cedula_rif: [multas ordenadas por fecha]}, solo para los
+                contactos que tienen multas.
+        """
+        if not cedulas:
+            return {}
+        placeholders = ','.join(['%s'] * len(cedulas))
+        query = (
+            "SELECT expediente_nro, cedula_rif, uc, bs, fecha_multa, fecha_pago, multa_pendiente "
+            f"FROM multas WHERE cedula_rif IN ({placeholders}) ORDER BY cedula_rif, fecha_multa"
+        )
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query, tuple(cedulas))
+            multas = {}
+            for row in cursor.fetchall():
+                multas.setdefault(row['cedula_rif'], []).append(row)
+        db.close()
+        return multas
+
+    # --- Métodos para Campañas de Envío ---
+
+    def _build_campaign_filter(self, filtros):
+        """
+        Construye la cláusula WHERE (sobre el alias 'c' de contactos) para un
+        conjunto de destinatarios definido por filtros.
+
+        Args:
+            filtros (dict): Claves opcionales 'search_term', 'solo_pendientes',
+                'fecha_desde' y 'fecha_hasta' (formato 'YYYY-MM-DD'), y
+                'excluir_contactados_dias' para omitir a quienes recibieron un envío
+                en esos días (por los 'canales' indicados, o por cualquiera).
+                'cedulas' limita la campaña a esos contactos y 'excluir_campana'
+                omite a los que ya tienen mensajes en la bandeja de esa campaña.
+
+        Returns:
+            tuple: (cláusula SQL que empieza por ' AND ...' o vacía, lista de parámetros).
+        """
+        clauses = []
+        params = []
+
+        search_term = (filtros.get('search_term') or '').strip()
+        if search_term:
+            clauses.append("(c.cedula_rif LIKE %s OR c.cedula_rif LIKE %s)")
+            params.extend([f"{search_term}%", f"%-{search_term}%"])
+
+        cedulas = filtros.get('cedulas')
+        if cedulas is not None:
+            if not cedulas:
+                return " AND 1=0", params
+            clauses.append(f"c.cedula_rif IN ({', '.join(['%s'] * len(cedulas))})")
+            params.extend(str(cedula) for cedula in cedulas)
+
+        fecha_desde = filtros.get('fecha_desde')
+        fecha_hasta = filtros.get('fecha_hasta')
+        if filtros.get('solo_pendientes') or fecha_desde or fecha_hasta:
+            # EXISTS usa el índice de la clave foránea multas(cedula_rif)
+            subquery = "SELECT 1 FROM multas m WHERE m.cedula_rif = c.cedula_rif"
+            if filtros.get('solo_pendientes'):
+                subquery += " AND m.multa_pendiente = TRUE"
+            if fecha_desde:
+                subquery += " AND m.fecha_multa >= %s"
+                params.append(fecha_desde)
+            if fecha_hasta:
+                subquery += " AND m.fecha_multa <= %s"
+                params.append(fecha_hasta)
+            clauses.append(f"EXISTS ({subquery})")
+
+        dias = filtros.get('excluir_contactados_dias')
+        if dias:
+            # NOT EXISTS: MySQL lo resuelve como un anti-join sobre idx_historial_contacto
+            subquery = ("SELECT 1 FROM historial_envios h WHERE h.cedula_rif = c.cedula_rif "
+                        "AND h.enviado_en >= NOW() - INTERVAL %s DAY AND h.exito = TRUE")
+            params.append(int(dias))
+            canales = filtros.get('canales')
+            if canales:
+                subquery += f" AND h.canal IN ({', '.join(['%s'] * len(canales))})"
+                params.extend(canales)
+            clauses.append(f"NOT EXISTS ({subquery})")
+
+        campana_id = filtros.get('excluir_campana')
+        if campana_id:
+            # Terminar de encolar una campaña: se salta a quien ya está en su bandeja
+            clauses.append(
+                "NOT EXISTS (SELECT 1 FROM outbox o WHERE o.campana_id = %s AND o.cedula_rif = c.cedula_rif)")
+            params.append(campana_id)
+
+        if not clauses:
+            return "", params
+        return " AND " + " AND ".join(clauses), params
+
+    def count_campaign_recipients(self, filtros):
+        """
+        Cuenta los contactos que coinciden con los filtros de una campaña.
+        """
+        where, params = self._build_campaign_filter(filtros)
+        query = f"SELECT COUNT(*) as total FROM contactos c WHERE 1=1{where}"
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query, tuple(params))
+            total = cursor.fetchone()['total']
+        db.close()
+        return total
+
+    def iter_campaign_recipients(self, filtros, chunk_size=500):
+        """
+        Recorre los destinatarios de una campaña en lotes, sin cargar la lista completa.
+
+        Usa paginación por clave (cedula_rif > último visto) en lugar de OFFSET, de modo
+        que cada lote cuesta lo mismo sin importar lo avanzado del recorrido. Cada lote
+        usa su propia conexión del pool, que se devuelve antes de entregar los datos.
+
+        Yields:
+            list: Lotes de diccionarios con las claves 'id', 'nombre', 'email' y 'telefono'.
+        """
+        where, params = self._build_campaign_filter(filtros)
+        query = (
+            "SELECT c.cedula_rif AS id, c.nombre, c.email, c.telefono "
+            f"FROM contactos c WHERE c.cedula_rif > %s{where} "
+            "ORDER BY c.cedula_rif LIMIT %s"
+        )
+        last_cedula = ""
+        while True:
+            db = self._get_connection()
+            with db.cursor(dictionary=True) as cursor:
+                cursor.execute(
+                    query, tuple([last_cedula] + params + [chunk_size]))
+                lote = cursor.fetchall()
+            db.close()
+
+            if not lote:
+                return
+            yield lote
+            if len(lote) < chunk_size:
+                return
+            last_cedula = lote[-1]['id']
+
+    # --- Métodos para la Bandeja de Salida (outbox) ---
+
+    def create_campaign(self, nombre, canales, plantilla=None, filtros=None, plantillas=("", "", ""),
+                        adjuntar_estado=False):
+        """
+        Registra una nueva campaña (en estado 'preparando') y devuelve su ID.
+        Los filtros y las plantillas se guardan para poder terminar de encolarla
+        si la preparación se interrumpe.
+
+        Args:
+            canales (list): Canales de la campaña ('email', 'whatsapp').
+            plantilla (str, opcional): Nombre del mensaje predefinido, para el historial.
+            filtros (dict, opcional): Filtros de destinatarios (ver _build_campaign_filter).
+            plantillas (tuple): (asunto, cuerpo_email, mensaje_whatsapp) con placeholders.
+            adjuntar_estado (bool): Si los emails llevan el estado de cuenta adjunto.
+        """
+        query = (
+            "INSERT INTO campanas (nombre, canales, plantilla, filtros, asunto_email, cuerpo_email, "
+            "mensaje_whatsapp, adjuntar_estado) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        )
+        asunto, cuerpo_email, mensaje_whatsapp = plantillas
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (nombre, ",".join(canales), plantilla,
+                                   json.dumps(filtros, default=str) if filtros is not None else None,
+                                   asunto, cuerpo_email, mensaje_whatsapp, adjuntar_estado))
+            db.commit()
+            campana_id = cursor.lastrowid
+        db.close()
+        return campana_id
+
+    def get_campaign(self, campana_id):
+        """
+        Obtiene una campaña o None: id, nombre, canales, estado, plantilla, filtros
+        (dict, o None en campañas anteriores a que se guardaran), plantillas
+        (asunto, cuerpo_email, mensaje_whatsapp) y adjuntar_estado.
+        """
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(
+                "SELECT id, nombre, canales, estado, plantilla, filtros, asunto_email, cuerpo_email, "
+                "mensaje_whatsapp, adjuntar_estado FROM campanas WHERE id = %s", (campana_id,))
+            campana = cursor.fetchone()
+        db.close()
+        if campana:
+            campana['filtros'] = json.loads(campana['filtros']) if campana['filtros'] else None
+            campana['plantillas'] = (campana.pop('asunto_email') or "", campana.pop('cuerpo_email') or "",
+                                     campana.pop('mensaje_whatsapp') or "")
+            campana['adjuntar_estado'] = bool(campana['adjuntar_estado'])
+        return campana
+
+    def set_campaign_status(self, campana_id, estado):
+        """
+        Actualiza el estado de una campaña ('preparando', 'enviando', 'pausada',
+        'completada' o 'programada').
+        """
+        query = "UPDATE campanas SET estado = %s WHERE id = %s"
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (estado, campana_id))
+            db.commit()
+        db.close()
+
+    def enqueue_outbox(self, filas):
+        """
+        Inserta mensajes personalizados en la bandeja de salida. Los que ya existen
+        para la campaña (misma huella de contenido) se ignoran.
+
+        Args:
+            filas (list): Tuplas (campana_id, cedula_rif, canal, destino, asunto, cuerpo,
+                adjunto, contenido_hash). 'adjunto' es la ruta de un PDF o None.
+
+        Returns:
+            int: Número de mensajes nuevos.
+        """
+        query = (
+            "INSERT IGNORE INTO outbox (campana_id, cedula_rif, canal, destino, asunto, cuerpo, adjunto, "
+            "contenido_hash) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        )
         db = self._get_connection()
         with db.cursor() as cursor:
-            query = "INSERT IGNORE INTO multas (expediente_nro, cedula_rif, uc, bs, fecha_multa, fecha_pago, multa_pendiente) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-            cursor.executemany(query, fines_list)
+            cursor.executemany(query, filas)
             db.commit()
             rowcount = cursor.rowcount
         db.close()
         return rowcount
 
-    # En db_manager.py, REEMPLAZA el método get_pending_fines_for_contact por este:
+    def count_pending_outbox(self, campana_id, canales):
+        """Cuenta los mensajes pendientes de una campaña en los canales indicados."""
+        placeholders = ", ".join(["%s"] * len(canales))
+        query = (
+            "SELECT COUNT(*) as total FROM outbox "
+            f"WHERE campana_id = %s AND estado = 'pendiente' AND canal IN ({placeholders})"
+        )
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query, tuple([campana_id] + list(canales)))
+            total = cursor.fetchone()['total']
+        db.close()
+        return total
+
+    def iter_pending_outbox(self, campana_id, canales, chunk_size=500):
+        """
+        Recorre en lotes los mensajes pendientes de una campaña, con paginación por
+        clave (id > último visto) sobre el índice (campana_id, estado, id).
+
+        Yields:
+            list: Lotes de diccionarios con 'id', 'cedula_rif', 'canal', 'destino',
+                'asunto', 'cuerpo' y 'adjunto'.
+        """
+        placeholders = ", ".join(["%s"] * len(canales))
+        query = (
+            "SELECT id, cedula_rif, canal, destino, asunto, cuerpo, adjunto FROM outbox "
+            f"WHERE campana_id = %s AND estado = 'pendiente' AND canal IN ({placeholders}) AND id > %s "
+            "ORDER BY id LIMIT %s"
+        )
+        last_id = 0
+        while True:
+            db = self._get_connection()
+            with db.cursor(dictionary=True) as cursor:
+                cursor.execute(query, tuple(
+                    [campana_id] + list(canales) + [last_id, chunk_size]))
+                lote = cursor.fetchall()
+            db.close()
+
+            if not lote:
+                return
+            yield lote
+            if len(lote) < chunk_size:
+                return
+            last_id = lote[-1]['id']
+
+    def mark_outbox_results(self, resultados, historial=None):
+        """
+        Guarda el resultado de varios envíos en una sola operación y, en la misma
+        transacción, los anota en el historial de envíos.
+
+        Args:
+            resultados (list): Tuplas (estado, error, intentos, outbox_id).
+            historial (list, opcional): Tuplas (cedula_rif, canal, plantilla, campana_id,
+                destino, exito, error). La fecha es NOW() del servidor, la misma
+                referencia que usan las consultas del historial, no el reloj de cada equipo.
+        """
+        # MySQL evalúa las asignaciones de izquierda a derecha: en el IF, 'estado'
+        # ya tiene el valor nuevo.
+        query = (
+            "UPDATE outbox SET estado = %s, ultimo_error = %s, intentos = intentos + %s, "
+            "enviado_en = IF(estado = 'enviado', NOW(), enviado_en) WHERE id = %s"
+        )
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.executemany(query, resultados)
+            if historial:
+                cursor.executemany(
+                    "INSERT INTO historial_envios (cedula_rif, canal, plantilla, campana_id, destino, "
+                    "exito, error, enviado_en) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())", historial)
+            db.commit()
+        db.close()
+
+    def requeue_failed_outbox(self, campana_id, error=None):
+        """
+        Vuelve a marcar como pendientes los mensajes fallidos de una campaña. Devuelve cuántos.
+        Con 'error', solo los que fallaron con ese mensaje (p. ej. 'Envío cancelado.').
+        """
+        query = "UPDATE outbox SET estado = 'pendiente' WHERE campana_id = %s AND estado = 'fallido'"
+        params = [campana_id]
+        if error is not None:
+            query += " AND ultimo_error = %s"
+            params.append(error)
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, tuple(params))
+            db.commit()
+            rowcount = cursor.rowcount
+        db.close()
+        return rowcount
 
-    def get_pending_fines_count_for_contact(self, cedula_rif):
+    def get_campaign_stats(self, campana_id):
         """
-        Obtiene únicamente el NÚMERO de multas pendientes para un contacto específico.
+        Devuelve las estadísticas de entrega de una campaña, agregadas en la BD.
+
+        Returns:
+            dict: {canal: {'pendiente': n, 'enviado': n, 'fallido': n}}
         """
-        query = "SELECT COUNT(*) as count FROM multas WHERE cedula_rif = %s AND multa_pendiente = TRUE"
+        query = (
+            "SELECT canal, estado, COUNT(*) as total FROM outbox "
+            "WHERE campana_id = %s GROUP BY canal, estado"
+        )
+        stats = {}
         db = self._get_connection()
-        count = 0
         with db.cursor(dictionary=True) as cursor:
-            cursor.execute(query, (cedula_rif,))
-            result = cursor.fetchone()
-            if result:
-                count = result['count']
+            cursor.execute(query, (campana_id,))
+            for row in cursor.fetchall():
+                canal_stats = stats.setdefault(
+                    row['canal'], {'pendiente': 0, 'enviado': 0, 'fallido': 0})
+                canal_stats[row['estado']] = row['total']
+        db.close()
+        return stats
+
+    # --- Métodos para el Historial de Envíos ---
+
+    def get_send_history(self, cedula_rif, limit=200):
+        """
+        Obtiene los envíos a un contacto, del más reciente al más antiguo, con el
+        nombre de la campaña si todavía existe.
+        """
+        query = """
+            SELECT h.enviado_en, h.canal, h.plantilla, h.destino, h.exito, h.error,
+                   h.campana_id, c.nombre AS campana
+            FROM historial_envios h
+            LEFT JOIN campanas c ON c.id = h.campana_id
+            WHERE h.cedula_rif = %s
+            ORDER BY h.enviado_en DESC
+            LIMIT %s
+        """
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query, (cedula_rif, limit))
+            envios = cursor.fetchall()
+        db.close()
+        return envios
+
+    # --- Métodos para el Programador de Campañas ---
+
+    def schedule_campaign(self, campana_id, desde=None):
+        """
+        Deja una campaña en manos del programador (estado 'programada'), que la
+        enviará a partir de 'desde' (datetime; por defecto, ahora).
+        """
+        query = "UPDATE campanas SET estado = 'programada', programada_desde = COALESCE(%s, NOW()) WHERE id = %s"
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (desde, campana_id))
+            db.commit()
+        db.close()
+
+    def get_scheduled_campaigns(self, solo_vencidas=True):
+        """
+        Obtiene las campañas programadas, de la más antigua a la más nueva. Con
+        'solo_vencidas', solo las que ya pueden empezar.
+        """
+        query = "SELECT id, nombre, canales, programada_desde FROM campanas WHERE estado = 'programada'"
+        if solo_vencidas:
+            query += " AND programada_desde <= NOW()"
+        query += " ORDER BY programada_desde, id"
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query)
+            campanas = cursor.fetchall()
+        db.close()
+        return campanas
+
+    def claim_campaign(self, campana_id, estados=('pausada',)):
+        """
+        Pasa a 'enviando' una campaña que está en alguno de los 'estados', en una
+        sola sentencia. Devuelve False si no lo estaba: otro proceso (la
+        aplicación o la línea de comandos) ya la tomó, o no le corresponde (p. ej.
+        una campaña programada solo la toma el programador).
+        """
+        query = (f"UPDATE campanas SET estado = 'enviando' "
+                 f"WHERE id = %s AND estado IN ({', '.join(['%s'] * len(estados))})")
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (campana_id,) + tuple(estados))
+            db.commit()
+            claimed = cursor.rowcount == 1
+        db.close()
+        return claimed
+
+    def claim_scheduled_campaign(self, campana_id):
+        """Pasa una campaña programada a 'enviando' (ver claim_campaign)."""
+        return self.claim_campaign(campana_id, ('programada',))
+
+    # Sin cambios en la campaña ni en su bandeja de salida desde hace 'minutos'
+    _CAMPANA_INACTIVA = (
+        "c.actualizada_en < NOW() - INTERVAL %s MINUTE AND NOT EXISTS ("
+        "SELECT 1 FROM outbox o WHERE o.campana_id = c.id AND o.actualizado_en >= NOW() - INTERVAL %s MINUTE)"
+    )
+
+    def release_stale_campaigns(self, minutos=30):
+        """
+        Devuelve las campañas que quedaron 'enviando' sin actividad durante
+        'minutos' (el proceso que las enviaba terminó sin cerrarlas) a quien
+        puede retomarlas: al programador ('programada') si estaban programadas y,
+        si no, a la reanudación manual ('pausada'). Devuelve cuántas.
+        """
+        query = (
+            "UPDATE campanas c SET c.estado = IF(c.programada_desde IS NULL, 'pausada', 'programada') "
+            f"WHERE c.estado = 'enviando' AND {self._CAMPANA_INACTIVA}"
+        )
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (minutos, minutos))
+            db.commit()
+            rowcount = cursor.rowcount
+        db.close()
+        return rowcount
+
+    def is_campaign_idle(self, campana_id, minutos=30):
+        """Indica si una campaña lleva 'minutos' sin cambios (p. ej. una preparación abandonada)."""
+        query = f"SELECT COUNT(*) FROM campanas c WHERE c.id = %s AND {self._CAMPANA_INACTIVA}"
+        db = self._get_connection()
+        with db.cursor() as cursor:
+            cursor.execute(query, (campana_id, minutos, minutos))
+            idle = cursor.fetchone()[0] == 1
+        db.close()
+        return idle
+
+    def count_sent_since(self, horas=24):
+        """
+        Cuenta los mensajes enviados por canal en las últimas 'horas', de todas las
+        campañas. Es lo que los proveedores miden para sus cuotas diarias.
+
+        Returns:
+            dict: {canal: n}
+        """
+        query = (
+            "SELECT canal, COUNT(*) as total FROM outbox "
+            "WHERE enviado_en >= NOW() - INTERVAL %s HOUR AND estado = 'enviado' GROUP BY canal"
+        )
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query, (horas,))
+            enviados = {row['canal']: row['total'] for row in cursor.fetchall()}
+        db.close()
+        return enviados
+
+    def get_unfinished_campaigns(self):
+        """
+        Obtiene las campañas no completadas, con su estado y sus totales de
+        mensajes enviados y pendientes, de la más reciente a la más antigua.
+        """
+        query = """
+            SELECT c.id, c.nombre, c.canales, c.estado, c.creada_en,
+                   COUNT(o.id) AS total,
+                   COALESCE(SUM(o.estado = 'enviado'), 0) AS enviados,
+                   COALESCE(SUM(o.estado = 'pendiente'), 0) AS pendientes,
+                   COALESCE(SUM(o.estado = 'fallido'), 0) AS fallidos
+            FROM campanas c
+            LEFT JOIN outbox o ON o.campana_id = c.id
+            WHERE c.estado <> 'completada'
+            GROUP BY c.id, c.nombre, c.canales, c.estado, c.creada_en
+            ORDER BY c.creada_en DESC
+        """
+        db = self._get_connection()
+        with db.cursor(dictionary=True) as cursor:
+            cursor.execute(query)
+            campanas = cursor.fetchall()
         db.close()
-        return count
+        return campanas
 
     def get_dashboard_stats(self):
         """
@@ -0,0 +1,295 @@
+# email_dispatcher.py
+"""
+Módulo para el envío concurrente de emails en campañas masivas.
+
+Un EmailDispatcher mantiene varios hilos de envío, cada uno con su propia
+SMTPSession persistente, que consumen una cola acotada de mensajes. Un limitador
+de tipo token bucket reparte los envíos para respetar las cuotas del proveedor
+(mensajes por segundo y por día) y cada destinatario recibe su propio resultado.
+Los errores transitorios se reintentan y un breaker pausa el canal si el
+servidor falla de forma continuada (ver retry_policy.py).
+
+Con '[smtp] backend = asyncio' se usa en su lugar AsyncEmailDispatcher (ver
+async_email.py), con la misma interfaz; crear_dispatcher() elige el backend.
+"""
+
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from retry_policy import CircuitBreaker, RetryPolicy, enviar_con_reintentos
+
+# Resultado del envío a un destinatario. 'contact_id' identifica al contacto
+# (cédula/RIF), 'error' es None si el envío fue correcto y 'attempts' cuenta
+# los intentos realizados.
+EmailResult = namedtuple(
+    'EmailResult', ['contact_id', 'email', 'ok', 'error', 'elapsed', 'attempts'])
+
+_STOP = object()
+
+
+class QuotaExceededError(Exception):
+    """Se alcanzó la cuota diaria de emails configurada."""
+
+
+class TokenBucket:
+    """
+    Limitador de tasa: permite 'rate' operaciones por segundo con ráfagas de
+    hasta 'capacity'. Con rate <= 0 no limita nada.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(1.0, capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Toma un token si hay uno disponible y devuelve 0; si no, devuelve los
+        segundos que faltan para el siguiente. No bloquea.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop_event=None):
+        """
+        Bloquea hasta obtener un token. Devuelve False si 'stop_event' se activó
+        mientras esperaba.
+        """
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class DailyQuota:
+    """
+    Cuenta los envíos de las últimas 24 horas (ventana móvil, como
+    DatabaseManager.count_sent_since y el programador de campañas) y rechaza
+    los que superan el límite (0 = sin límite).
+
+    'already_sent' son los enviados en las últimas 24 horas antes de crear la
+    cuota (de la BD); como no se sabe cuándo salió cada uno, cuentan mientras
+    dure la cuota, lo que solo puede quedarse corto, nunca pasarse.
+    """
+
+    WINDOW = 24 * 3600
+
+    def __init__(self, limit, already_sent=0):
+        self.limit = limit
+        self.already_sent = already_sent
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def consume(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._sent and now - self._sent[0] >= self.WINDOW:
+                self._sent.popleft()
+            if self.limit and self.already_sent + len(self._sent) >= self.limit:
+                raise QuotaExceededError(
+                    f"Cuota diaria de {self.limit} emails alcanzada.")
+            self._sent.append(now)
+
+
+class EmailDispatcher:
+    """
+    Envía emails en paralelo con varias conexiones SMTP y limitación de tasa.
+
+    Uso:
+        dispatcher = EmailDispatcher(services_manager, connections=4, per_second=5,
+                                     on_result=callback).start()
+        dispatcher.submit(contact_id, email, asunto, cuerpo)
+        ...
+        dispatcher.close()  # espera a que se vacíe la cola
+
+    'on_result' se llama desde los hilos de envío con un EmailResult por
+    destinatario; no debe tocar widgets de Tkinter directamente.
+    """
+
+    def __init__(self, services_manager, connections=4, per_second=0, per_day=0,
+                 on_result=None, queue_size=None, retry_policy=None, breaker=None, log=None,
+                 already_sent=0):
+        """
+        Args:
+            services_manager (ServicesManager): Crea las sesiones SMTP y los mensajes.
+            connections (int): Número de conexiones SMTP (hilos) simultáneas.
+            per_second (float): Máximo de emails por segundo entre todos los hilos (0 = sin límite).
+            per_day (int): Máximo de emails en 24 horas (0 = sin límite).
+            already_sent (int): Emails ya enviados en las últimas 24 horas, que
+                cuentan para 'per_day'.
+            on_result (callable, opcional): Recibe un EmailResult por destinatario.
+            queue_size (int, opcional): Tamaño de la cola; submit() se bloquea si está
+                llena, para no leer de la BD más rápido de lo que se envía.
+            retry_policy (RetryPolicy, opcional): Reintentos de errores transitorios.
+            breaker (CircuitBreaker, opcional): Pausa el canal si el servidor falla.
+            log (callable, opcional): log(mensaje, nivel), seguro entre hilos.
+        """
+        self.services_manager = services_manager
+        self.connections = max(1, connections)
+        self.bucket = TokenBucket(per_second)
+        self.quota = DailyQuota(per_day, already_sent)
+        self.on_result = on_result
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breaker = breaker
+        self.log = log or (lambda message, level="info": print(message))
+        self._queue = queue.Queue(maxsize=queue_size or self.connections * 50)
+        self._stop_event = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+        self.results = []
+        self.sent = 0
+        self.failed = 0
+
+    @classmethod
+    def from_config(cls, services_manager, on_result=None, log=None, connections=None, db_manager=None):
+        """
+        Crea un dispatcher con los valores de la sección [smtp] de config.ini.
+        'connections' sustituye al valor configurado sin modificar la configuración.
+        Con 'db_manager', la cuota diaria parte de los emails enviados en las
+        últimas 24 horas.
+        """
+        config = services_manager.config
+        per_day = config.getint('smtp', 'max_per_day', fallback=0)
+        return cls(
+            services_manager,
+            connections=connections or config.getint('smtp', 'connections', fallback=4),
+            per_second=config.getfloat('smtp', 'max_per_second', fallback=0),
+            per_day=per_day,
+            on_result=on_result,
+            retry_policy=RetryPolicy.from_config(config, 'smtp'),
+            breaker=CircuitBreaker.from_config(config, 'smtp', "Email", log=log),
+            log=log,
+            already_sent=enviados_24h(db_manager) if per_day else 0)
+
+    def start(self):
+        for index in range(self.connections):
+            worker = threading.Thread(
+                target=self._worker, name=f"smtp-{index + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def submit(self, contact_id, email, subject, body, attachments=None):
+        """Encola un email ya personalizado. Se bloquea si la cola está llena."""
+        if self._stop_event.is_set():
+            # Se informa como cancelado para que quien lo encoló no lo espere
+            self._record(EmailResult(contact_id, email, False, "Envío cancelado.", 0.0, 0))
+            return
+        self._queue.put((contact_id, email, subject, body, attachments))
+
+    def cancel(self):
+        """Descarta los emails pendientes; los hilos terminan tras el envío en curso."""
+        self._stop_event.set()
+
+    def close(self):
+        """Espera a que se envíen los emails encolados y cierra las conexiones."""
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _record(self, result):
+        with self._lock:
+            self.results.append(result)
+            if result.ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+        if self.on_result:
+            self.on_result(result)
+
+    def _worker(self):
+        # La sesión se guarda en una lista para que send() pueda crearla o
+        # sustituirla entre reintentos.
+        session = [None]
+
+        def send(email, subject, body, attachments):
+            if session[0] is None:
+                session[0] = self.services_manager.open_email_session()
+            self.services_manager.send_email(
+                email, subject, body, session=session[0], attachments=attachments)
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                contact_id, email, subject, body, attachments = item
+                # Token y cuota se gastan una vez por email, no por reintento
+                if self._stop_event.is_set() or not self.bucket.acquire(self._stop_event):
+                    self._record(EmailResult(
+                        contact_id, email, False, "Envío cancelado.", 0.0, 0))
+                    continue
+                try:
+                    self.quota.consume()
+                except QuotaExceededError as e:
+                    # El resto de la cola tampoco se podrá enviar hoy; sigue pendiente.
+                    self._stop_event.set()
+                    self._record(EmailResult(contact_id, email, False, str(e), 0.0, 0))
+                    continue
+                started = time.monotonic()
+                try:
+                    attempts = enviar_con_reintentos(
+                        lambda: send(email, subject, body, attachments), self.retry_policy, self.breaker,
+                        self._stop_event, self.log, descripcion=f"email a {email}")
+                except Exception as e:
+                    self._record(EmailResult(contact_id, email, False, str(e),
+                                             time.monotonic() - started, getattr(e, 'attempts', 1)))
+                else:
+                    self._record(EmailResult(
+                        contact_id, email, True, None, time.monotonic() - started, attempts))
+        finally:
+            if session[0] is not None:
+                session[0].close()
+
+
+def enviados_24h(db_manager):
+    """Emails enviados en las últimas 24 horas según la BD (0 sin BD)."""
+    if db_manager is None:
+        return 0
+    return db_manager.count_sent_since(24).get('email', 0)
+
+
+def crear_dispatcher(services_manager, on_result=None, log=None, backend=None, connections=None,
+                     db_manager=None):
+    """
+    Crea el dispatcher del backend configurado en '[smtp] backend': 'threads'
+    (EmailDispatcher) o 'asyncio' (AsyncEmailDispatcher). Si aiosmtplib no está
+    instalado se usa el de hilos.
+
+    'backend' y 'connections' sustituyen a los valores de config.ini (p. ej.
+    desde la línea de comandos). Con 'db_manager', la cuota diaria descuenta lo
+    enviado en las últimas 24 horas.
+    """
+    backend = (backend or services_manager.config.get(
+        'smtp', 'backend', fallback='threads')).strip().lower()
+    if backend == 'asyncio':
+        import async_email
+        if async_email.aiosmtplib is not None:
+            return async_email.AsyncEmailDispatcher.from_config(
+                services_manager, on_result=on_result, log=log, connections=connections,
+                db_manager=db_manager)
+        if log:
+            log("El backend asyncio de email requiere el paquete 'aiosmtplib'; se usan hilos.",
+                "warning")
+    return EmailDispatcher.from_config(services_manager, on_result=on_result, log=log,
+                                       connections=connections, db_manager=db_manager)
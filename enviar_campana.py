@@ -0,0 +1,435 @@
+# enviar_campana.py
+"""
+Punto de entrada por línea de comandos para enviar campañas sin la interfaz
+gráfica, por ejemplo de noche en un servidor.
+
+Usa el config.ini y la secret.key del directorio actual, como main.py, y el
+mismo CampaignRunner y la misma bandeja de salida que la pestaña de mensajes:
+la campaña queda registrada en la BD y, si se interrumpe (Ctrl+C), se puede
+reanudar con --reanudar o desde la aplicación.
+
+El progreso se escribe en la salida estándar y al terminar se imprime un
+resumen en JSON (también en el archivo de --resumen, si se indica).
+Código de salida: 0 si se envió todo, 1 si quedan mensajes fallidos o
+pendientes y 2 si la campaña no pudo empezar.
+
+Con --programar la campaña solo se encola y queda en manos del programador
+(campaign_scheduler.py), que la envía por tramos dentro del horario y de las
+cuotas diarias de [scheduler]. El programador corre dentro de la aplicación
+o, sin ella, con --programador.
+
+Uso:
+    python enviar_campana.py --mensaje "Aviso de multas" --pendientes --canales email
+    python enviar_campana.py --mensaje "Aviso de multas" --buscar V-12 --canales email,whatsapp --conexiones 8
+    python enviar_campana.py --reanudar 42
+    python enviar_campana.py --mensaje "Recordatorio" --pendientes --programar --inicio "2026-11-02 08:00"
+    python enviar_campana.py --programador
+"""
+
+import argparse
+import configparser
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cryptography.fernet import Fernet, InvalidToken
+from mysql.connector import Error as MySQLError
+
+from config_handler import CONFIG_FILE, KEY_FILE, decrypt_value
+from campaign_scheduler import CampaignScheduler
+from db_manager import DatabaseManager
+from message_templates import TemplateError
+from progress_reporter import ProgressReporter, format_progress
+from send_pipeline import CampaignRunner, EmailPipeline, WhatsAppPipeline
+from services import ServicesManager
+from statements import StatementGenerator
+
+CANALES = ('email', 'whatsapp')
+
+
+class CampaignError(Exception):
+    """Error que impide empezar la campaña (configuración, mensaje, destinatarios...)."""
+
+
+def _log(message, level="info"):
+    """Registro de la campaña; seguro entre hilos (print escribe cada línea entera)."""
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} [{level.upper()}] {message}", flush=True)
+
+
+def _mostrar_progreso(snapshot):
+    # En una terminal se reescribe la misma línea; redirigido a un archivo, una línea por refresco.
+    if sys.stdout.isatty():
+        print("\r" + format_progress(snapshot), end="\n" if snapshot['finished'] else "", flush=True)
+    else:
+        print(format_progress(snapshot), flush=True)
+
+
+def cargar_configuracion():
+    """
+    Lee config.ini y la clave de cifrado, y comprueba que las contraseñas se
+    pueden descifrar. A diferencia de main.py, no cifra contraseñas en texto
+    plano ni crea archivos: sin un config.ini ya preparado no se envía nada.
+    """
+    if not os.path.exists(CONFIG_FILE):
+        raise CampaignError(f"No se encuentra '{CONFIG_FILE}' en {os.getcwd()}.")
+    if not os.path.exists(KEY_FILE):
+        raise CampaignError(f"No se encuentra la clave de cifrado '{KEY_FILE}'.")
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE, encoding='utf-8')
+    if not config.has_section('mysql'):
+        raise CampaignError(f"Falta la sección [mysql] en '{CONFIG_FILE}'.")
+    with open(KEY_FILE, "rb") as key_file:
+        fernet = Fernet(key_file.read())
+
+    for section in ('mysql', 'smtp'):
+        if not config.has_option(section, 'password'):
+            continue
+        try:
+            decrypt_value(fernet, config.get(section, 'password'))
+        except InvalidToken:
+            raise CampaignError(
+                f"La contraseña de [{section}] no está cifrada con '{KEY_FILE}'. "
+                "Abre la aplicación una vez para cifrarla.") from None
+    return config, fernet
+
+
+def _buscar_mensaje(db_manager, nombre):
+    for mensaje in db_manager.get_preset_messages():
+        if mensaje['nombre'].strip().lower() == nombre.strip().lower():
+            return mensaje
+    raise CampaignError(f"No existe un mensaje predefinido llamado '{nombre}'.")
+
+
+class CampanaSinInterfaz:
+    """
+    Ejecuta una campaña (nueva o reanudada) en un hilo de trabajo, para que el
+    hilo principal pueda atender Ctrl+C: la primera pulsación detiene el envío
+    y deja la campaña pausada; la segunda sale sin esperar.
+    """
+
+    def __init__(self, args, config, fernet):
+        self.args = args
+        self.db_manager = DatabaseManager(config, fernet)
+        self.db_manager.init_db()
+        self.services_manager = ServicesManager(config, fernet)
+        self.runner = None
+        self.programador = None
+        self.resumen = {}
+        self.error = None
+        self._cancelado = threading.Event()
+        self._terminado = threading.Event()
+        self._driver = None
+        self._tomada = None  # ID de la campaña tomada con claim_campaign y aún sin drenar
+
+    # --- Preparación ---
+
+    def _crear_runner(self, progreso, canales, plantillas=("", "", ""), adjuntar_estado=False):
+        """Runner con un pipeline por canal de 'canales' (vacío si solo se va a encolar)."""
+        estados_cuenta = None
+        if adjuntar_estado:
+            estados_cuenta = StatementGenerator.from_config(
+                self.services_manager.config, self.services_manager.header_image_path())
+        runner = CampaignRunner(self.services_manager, self.db_manager, plantillas,
+                                progress=progreso, log=_log, estados_cuenta=estados_cuenta)
+        if 'email' in canales:
+            runner.add_pipeline(EmailPipeline(self.services_manager, runner.on_result, log=_log,
+                                              backend=self.args.backend, connections=self.args.conexiones,
+                                              db_manager=self.db_manager))
+        if 'whatsapp' in canales:
+            self._driver = self.services_manager.whatsapp_session.acquire(log=_log)
+            if self._driver is None:
+                self.services_manager.whatsapp_session.release()
+                _log("WhatsApp no disponible: sus mensajes quedan pendientes.", "warning")
+            else:
+                runner.add_pipeline(WhatsAppPipeline.from_config(
+                    self.services_manager, self._driver, runner.on_result, log=_log))
+        return runner
+
+    def _filtros(self):
+        dias = self.args.omitir_contactados
+        if dias is None:
+            dias = self.services_manager.config.getint('history', 'dedup_days', fallback=0)
+        return {'search_term': self.args.buscar, 'solo_pendientes': self.args.pendientes,
+                'fecha_desde': self.args.desde, 'fecha_hasta': self.args.hasta,
+                'excluir_contactados_dias': dias, 'canales': self.args.canales}
+
+    # --- Ejecución ---
+
+    def _nueva(self, progreso):
+        canales = self.args.canales
+        mensaje = _buscar_mensaje(self.db_manager, self.args.mensaje)
+        plantillas = (mensaje['asunto_email'] or "", mensaje['cuerpo_email'] or "",
+                      mensaje['mensaje_whatsapp'] or "")
+        if 'email' in canales and not (plantillas[0] or plantillas[1]):
+            raise CampaignError(f"El mensaje '{mensaje['nombre']}' no tiene asunto ni cuerpo de email.")
+        if 'whatsapp' in canales and not plantillas[2]:
+            raise CampaignError(f"El mensaje '{mensaje['nombre']}' no tiene texto de WhatsApp.")
+
+        filtros = self._filtros()
+        total = self.db_manager.count_campaign_recipients(filtros)
+        self.resumen['destinatarios'] = total
+        if total == 0:
+            _log("Ningún contacto coincide con los filtros; no se crea la campaña.", "warning")
+            return None
+
+        adjuntar_estado = self.args.adjuntar_estado and 'email' in canales
+        try:
+            self.runner = self._crear_runner(progreso, [] if self.args.programar else canales, plantillas,
+                                             adjuntar_estado)
+        except TemplateError as e:
+            raise CampaignError(f"Plantilla inválida en '{mensaje['nombre']}': {e}") from None
+        nombre = self.args.nombre or f"{mensaje['nombre']} {datetime.now():%Y-%m-%d %H:%M}"
+        campana_id = self.db_manager.create_campaign(
+            nombre, canales, mensaje['nombre'], filtros, plantillas, adjuntar_estado)
+        self.resumen['campana'] = {'id': campana_id, 'nombre': nombre}
+        _log(f"Campaña '{nombre}' (#{campana_id}): {total} destinatarios, canales {', '.join(canales)}.")
+
+        # Si se interrumpe aquí, queda 'preparando' y --reanudar termina de encolarla
+        nuevos = self.runner.encolar_campana(self.db_manager.get_campaign(campana_id))
+        self.resumen['mensajes_encolados'] = nuevos
+        _log(f"{nuevos} mensajes en la bandeja de salida.")
+        return campana_id
+
+    def _reanudar(self, progreso):
+        """
+        Toma una campaña pausada (o a medio preparar) con claim_campaign, como el
+        programador, para que dos procesos no la envíen a la vez.
+        """
+        minutos = self.services_manager.config.getint('scheduler', 'stale_minutes', fallback=30)
+        # Si el proceso que la enviaba terminó sin cerrarla, vuelve a estar disponible
+        self.db_manager.release_stale_campaigns(minutos)
+        campana = self.db_manager.get_campaign(self.args.reanudar)
+        if campana is None or campana['estado'] == 'completada':
+            raise CampaignError(f"La campaña #{self.args.reanudar} no existe o ya está completada.")
+        if campana['estado'] == 'programada':
+            raise CampaignError(f"La campaña #{campana['id']} está programada: la envía --programador "
+                                "dentro del horario y las cuotas.")
+        if campana['estado'] == 'enviando':
+            raise CampaignError(f"La campaña #{campana['id']} se está enviando en otro proceso.")
+        if campana['estado'] == 'preparando':
+            if campana['filtros'] is None:
+                raise CampaignError(f"La campaña #{campana['id']} se interrumpió mientras se preparaba y no "
+                                    "tiene guardados sus destinatarios; créala de nuevo.")
+            if not self.db_manager.is_campaign_idle(campana['id'], minutos):
+                raise CampaignError(f"La campaña #{campana['id']} todavía se está preparando.")
+        elif not self.db_manager.claim_campaign(campana['id']):
+            raise CampaignError(f"La campaña #{campana['id']} ya la está enviando otro proceso.")
+        else:
+            self._tomada = campana['id']
+        canales = [canal for canal in campana['canales'].split(',') if canal]
+        self.resumen['campana'] = {'id': campana['id'], 'nombre': campana['nombre']}
+        try:
+            self.runner = self._crear_runner(progreso, canales, campana['plantillas'],
+                                             campana['adjuntar_estado'] and 'email' in canales)
+        except TemplateError as e:
+            raise CampaignError(f"Plantilla inválida en la campaña #{campana['id']}: {e}") from None
+        if campana['estado'] == 'preparando':
+            nuevos = self.runner.encolar_campana(campana)
+            self.resumen['mensajes_encolados'] = nuevos
+            _log(f"Preparación completada: {nuevos} mensajes más en la bandeja de salida.")
+            if not self.db_manager.claim_campaign(campana['id'], ('preparando',)):
+                raise CampaignError(f"Otro proceso tomó la campaña #{campana['id']} mientras se preparaba.")
+            self._tomada = campana['id']
+        reintentos = self.db_manager.requeue_failed_outbox(campana['id'])
+        _log(f"Reanudando '{campana['nombre']}' (#{campana['id']}); "
+             f"{reintentos} mensajes fallidos se reintentarán.")
+        return campana['id']
+
+    def _programar(self, campana_id):
+        programador = CampaignScheduler.from_config(self.services_manager, self.db_manager, log=_log)
+        self.db_manager.schedule_campaign(campana_id, self.args.inicio)
+        pendientes = {canal: conteo['pendiente'] for canal, conteo in
+                      self.db_manager.get_campaign_stats(campana_id).items()}
+        inicio = max(datetime.now(), self.args.inicio or datetime.now())
+        # Lo enviado en las últimas 24 horas solo resta cuota si la campaña empieza antes de que caduque
+        enviados = (self.db_manager.count_sent_since(24)
+                    if inicio - datetime.now() < timedelta(hours=24) else {})
+        fin = programador.estimar_fin(pendientes, inicio, enviados_24h=enviados)
+        self.resumen['estado'] = 'programada'
+        self.resumen['fin_estimado'] = f"{fin:%Y-%m-%d %H:%M}"
+        _log(f"Campaña programada: se enviará en horario {programador.window}; "
+             f"fin estimado según las cuotas diarias: {fin:%Y-%m-%d %H:%M}.")
+
+    def _ejecutar_programador(self):
+        self.programador = CampaignScheduler.from_config(self.services_manager, self.db_manager, log=_log)
+        if self._cancelado.is_set():
+            return
+        self.programador.run(hasta_terminar=not self.args.continuo)
+        self.resumen['programador'] = {'mensajes': self.programador.enviados}
+
+    def _ejecutar(self):
+        progreso = ProgressReporter(_mostrar_progreso, title="Envío", unit="mensajes",
+                                    max_rate_hz=self.args.refresco)
+        started = time.monotonic()
+        try:
+            if self.args.programador:
+                self._ejecutar_programador()
+                return
+            campana_id = self._reanudar(progreso) if self.args.reanudar else self._nueva(progreso)
+            if campana_id is None:
+                return
+            if self._cancelado.is_set():
+                # Lo encolado se conserva; la campaña se puede reanudar.
+                self.db_manager.set_campaign_status(campana_id, 'pausada')
+                self._tomada = None
+            elif self.args.programar:
+                self._programar(campana_id)
+            elif not self.args.reanudar and not self.db_manager.claim_campaign(campana_id, ('preparando',)):
+                raise CampaignError(f"La campaña #{campana_id} ya la está enviando otro proceso.")
+            else:
+                self._tomada = campana_id
+                progreso.start()
+                self.resumen['estadisticas'] = self.runner.drenar(campana_id)
+                self._tomada = None
+            pipeline = self.runner.pipelines.get('whatsapp')
+            if pipeline:
+                self.resumen['tiempos_whatsapp'] = pipeline.timings.summary()
+        except Exception as e:
+            self.error = e
+            if self._tomada is not None:
+                # Tomada pero sin terminar de drenar: queda pausada para reanudarla
+                try:
+                    self.db_manager.set_campaign_status(self._tomada, 'pausada')
+                except MySQLError as error_bd:
+                    _log(f"No se pudo pausar la campaña #{self._tomada}: {error_bd}", "error")
+        finally:
+            progreso.finish()
+            self.resumen['duracion_s'] = round(time.monotonic() - started, 2)
+            if self._driver is not None:
+                self.services_manager.whatsapp_session.release()
+            self.services_manager.shutdown()
+            self._terminado.set()
+
+    def cancel(self):
+        self._cancelado.set()
+        if self.programador:
+            self.programador.stop()
+        if self.runner:
+            self.runner.cancel()
+
+    def run(self):
+        """Ejecuta la campaña y devuelve el código de salida."""
+        worker = threading.Thread(target=self._ejecutar, name="campana", daemon=True)
+        worker.start()
+        # Se espera al evento y no con worker.join(): un Ctrl+C durante join()
+        # puede dejar el hilo marcado como terminado aunque siga enviando.
+        try:
+            while not self._terminado.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            _log("Interrumpido: terminando los envíos en curso; lo pendiente se podrá reanudar. "
+                 "Pulsa Ctrl+C otra vez para salir sin esperar.", "warning")
+            self.cancel()
+            try:
+                while not self._terminado.wait(0.5):
+                    pass
+            except KeyboardInterrupt:
+                # Segunda pulsación: se sale sin esperar; lo no enviado sigue en la bandeja
+                _log("Salida forzada: los mensajes no enviados quedan pendientes para reanudar.", "warning")
+                self.resumen['estado'] = 'interrumpida'
+                campana = self.resumen.get('campana')
+                try:
+                    # Si ya estaba enviando, se deja pausada para poder reanudarla;
+                    # a medio preparar sigue 'preparando' y --reanudar la termina.
+                    if campana and self.db_manager.get_campaign(campana['id'])['estado'] == 'enviando':
+                        self.db_manager.set_campaign_status(campana['id'], 'pausada')
+                        self.resumen['estado'] = 'pausada'
+                except MySQLError as e:
+                    _log(f"No se pudo marcar la campaña como pausada: {e}", "error")
+                return 1
+
+        if self.error is not None:
+            self.resumen['error'] = str(self.error)
+            return 2
+        estadisticas = self.resumen.get('estadisticas')
+        if estadisticas is None:
+            # Sin destinatarios (o solo programada) no hay nada pendiente; interrumpida, sí.
+            return 1 if self._cancelado.is_set() else 0
+        quedan = sum(canal['pendiente'] + canal['fallido'] for canal in estadisticas.values())
+        self.resumen['estado'] = 'pausada' if quedan else 'completada'
+        return 1 if quedan else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Envía una campaña de mensajes sin la interfaz gráfica.")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--mensaje", help="Nombre del mensaje predefinido a enviar.")
+    origen.add_argument("--reanudar", type=int, metavar="ID",
+                        help="Reanuda una campaña pausada o a medio preparar (sus fallidos se reintentan); "
+                             "las programadas las envía --programador.")
+    origen.add_argument("--programador", action="store_true",
+                        help="Envía las campañas programadas dentro del horario y las cuotas, "
+                             "hasta que no quede ninguna.")
+    parser.add_argument("--canales", default="email",
+                        help="'email', 'whatsapp' o 'email,whatsapp' (email).")
+    parser.add_argument("--buscar", help="Contactos cuya cédula/RIF empieza por este texto.")
+    parser.add_argument("--pendientes", action="store_true",
+                        help="Solo contactos con multas pendientes.")
+    parser.add_argument("--desde", help="Multas desde esta fecha (AAAA-MM-DD).")
+    parser.add_argument("--hasta", help="Multas hasta esta fecha (AAAA-MM-DD).")
+    parser.add_argument("--omitir-contactados", type=int, metavar="DIAS",
+                        help="Omite a quien ya recibió un envío por estos canales en los últimos DIAS "
+                             "(por defecto, [history] dedup_days; 0 = no omitir).")
+    parser.add_argument("--nombre", help="Nombre de la campaña (por defecto, el del mensaje y la fecha).")
+    parser.add_argument("--conexiones", type=int,
+                        help="Conexiones SMTP simultáneas (por defecto las de config.ini).")
+    parser.add_argument("--backend", choices=("threads", "asyncio"),
+                        help="Backend de envío de email (por defecto el de config.ini).")
+    parser.add_argument("--adjuntar-estado", action="store_true",
+                        help="Adjunta a cada email el estado de cuenta en PDF.")
+    parser.add_argument("--programar", action="store_true",
+                        help="Encola la campaña para el programador en lugar de enviarla ya.")
+    parser.add_argument("--inicio", help="Con --programar, no enviar antes de esta fecha (AAAA-MM-DD HH:MM).")
+    parser.add_argument("--continuo", action="store_true",
+                        help="Con --programador, sigue esperando campañas nuevas en lugar de terminar.")
+    parser.add_argument("--refresco", type=float, default=0.2,
+                        help="Refrescos del progreso por segundo (0.2).")
+    parser.add_argument("--resumen", metavar="ARCHIVO", help="Guarda también el resumen JSON en este archivo.")
+    args = parser.parse_args(argv)
+
+    args.canales = [canal.strip() for canal in args.canales.split(',') if canal.strip()]
+    if not args.canales or any(canal not in CANALES for canal in args.canales):
+        parser.error("--canales admite 'email', 'whatsapp' o ambos separados por comas.")
+    for fecha in (args.desde, args.hasta):
+        if fecha:
+            try:
+                datetime.strptime(fecha, '%Y-%m-%d')
+            except ValueError:
+                parser.error(f"La fecha '{fecha}' no tiene el formato AAAA-MM-DD.")
+    if args.omitir_contactados is not None and args.omitir_contactados < 0:
+        parser.error("--omitir-contactados debe ser 0 o más días.")
+    if (args.programar or args.inicio) and not args.mensaje:
+        parser.error("--programar e --inicio solo se usan con --mensaje.")
+    if args.inicio:
+        try:
+            args.inicio = datetime.strptime(args.inicio, '%Y-%m-%d %H:%M')
+        except ValueError:
+            parser.error(f"La fecha '{args.inicio}' no tiene el formato AAAA-MM-DD HH:MM.")
+        args.programar = True
+
+    try:
+        config, fernet = cargar_configuracion()
+        campana = CampanaSinInterfaz(args, config, fernet)
+    except (CampaignError, MySQLError) as e:
+        _log(str(e), "error")
+        codigo, resumen = 2, {'error': str(e)}
+    else:
+        codigo = campana.run()
+        resumen = campana.resumen
+        if campana.error is not None:
+            _log(str(campana.error), "error")
+
+    texto = json.dumps(resumen, ensure_ascii=False, indent=2, default=str)
+    print(texto)
+    if args.resumen:
+        with open(args.resumen, 'w', encoding='utf-8') as resumen_file:
+            resumen_file.write(texto + "\n")
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# log_sink.py
+"""
+Módulo con el sumidero de mensajes de la consola de la aplicación.
+
+Los hilos de trabajo escriben en una cola sin tocar Tkinter; un ciclo periódico
+(root.after) en el hilo de la interfaz vacía la cola por lotes, inserta las líneas
+en el ScrolledText, lo recorta a un máximo de líneas (buffer circular) y replica
+los mensajes a un archivo de log rotativo desde un hilo aparte.
+"""
+
+import logging
+import queue
+import time
+import tkinter as tk
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+LOG_LEVELS = {
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+class ConsoleLogSink:
+    """
+    Recibe mensajes desde cualquier hilo y los muestra en la consola de la GUI.
+    """
+
+    def __init__(self, root, text_widget, max_lines=1000, poll_interval_ms=100,
+                 max_batch=500, log_file=None, log_max_bytes=1_000_000, log_backup_count=3):
+        """
+        Args:
+            root (tk.Tk): Ventana raíz, usada para programar el vaciado de la cola.
+            text_widget (ScrolledText): Widget de la consola (en estado 'disabled').
+            max_lines (int): Líneas máximas que conserva el widget.
+            poll_interval_ms (int): Cada cuánto se vacía la cola.
+            max_batch (int): Líneas máximas insertadas por ciclo, para no bloquear la GUI.
+            log_file (str, opcional): Ruta del archivo de log. Si es None no se escribe a disco.
+            log_max_bytes (int): Tamaño a partir del cual se rota el archivo.
+            log_backup_count (int): Número de archivos rotados que se conservan.
+        """
+        self.root = root
+        self.text_widget = text_widget
+        self.max_lines = max(1, max_lines)
+        self.poll_interval_ms = poll_interval_ms
+        self.max_batch = max_batch
+        # SimpleQueue no necesita locks de Python para put(), así que los hilos
+        # de trabajo nunca esperan a la GUI.
+        self._queue = queue.SimpleQueue()
+        self._pump_job = None
+
+        self.text_widget.tag_configure("warning", foreground="#F1C40F")
+        self.text_widget.tag_configure("error", foreground="#E74C3C")
+
+        self._file_logger = None
+        self._file_listener = None
+        if log_file:
+            self._setup_file_mirror(
+                log_file, log_max_bytes, log_backup_count)
+
+    def _setup_file_mirror(self, log_file, max_bytes, backup_count):
+        """Configura la escritura asíncrona al archivo: el QueueListener escribe desde su propio hilo."""
+        try:
+            file_handler = RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        except OSError as e:
+            print(f"[WARNING] No se pudo abrir el archivo de log '{log_file}': {e}")
+            return
+        file_handler.setFormatter(logging.Formatter(
+            "%(asctime)s [%(levelname)s] %(message)s"))
+
+        file_queue = queue.SimpleQueue()
+        self._file_logger = logging.getLogger("sar_pm.console")
+        self._file_logger.setLevel(logging.INFO)
+        self._file_logger.propagate = False
+        self._file_logger.handlers = [QueueHandler(file_queue)]
+        self._file_listener = QueueListener(file_queue, file_handler)
+        self._file_listener.start()
+
+    def start(self):
+        """Inicia el ciclo periódico de vaciado de la cola."""
+        if self._pump_job is None:
+            self._pump_job = self.root.after(
+                self.poll_interval_ms, self._pump)
+
+    def write(self, message, level="info"):
+        """
+        Encola un mensaje. Es seguro llamarlo desde cualquier hilo.
+        """
+        timestamp = time.strftime("[%H:%M:%S]")
+        self._queue.put((f"{timestamp} {message}\n", level))
+        if self._file_logger:
+            self._file_logger.log(LOG_LEVELS.get(level, logging.INFO), message)
+        print(f"[{level.upper()}] {message}")
+
+    def _drain(self, limit):
+        """Saca hasta 'limit' mensajes de la cola."""
+        batch = []
+        try:
+            while len(batch) < limit:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _pump(self):
+        """Inserta en el widget, de una sola vez, los mensajes acumulados desde el último ciclo."""
+        self._pump_job = None
+        batch = self._drain(self.max_batch)
+        if batch:
+            # Si llegaron más líneas de las que caben, solo interesan las últimas.
+            batch = batch[-self.max_lines:]
+            insert_args = []
+            for text, level in batch:
+                insert_args.append(text)
+                insert_args.append(level if level in ("warning", "error") else ())
+            try:
+                self.text_widget.config(state='normal')
+                self.text_widget.insert(tk.END, *insert_args)
+                self._trim()
+                self.text_widget.see(tk.END)
+                self.text_widget.config(state='disabled')
+            except tk.TclError:
+                # El widget fue destruido (cierre de la aplicación).
+                return
+        self._pump_job = self.root.after(self.poll_interval_ms, self._pump)
+
+    def _trim(self):
+        """Elimina las líneas más antiguas cuando se supera el máximo configurado."""
+        # La última línea del widget siempre está vacía (tras el último '\n').
+        line_count = int(self.text_widget.index('end-1c').split('.')[0]) - 1
+        excess = line_count - self.max_lines
+        if excess > 0:
+            self.text_widget.delete('1.0', f'{excess + 1}.0')
+
+    def close(self):
+        """Detiene el ciclo de vaciado y espera a que el archivo de log termine de escribirse."""
+        if self._pump_job is not None:
+            try:
+                self.root.after_cancel(self._pump_job)
+            except tk.TclError:
+                pass
+            self._pump_job = None
+        if self._file_listener:
+            self._file_listener.stop()
+            self._file_listener = None
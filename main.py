@@ -9,7 +9,11 @@ Este script se encarga de:
 4. Lanzar la ventana de inicio de sesión (Login) o la aplicación principal directamente si el modo DEV está activado.
 """
 
+# Se importa primero para que el reporte de arranque mida desde el inicio del programa.
+from startup_timer import startup_timer
 import os
+import multiprocessing
+import threading
 import tkinter as tk
 from tkinter import messagebox
 import configparser
@@ -20,7 +24,8 @@ from cryptography.fernet import Fernet
 from config_handler import (leer_configuracion, generate_key, load_key,
                             encrypt_value, decrypt_value, crear_config_inicial)
 from login_window import LoginApplication
-from app_gui import App  # Importamos la clase principal de la aplicación
+# app_gui (y con él la BD y las pestañas) se importa al lanzar la app principal,
+# para que la ventana de login aparezca cuanto antes.
 
 # --- Constantes Globales ---
 KEY_FILE = "secret.key"
@@ -29,10 +34,25 @@ KEY_FILE = "secret.key"
 DEV_MODE = False
 
 
+def _precargar_app_gui():
+    """
+    Importa en segundo plano los módulos de la ventana principal mientras el
+    usuario escribe sus credenciales. Si falla, el error aparecerá al lanzar la app.
+    """
+    try:
+        import app_gui  # noqa: F401
+    except Exception:
+        pass
+
+
 def launch_main_app(config):
     """
     Inicializa y ejecuta la ventana principal de la aplicación.
     """
+    if not DEV_MODE:
+        startup_timer.mark("login", user_wait=True)
+    from app_gui import App  # Importamos la clase principal de la aplicación
+    startup_timer.mark("carga de módulos")
     main_root = tk.Tk()
     # Se crea una instancia de la clase App, que contiene toda la lógica de la GUI principal.
     app = App(main_root, config)
@@ -124,10 +144,15 @@ def main():
     print("--- PASO 7: Lanzando la ventana de Login... ---")
     login_root = tk.Tk()
     login_app = LoginApplication(login_root, config, fernet, launch_main_app)
+    startup_timer.mark("login visible")
+    threading.Thread(target=_precargar_app_gui, daemon=True).start()
     login_root.mainloop()
 
 
 if __name__ == "__main__":
+    # Los estados de cuenta se generan en un pool de procesos; en el ejecutable
+    # empaquetado de Windows, cada proceso hijo arranca desde aquí.
+    multiprocessing.freeze_support()
     print("--- INICIO DEL PROGRAMA ---")
     main()
     print("--- FIN DEL PROGRAMA ---")
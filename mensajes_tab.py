@@ -1,10 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
-import time
+from datetime import datetime
 from mysql.connector import IntegrityError, Error as MySQLError
-from selenium.common.exceptions import WebDriverException
 import ui_constants as const
+from progress_reporter import ProgressReporter, format_progress
+from send_pipeline import CampaignRunner, EmailPipeline, WhatsAppPipeline
+from statements import StatementGenerator
+from message_templates import PLACEHOLDERS, CompiledMessage, TemplateError, describir_placeholders
 
 
 class MensajesTab(ttk.Frame):
@@ -55,12 +58,10 @@ class MensajesTab(ttk.Frame):
             preset_messages_frame, wrap=tk.WORD, height=4)
         self.whatsapp_msg_text.pack(padx=5, pady=2, fill='both', expand=True)
 
-        placeholder_info = (
-            "Placeholders disponibles:\n"
-            "{nombre_contacto}, {cedula_rif}, {cantidad_multas_pendientes}"
-        )
+        placeholder_info = "Placeholders disponibles:\n" + \
+            ", ".join(f"{{{name}}}" for name in PLACEHOLDERS)
         ttk.Label(preset_messages_frame, text=placeholder_info, justify=tk.LEFT,
-                  relief="solid", padding=5).pack(fill='x', padx=5, pady=10)
+                  relief="solid", padding=5, wraplength=450).pack(fill='x', padx=5, pady=10)
 
         message_buttons_frame = ttk.Frame(preset_messages_frame)
         message_buttons_frame.pack(pady=10)
@@ -99,6 +100,40 @@ class MensajesTab(ttk.Frame):
                         variable=self.send_email_var).pack(side=tk.LEFT, padx=10)
         ttk.Checkbutton(send_options_frame, text="Enviar WhatsApp",
                         variable=self.send_whatsapp_var).pack(side=tk.LEFT, padx=10)
+        self.attach_statement_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(send_options_frame, text="Adjuntar estado de cuenta (PDF)",
+                        variable=self.attach_statement_var).pack(side=tk.LEFT, padx=10)
+        self.schedule_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(send_options_frame, text="Programar (horario y cuotas)",
+                        variable=self.schedule_var).pack(side=tk.LEFT, padx=10)
+
+        recipients_frame = ttk.LabelFrame(action_frame, text="Destinatarios")
+        recipients_frame.pack(pady=5, padx=10, fill=tk.X)
+        self.recipients_mode_var = tk.StringVar(value="seleccionados")
+        ttk.Radiobutton(recipients_frame, text="Seleccionados en la página actual",
+                        variable=self.recipients_mode_var, value="seleccionados").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(recipients_frame, text="Todos los que coinciden con la búsqueda",
+                        variable=self.recipients_mode_var, value="busqueda").pack(side=tk.LEFT, padx=5)
+        ttk.Radiobutton(recipients_frame, text="Con multas pendientes",
+                        variable=self.recipients_mode_var, value="pendientes").pack(side=tk.LEFT, padx=5)
+        ttk.Label(recipients_frame, text="Desde:").pack(side=tk.LEFT, padx=(10, 2))
+        self.pending_from_entry = ttk.Entry(recipients_frame, width=11)
+        self.pending_from_entry.pack(side=tk.LEFT)
+        ttk.Label(recipients_frame, text="Hasta:").pack(side=tk.LEFT, padx=(5, 2))
+        self.pending_to_entry = ttk.Entry(recipients_frame, width=11)
+        self.pending_to_entry.pack(side=tk.LEFT)
+        ttk.Label(recipients_frame, text="(AAAA-MM-DD, opcional)").pack(
+            side=tk.LEFT, padx=5)
+
+        dedup_frame = ttk.Frame(action_frame)
+        dedup_frame.pack(padx=10, fill=tk.X)
+        ttk.Label(dedup_frame, text="Omitir contactados en los últimos").pack(side=tk.LEFT, padx=(5, 2))
+        self.dedup_days_var = tk.IntVar(
+            value=self.controller.config.getint('history', 'dedup_days', fallback=0))
+        ttk.Spinbox(dedup_frame, from_=0, to=365, width=5,
+                    textvariable=self.dedup_days_var).pack(side=tk.LEFT)
+        ttk.Label(dedup_frame, text="días (0 = no omitir; solo búsqueda y multas pendientes)").pack(
+            side=tk.LEFT, padx=5)
 
         progress_frame = ttk.Frame(action_frame)
         progress_frame.pack(pady=5, fill=tk.X, padx=10)
@@ -110,12 +145,15 @@ class MensajesTab(ttk.Frame):
 
         send_buttons_frame = ttk.Frame(action_frame)
         send_buttons_frame.pack(pady=10)
-        self.btn_send = tk.Button(send_buttons_frame, text="Enviar a Seleccionados",
+        self.btn_send = tk.Button(send_buttons_frame, text="Iniciar Envío",
                                   **const.BUTTON_STYLE, command=self.iniciar_envio_thread)
         self.btn_send.pack(side=tk.LEFT, padx=10)
         self.btn_test_send = tk.Button(
             send_buttons_frame, text="Probar Envío", **const.BUTTON_STYLE, command=self.test_send)
         self.btn_test_send.pack(side=tk.LEFT, padx=10)
+        self.btn_resume_campaign = tk.Button(
+            send_buttons_frame, text="Reanudar Campaña", **const.BUTTON_STYLE, command=self.reanudar_campana)
+        self.btn_resume_campaign.pack(side=tk.LEFT, padx=10)
 
         self.clear_message_fields()
 
@@ -127,52 +165,52 @@ class MensajesTab(ttk.Frame):
 
     def _cargar_mensajes_task(self):
         try:
+            # Una sola consulta trae también los textos: cambiar de mensaje en el
+            # combobox ya no toca la BD.
             messages = self.controller.db_manager.get_preset_messages()
 
             def update_gui():
                 self.preset_message_options = [
                     msg['nombre'] for msg in messages]
-                self.messages_data = {msg['nombre']                                      : msg['id'] for msg in messages}
+                self.messages_data = {msg['nombre']: msg for msg in messages}
                 self.preset_message_combobox.config(
                     values=self.preset_message_options)
                 self.controller.log_to_console(
                     f"Mensajes predefinidos cargados: {len(messages)}.")
             self.controller.root.after(0, update_gui)
         except MySQLError as e:
-            self.controller.root.after(0, lambda: self.controller.log_to_console(
-                f"Error al cargar mensajes: {e}", "error"))
+            self.controller.log_to_console(
+                f"Error al cargar mensajes: {e}", "error")
 
     def load_selected_message(self, event=None):
-        if not self.controller.db_manager:
-            return
         name = self.preset_message_combobox.get()
-        msg_id = self.messages_data.get(name)
-        if not msg_id:
+        msg = self.messages_data.get(name)
+        if not msg:
             return
-        try:
-            msg = self.controller.db_manager.get_message_details(msg_id)
-            if msg:
-                self.message_name_entry.delete(0, tk.END)
-                self.message_name_entry.insert(0, msg['nombre'])
-                self.subject_entry.delete(0, tk.END)
-                self.subject_entry.insert(0, msg.get('asunto_email', ''))
-                self.email_body_text.delete("1.0", tk.END)
-                self.email_body_text.insert("1.0", msg.get('cuerpo_email', ''))
-                self.whatsapp_msg_text.delete("1.0", tk.END)
-                self.whatsapp_msg_text.insert(
-                    "1.0", msg.get('mensaje_whatsapp', ''))
-                self.editing_message_id = msg['id']
-                self.btn_update_message.config(
-                    state=tk.NORMAL, **const.BUTTON_STYLE)
-                self.btn_delete_message.config(
-                    state=tk.NORMAL, **const.BUTTON_STYLE)
-                self.btn_save_message.config(
-                    state=tk.DISABLED, **const.DISABLED_BUTTON_STYLE)
-                self.controller.log_to_console(
-                    f"Mensaje '{msg['nombre']}' cargado.")
-        except MySQLError as e:
-            self.controller.root.after(0, lambda: self.controller.log_to_console(
-                f"Error al cargar mensaje '{name}': {e}", "error"))
+        self.message_name_entry.delete(0, tk.END)
+        self.message_name_entry.insert(0, msg['nombre'])
+        self.subject_entry.delete(0, tk.END)
+        self.subject_entry.insert(0, msg.get('asunto_email') or '')
+        self.email_body_text.delete("1.0", tk.END)
+        self.email_body_text.insert("1.0", msg.get('cuerpo_email') or '')
+        self.whatsapp_msg_text.delete("1.0", tk.END)
+        self.whatsapp_msg_text.insert(
+            "1.0", msg.get('mensaje_whatsapp') or '')
+        self.editing_message_id = msg['id']
+        self.btn_update_message.config(
+            state=tk.NORMAL, **const.BUTTON_STYLE)
+        self.btn_delete_message.config(
+            state=tk.NORMAL, **const.BUTTON_STYLE)
+        self.btn_save_message.config(
+            state=tk.DISABLED, **const.DISABLED_BUTTON_STYLE)
+        self.controller.log_to_console(
+            f"Mensaje '{msg['nombre']}' cargado.")
+
+    def _on_message_saved(self, log_message):
+        """Tras guardar/actualizar/eliminar en la BD: se ejecuta en el hilo de Tk."""
+        self.controller.log_to_console(log_message)
+        self.clear_message_fields()
+        self._cargar_mensajes_thread()
 
     def save_message(self):
         if not self.controller.db_manager:
@@ -185,15 +223,18 @@ class MensajesTab(ttk.Frame):
         subject = self.subject_entry.get()
         email_body = self.email_body_text.get("1.0", tk.END)
         whatsapp_msg = self.whatsapp_msg_text.get("1.0", tk.END)
+        threading.Thread(target=self._save_message_task, args=(
+            name, subject, email_body, whatsapp_msg), daemon=True).start()
+
+    def _save_message_task(self, name, subject, email_body, whatsapp_msg):
         try:
             self.controller.db_manager.save_message(
                 name, subject, email_body, whatsapp_msg)
-            self.controller.log_to_console(f"Mensaje '{name}' guardado.")
-            self.clear_message_fields()
-            self._cargar_mensajes_thread()
+            self.controller.root.after(
+                0, self._on_message_saved, f"Mensaje '{name}' guardado.")
         except IntegrityError:
-            messagebox.showerror(
-                "Error", f"Ya existe un mensaje con el nombre '{name}'.", parent=self.controller.root)
+            self.controller.root.after(0, lambda: messagebox.showerror(
+                "Error", f"Ya existe un mensaje con el nombre '{name}'.", parent=self.controller.root))
         except MySQLError as e:
             self.controller.log_to_console(
                 f"Error al guardar mensaje: {e}", "error")
@@ -211,16 +252,18 @@ class MensajesTab(ttk.Frame):
         subject = self.subject_entry.get()
         email_body = self.email_body_text.get("1.0", tk.END)
         whatsapp_msg = self.whatsapp_msg_text.get("1.0", tk.END)
+        threading.Thread(target=self._update_message_task, args=(
+            self.editing_message_id, name, subject, email_body, whatsapp_msg), daemon=True).start()
+
+    def _update_message_task(self, message_id, name, subject, email_body, whatsapp_msg):
         try:
             self.controller.db_manager.update_message(
-                self.editing_message_id, name, subject, email_body, whatsapp_msg)
-            self.controller.log_to_console(
-                f"Mensaje '{name}' actualizado correctamente.")
-            self.clear_message_fields()
-            self._cargar_mensajes_thread()
+                message_id, name, subject, email_body, whatsapp_msg)
+            self.controller.root.after(
+                0, self._on_message_saved, f"Mensaje '{name}' actualizado correctamente.")
         except IntegrityError:
-            messagebox.showerror(
-                "Error de Duplicado", f"Ya existe otro mensaje con el nombre '{name}'.", parent=self.controller.root)
+            self.controller.root.after(0, lambda: messagebox.showerror(
+                "Error de Duplicado", f"Ya existe otro mensaje con el nombre '{name}'.", parent=self.controller.root))
         except MySQLError as e:
             self.controller.log_to_console(
                 f"Error al actualizar mensaje: {e}", "error")
@@ -232,16 +275,17 @@ class MensajesTab(ttk.Frame):
             return
         message_name = self.message_name_entry.get()
         if messagebox.askyesno("Confirmar Eliminación", f"¿Seguro que quieres eliminar el mensaje '{message_name}'?", parent=self.controller.root):
-            try:
-                self.controller.db_manager.delete_message(
-                    self.editing_message_id)
-                self.controller.log_to_console(
-                    f"Mensaje '{message_name}' eliminado.")
-                self.clear_message_fields()
-                self._cargar_mensajes_thread()
-            except MySQLError as e:
-                self.controller.log_to_console(
-                    f"Error al eliminar mensaje: {e}", "error")
+            threading.Thread(target=self._delete_message_task, args=(
+                self.editing_message_id, message_name), daemon=True).start()
+
+    def _delete_message_task(self, message_id, message_name):
+        try:
+            self.controller.db_manager.delete_message(message_id)
+            self.controller.root.after(
+                0, self._on_message_saved, f"Mensaje '{message_name}' eliminado.")
+        except MySQLError as e:
+            self.controller.log_to_console(
+                f"Error al eliminar mensaje: {e}", "error")
 
     def clear_message_fields(self):
         self.message_name_entry.delete(0, tk.END)
@@ -259,12 +303,6 @@ class MensajesTab(ttk.Frame):
         self.controller.log_to_console("Campos de mensaje limpiados.")
 
     def iniciar_envio_thread(self):
-        contactos_a_enviar = self.controller.contactos_tab.get_selected_contacts()
-        if not contactos_a_enviar:
-            messagebox.showwarning(
-                "Advertencia", "Por favor, selecciona al menos un contacto.", parent=self.controller.root)
-            return
-
         enviar_email = self.send_email_var.get()
         enviar_whatsapp = self.send_whatsapp_var.get()
         if not enviar_email and not enviar_whatsapp:
@@ -283,112 +321,445 @@ class MensajesTab(ttk.Frame):
             messagebox.showwarning(
                 "Advertencia", "Para enviar por WhatsApp, el mensaje no puede estar vacío.", parent=self.controller.root)
             return
+        if not self._validar_plantillas(subject, email_body, whatsapp_msg):
+            return
+
+        plantillas = (subject, email_body, whatsapp_msg,
+                      enviar_email, enviar_whatsapp, self.attach_statement_var.get(), self.schedule_var.get())
+        modo = self.recipients_mode_var.get()
+
+        # Los destinatarios se resuelven en la BD y los filtros se guardan con la campaña
+        if not self.controller.db_manager:
+            self.controller.log_to_console(
+                "Operación cancelada: sin conexión a la BD.", "error")
+            return
+
+        if modo == "seleccionados":
+            # Si la pestaña de Contactos aún no se ha abierto, no hay nada seleccionado
+            contactos_tab = self.controller.contactos_tab
+            contactos_a_enviar = contactos_tab.get_selected_contacts() if contactos_tab else []
+            if not contactos_a_enviar:
+                messagebox.showwarning(
+                    "Advertencia", "Por favor, selecciona al menos un contacto.", parent=self.controller.root)
+                return
+            self._lanzar_envio({'cedulas': [str(contacto['id']) for contacto in contactos_a_enviar]},
+                               len(contactos_a_enviar), plantillas)
+            return
+
+        if modo == "busqueda":
+            contactos_tab = self.controller.contactos_tab
+            filtros = contactos_tab.get_recipient_filters() if contactos_tab else {}
+        else:
+            fecha_desde = self.pending_from_entry.get().strip() or None
+            fecha_hasta = self.pending_to_entry.get().strip() or None
+            for fecha in (fecha_desde, fecha_hasta):
+                if fecha:
+                    try:
+                        datetime.strptime(fecha, '%Y-%m-%d')
+                    except ValueError:
+                        messagebox.showwarning(
+                            "Advertencia", f"La fecha '{fecha}' no tiene el formato AAAA-MM-DD.", parent=self.controller.root)
+                        return
+            filtros = {'solo_pendientes': True,
+                       'fecha_desde': fecha_desde, 'fecha_hasta': fecha_hasta}
+
+        try:
+            dias = self.dedup_days_var.get()
+        except tk.TclError:
+            dias = -1
+        if dias < 0:
+            messagebox.showwarning(
+                "Advertencia", "Los días para omitir contactados deben ser un número entero (0 o más).",
+                parent=self.controller.root)
+            return
+        if dias:
+            # Se omite a quien recibió algo por los mismos canales de esta campaña
+            filtros = dict(filtros, excluir_contactados_dias=dias,
+                           canales=[canal for canal, activo in (('email', enviar_email),
+                                                                ('whatsapp', enviar_whatsapp)) if activo])
+
+        threading.Thread(target=self._contar_destinatarios_task,
+                         args=(filtros, plantillas), daemon=True).start()
+
+    def _validar_plantillas(self, subject, email_body, whatsapp_msg):
+        """Compila las plantillas para detectar placeholders mal escritos antes de enviar."""
+        try:
+            CompiledMessage(subject, email_body, whatsapp_msg)
+        except TemplateError as e:
+            messagebox.showwarning(
+                "Placeholders Inválidos", f"{e}\n\nPlaceholders disponibles:\n{describir_placeholders()}", parent=self.controller.root)
+            return False
+        return True
+
+    def _contar_destinatarios_task(self, filtros, plantillas):
+        """Cuenta en la BD los destinatarios de la campaña antes de pedir confirmación."""
+        try:
+            total = self.controller.db_manager.count_campaign_recipients(
+                filtros)
+            self.controller.root.after(
+                0, self._confirmar_envio_masivo, filtros, total, plantillas)
+        except MySQLError as e:
+            self.controller.root.after(0, self.controller.log_to_console,
+                                       f"Error al resolver destinatarios: {e}", "error")
 
+    def _confirmar_envio_masivo(self, filtros, total, plantillas):
+        if total == 0:
+            messagebox.showinfo(
+                "Sin Destinatarios", "Ningún contacto coincide con los filtros seleccionados.", parent=self.controller.root)
+            return
+        if not messagebox.askyesno("Confirmar Envío", f"Se enviará el mensaje a {total} contacto(s).\n¿Deseas continuar?", parent=self.controller.root):
+            self.controller.log_to_console("Envío masivo cancelado.")
+            return
+        self._lanzar_envio(filtros, total, plantillas)
+
+    def _lanzar_envio(self, filtros, total_contacts, plantillas):
+        """
+        Inicia el hilo de envío de una campaña. La campaña toma el nombre del
+        mensaje cargado (o 'Campaña') y la fecha, y queda registrada en la BD
+        para poder reanudarla.
+
+        Args:
+            filtros (dict): Filtros de destinatarios (ver DatabaseManager._build_campaign_filter);
+                se resuelven en la BD dentro del hilo.
+            total_contacts (int): Número total de destinatarios, para el aviso inicial.
+            plantillas (tuple): (asunto, cuerpo email, mensaje WhatsApp, enviar_email,
+                enviar_whatsapp, adjuntar_estado, programar).
+        """
         self.progress_bar['value'] = 0
         self.progress_label.config(
-            text=f"Progreso: 0/{len(contactos_a_enviar)}")
+            text=f"Progreso: 0/{total_contacts}")
         self.controller.log_to_console(
-            f"Iniciando envío a {len(contactos_a_enviar)} contactos...")
-        threading.Thread(target=self._enviar_mensajes_task, args=(contactos_a_enviar, subject,
-                         email_body, whatsapp_msg, enviar_email, enviar_whatsapp), daemon=True).start()
-
-    # En mensajes_tab.py, reemplaza el método _enviar_mensajes_task por este:
-
-    def _enviar_mensajes_task(self, contactos_a_enviar, subject_template, email_body_template, whatsapp_msg_template, enviar_email, enviar_whatsapp):
-        self.controller.driver = None
-        if enviar_whatsapp:
-            try:
-                self.controller.driver = self.controller.services_manager.init_selenium_driver()
-                if self.controller.driver:
-                    self.controller.root.after(0, lambda: self.controller.log_to_console(
-                        "Driver de Selenium inicializado. Cargando WhatsApp Web..."))
-                    self.controller.driver.get("https://web.whatsapp.com/")
-                    timeout = float(
-                        self.controller.config['selenium']['page_load_timeout'])
-                    from selenium.webdriver.support.ui import WebDriverWait
-                    from selenium.webdriver.support import expected_conditions as EC
-                    from selenium.webdriver.common.by import By
-                    WebDriverWait(self.controller.driver, timeout).until(
-                        EC.presence_of_element_located((By.XPATH, '//*[@id="side"]')))
-                    self.controller.root.after(0, lambda: self.controller.log_to_console(
-                        "WhatsApp Web cargado. Asegúrate de tener la sesión iniciada."))
-            except Exception as e:
-                self.controller.root.after(0, lambda: messagebox.showerror(
-                    "Error de Selenium", f"No se pudo iniciar el navegador o cargar WhatsApp Web:\n{e}", parent=self.controller.root))
-                self.controller.driver = None
-
-        total_contacts = len(contactos_a_enviar)
-        for i, contacto in enumerate(contactos_a_enviar):
-            # --- INICIO DE LA LÓGICA DE PERSONALIZACIÓN ---
-
-            # 1. Obtener datos de multas pendientes para este contacto específico
-            cantidad_multas = self.controller.db_manager.get_pending_fines_count_for_contact(
-                contacto['id'])
-            # 4. Crear el diccionario de placeholders y sus valores
-            placeholders = {
-                "{nombre_contacto}": contacto.get('nombre', ''),
-                "{cedula_rif}": contacto.get('id', ''),
-                "{cantidad_multas_pendientes}": str(cantidad_multas),
-            }
-
-            # 5. Reemplazar los placeholders en las plantillas de mensajes
-            personalized_subject = subject_template
-            personalized_email_body = email_body_template
-            personalized_whatsapp_msg = whatsapp_msg_template
-
-            for key, value in placeholders.items():
-                personalized_subject = personalized_subject.replace(
-                    key, str(value))
-                personalized_email_body = personalized_email_body.replace(
-                    key, str(value))
-                personalized_whatsapp_msg = personalized_whatsapp_msg.replace(
-                    key, str(value))
-
-            # --- FIN DE LA LÓGICA DE PERSONALIZACIÓN ---
-
-            # Actualizamos la GUI
-            progress_value = ((i + 1) / total_contacts) * 100
-            self.controller.root.after(
-                0, lambda p=progress_value: self.progress_bar.config(value=p))
-            self.controller.root.after(
-                0, lambda c=i+1, t=total_contacts: self.progress_label.config(text=f"Progreso: {c}/{t}"))
-            self.controller.root.after(
-                0, self.controller.log_to_console, f"Procesando a {contacto['nombre']}...")
-
-            # Enviamos los mensajes ya personalizados
-            if enviar_email and contacto.get('email') and contacto.get('email') != "N/A":
-                try:
-                    self.controller.services_manager.send_email(
-                        contacto['email'], personalized_subject, personalized_email_body)
-                    self.controller.root.after(
-                        0, lambda n=contacto['nombre']: self.controller.log_to_console(f"Email enviado a {n}."))
-                except Exception as e:
-                    self.controller.root.after(0, lambda n=contacto['nombre'], err=e: self.controller.log_to_console(
-                        f"Error al enviar email a {n}: {err}", "error"))
-
-            if enviar_whatsapp and contacto.get('telefono') and contacto.get('telefono') != "N/A" and self.controller.driver:
-                try:
-                    self.controller.services_manager.send_whatsapp_message(
-                        self.controller.driver, contacto['telefono'], personalized_whatsapp_msg)
-                    self.controller.root.after(0, lambda n=contacto['nombre']: self.controller.log_to_console(
-                        f"Mensaje WhatsApp enviado a {n}."))
-                except Exception as e:
-                    self.controller.root.after(0, lambda n=contacto['nombre'], err=e: self.controller.log_to_console(
-                        f"Error al enviar WhatsApp a {n}: {err}", "error"))
-
-            time.sleep(
-                float(self.controller.config['selenium']['inter_message_delay']))
-
-        if self.controller.driver:
-            self.controller.driver.quit()
-            self.controller.driver = None
-
-        self.controller.root.after(
-            0, lambda: self.controller.log_to_console("Proceso de envío finalizado."))
-        self.controller.root.after(
-            0, lambda: self.progress_bar.config(value=0))
-        self.controller.root.after(
-            0, lambda: self.progress_label.config(text="Progreso: 0/0"))
+            f"Iniciando envío a {total_contacts} contactos...")
+        plantilla = self.message_name_entry.get().strip() or None
+        campana_nombre = f"{plantilla or 'Campaña'} {datetime.now():%Y-%m-%d %H:%M}"
+        threading.Thread(target=self._enviar_campana_task,
+                         args=(filtros,) + plantillas + (campana_nombre, plantilla),
+                         daemon=True).start()
+
+    def _iterar_destinatarios(self, lotes_destinatarios):
+        """Aplana los lotes de destinatarios; si la lectura en la BD falla, termina el recorrido."""
+        try:
+            for lote in lotes_destinatarios:
+                yield from lote
+        except MySQLError as e:
+            self.controller.root.after(0, self.controller.log_to_console,
+                                       f"Error al leer destinatarios de la BD, envío detenido: {e}", "error")
+
+    def _iniciar_whatsapp(self):
+        """
+        Reserva la sesión de WhatsApp Web (se reutiliza entre envíos) desde el hilo
+        de trabajo. Devuelve el driver, o None si no está disponible; en ese caso
+        no hay que llamar a _liberar_whatsapp().
+        """
+        try:
+            driver = self.controller.services_manager.whatsapp_session.acquire(
+                log=self.controller.log_to_console)
+        except Exception as e:
+            self.controller.root.after(0, lambda err=e: messagebox.showerror(
+                "Error de Selenium", f"No se pudo iniciar el navegador o cargar WhatsApp Web:\n{err}", parent=self.controller.root))
+            return None
+        if driver is None:
+            self.controller.services_manager.whatsapp_session.release()
+        return driver
+
+    def _liberar_whatsapp(self, driver):
+        """Devuelve la sesión de WhatsApp Web; el navegador queda abierto para el próximo envío."""
+        if driver is not None:
+            self.controller.services_manager.whatsapp_session.release()
+
+    def _crear_runner(self, progreso, canales, plantillas=("", "", ""), driver=None, adjuntar_estado=False):
+        """
+        Prepara el CampaignRunner con un pipeline por canal: el email sale en
+        paralelo y limitado por las cuotas de [smtp], WhatsApp en su propio hilo
+        con la pausa de [selenium]. Con 'adjuntar_estado', cada email lleva el
+        estado de cuenta del contacto (sección [pdf]); si se encola sin enviar,
+        'canales' puede ir vacío.
+        """
+        estados_cuenta = None
+        if adjuntar_estado:
+            services_manager = self.controller.services_manager
+            estados_cuenta = StatementGenerator.from_config(
+                services_manager.config, services_manager.header_image_path())
+        runner = CampaignRunner(
+            self.controller.services_manager, self.controller.db_manager, plantillas,
+            progress=progreso, log=self.controller.log_to_console, estados_cuenta=estados_cuenta)
+        if 'email' in canales:
+            runner.add_pipeline(EmailPipeline(
+                self.controller.services_manager, runner.on_result, log=self.controller.log_to_console,
+                db_manager=self.controller.db_manager))
+        if 'whatsapp' in canales:
+            if driver:
+                runner.add_pipeline(WhatsAppPipeline.from_config(
+                    self.controller.services_manager, driver, runner.on_result,
+                    log=self.controller.log_to_console))
+            else:
+                self.controller.log_to_console(
+                    "WhatsApp no disponible: sus mensajes quedan pendientes.", "warning")
+        return runner
+
+    def _enviar_mensajes_task(self, lotes_destinatarios, total_contacts, subject_template, email_body_template,
+                              whatsapp_msg_template, enviar_email, enviar_whatsapp, adjuntar_estado=False):
+        """
+        Hilo de envío directo, sin bandeja de salida ni historial (envío de prueba).
+        """
+        canales = [canal for canal, activo in (('email', enviar_email), ('whatsapp', enviar_whatsapp)) if activo]
+        plantillas = (subject_template, email_body_template, whatsapp_msg_template)
+        driver = self._iniciar_whatsapp() if enviar_whatsapp else None
+        progreso = ProgressReporter(self._actualizar_progreso_envio, root=self.controller.root,
+                                    title="Envío", total=total_contacts, unit="contactos").start()
+        runner = None
+        try:
+            runner = self._crear_runner(progreso, canales, plantillas, driver, adjuntar_estado and enviar_email)
+            resumen = runner.run(
+                self._iterar_destinatarios(lotes_destinatarios))
+            for canal, stats in resumen['channels'].items():
+                nombre_canal = "Emails" if canal == "email" else "WhatsApp"
+                self.controller.log_to_console(
+                    f"{nombre_canal}: {stats['sent']} enviados, {stats['failed']} con error.")
+            progreso.finish()
+        except Exception as e:
+            self.controller.log_to_console(f"Error durante el envío: {e}", "error")
+            progreso.finish("Error")
+        finally:
+            self._finalizar_envio(runner, driver, progreso, "Proceso de envío finalizado.")
+
+    def _enviar_campana_task(self, filtros, subject_template, email_body_template, whatsapp_msg_template,
+                             enviar_email, enviar_whatsapp, adjuntar_estado=False, programar=False,
+                             campana_nombre=None, plantilla=None):
+        """
+        Hilo de envío de una campaña: los mensajes pasan por la bandeja de salida
+        de la BD y quedan en el historial de envíos (con 'plantilla', el nombre
+        del mensaje). La campaña sigue 'preparando' hasta que todos sus
+        destinatarios están encolados; si algo falla antes, al reanudarla se
+        termina de encolar con los filtros y las plantillas guardados. Con
+        'programar', la campaña solo se encola y la envía el programador
+        (campaign_scheduler.py) dentro del horario y las cuotas.
+        """
+        canales = [canal for canal, activo in (('email', enviar_email), ('whatsapp', enviar_whatsapp)) if activo]
+        plantillas = (subject_template, email_body_template, whatsapp_msg_template)
+        adjuntar_estado = adjuntar_estado and enviar_email
+        driver = self._iniciar_whatsapp() if enviar_whatsapp and not programar else None
+        # El total se conoce al terminar de encolar: son mensajes, no contactos.
+        progreso = ProgressReporter(self._actualizar_progreso_envio, root=self.controller.root,
+                                    title="Envío", unit="mensajes").start()
+        runner = None
+        campana_id = None
+        tomada = False
+        try:
+            # Una campaña programada solo se encola: no necesita los pipelines.
+            runner = self._crear_runner(progreso, [] if programar else canales, plantillas, driver,
+                                        adjuntar_estado)
+            db_manager = self.controller.db_manager
+            campana_id = db_manager.create_campaign(
+                campana_nombre, canales, plantilla, filtros, plantillas, adjuntar_estado)
+            nuevos = runner.encolar_campana(db_manager.get_campaign(campana_id))
+            self.controller.log_to_console(
+                f"Campaña '{campana_nombre}' (#{campana_id}): {nuevos} mensajes en la bandeja de salida.")
+            if programar:
+                db_manager.schedule_campaign(campana_id)
+                self._log_programacion(campana_id)
+            elif not db_manager.claim_campaign(campana_id, ('preparando',)):
+                self.controller.log_to_console(
+                    f"La campaña #{campana_id} ya la está enviando otro proceso.", "warning")
+            else:
+                tomada = True
+                stats = runner.drenar(campana_id)
+                tomada = False
+                self._log_estadisticas_campana(campana_id, stats)
+            progreso.finish()
+        except Exception as e:
+            if tomada:
+                self._soltar_campana(campana_id)
+            origen = "Error de BD" if isinstance(e, MySQLError) else "Error"
+            if campana_id is None:
+                self.controller.log_to_console(f"{origen} al crear la campaña: {e}", "error")
+            else:
+                self.controller.log_to_console(
+                    f"{origen} durante la campaña #{campana_id} (se puede reanudar): {e}", "error")
+            progreso.finish("Error")
+        finally:
+            self._finalizar_envio(runner, driver, progreso, "Proceso de envío finalizado.")
+
+    def _soltar_campana(self, campana_id):
+        """Deja 'pausada' una campaña tomada cuyo envío falló, para poder reanudarla."""
+        try:
+            self.controller.db_manager.set_campaign_status(campana_id, 'pausada')
+        except MySQLError as e:
+            self.controller.log_to_console(
+                f"No se pudo pausar la campaña #{campana_id}: {e}", "error")
+
+    def _finalizar_envio(self, runner, driver, progreso, mensaje):
+        """Libera WhatsApp al terminar un hilo de envío, haya fallado o no, y registra el resultado."""
+        if runner is not None:
+            self._log_tiempos_whatsapp(runner)
+        self._liberar_whatsapp(driver)
+        self.controller.log_to_console(
+            f"{mensaje} {format_progress(progreso.snapshot())}")
+
+    def _log_estadisticas_campana(self, campana_id, stats):
+        for canal, conteo in stats.items():
+            nombre_canal = "Emails" if canal == "email" else "WhatsApp"
+            self.controller.log_to_console(
+                f"Campaña #{campana_id} · {nombre_canal}: {conteo['enviado']} enviados, "
+                f"{conteo['fallido']} con error, {conteo['pendiente']} pendientes.")
+
+    def _log_programacion(self, campana_id):
+        scheduler = self.controller.scheduler
+        if scheduler is None:
+            self.controller.log_to_console(
+                f"Campaña #{campana_id} programada, pero el programador está desactivado ([scheduler] enabled). "
+                "Se enviará al activarlo o con 'enviar_campana.py --programador'.", "warning")
+            return
+        db_manager = self.controller.db_manager
+        pendientes = {canal: conteo['pendiente'] for canal, conteo in
+                      db_manager.get_campaign_stats(campana_id).items()}
+        fin = scheduler.estimar_fin(pendientes, enviados_24h=db_manager.count_sent_since(24))
+        self.controller.log_to_console(
+            f"Campaña #{campana_id} programada: se enviará en horario {scheduler.window}; "
+            f"fin estimado según las cuotas diarias: {fin:%Y-%m-%d %H:%M}.")
+
+    def _log_tiempos_whatsapp(self, runner):
+        pipeline = runner.pipelines.get('whatsapp')
+        if pipeline:
+            self.controller.log_to_console(
+                f"Tiempos de WhatsApp: {pipeline.timings.summary()}")
+
+    # --- Reanudación de campañas ---
+
+    def reanudar_campana(self):
+        if not self.controller.db_manager:
+            self.controller.log_to_console(
+                "Operación cancelada: sin conexión a la BD.", "error")
+            return
+        threading.Thread(
+            target=self._cargar_campanas_pendientes_task, daemon=True).start()
+
+    def _minutos_inactiva(self):
+        return self.controller.config.getint('scheduler', 'stale_minutes', fallback=30)
+
+    def _cargar_campanas_pendientes_task(self):
+        try:
+            db_manager = self.controller.db_manager
+            # Las que quedaron 'enviando' al cerrarse la aplicación a mitad de envío
+            db_manager.release_stale_campaigns(self._minutos_inactiva())
+            campanas = db_manager.get_unfinished_campaigns()
+            self.controller.root.after(0, self._elegir_campana, campanas)
+        except MySQLError as e:
+            self.controller.root.after(0, self.controller.log_to_console,
+                                       f"Error al cargar campañas pendientes: {e}", "error")
+
+    def _elegir_campana(self, campanas):
+        """Muestra las campañas sin completar para elegir cuál reanudar."""
+        if not campanas:
+            messagebox.showinfo(
+                "Campañas", "No hay campañas pendientes de completar.", parent=self.controller.root)
+            return
+
+        dialog = tk.Toplevel(self.controller.root)
+        dialog.title("Reanudar Campaña")
+        dialog.transient(self.controller.root)
+        dialog.grab_set()
+        ttk.Label(dialog, text="Campañas sin completar:").pack(
+            padx=10, pady=(10, 5), anchor='w')
+        listbox = tk.Listbox(dialog, width=90, height=min(10, len(campanas)))
+        listbox.pack(padx=10, pady=5, fill=tk.BOTH, expand=True)
+        for campana in campanas:
+            listbox.insert(tk.END,
+                           f"#{campana['id']} · {campana['nombre']} · {campana['canales']} · "
+                           f"{campana['estado']} · {campana['enviados']}/{campana['total']} enviados, "
+                           f"{campana['pendientes']} pendientes, {campana['fallidos']} con error")
+        listbox.selection_set(0)
+
+        def on_reanudar():
+            seleccion = listbox.curselection()
+            if not seleccion:
+                return
+            campana = campanas[seleccion[0]]
+            if campana['estado'] == 'programada':
+                messagebox.showinfo(
+                    "Campaña Programada", "Esta campaña la envía el programador dentro del horario "
+                    "y las cuotas diarias; no se puede reanudar a mano.", parent=dialog)
+                return
+            if campana['estado'] == 'enviando':
+                messagebox.showinfo(
+                    "Campaña en Curso", "Esta campaña se está enviando en este momento.", parent=dialog)
+                return
+            dialog.destroy()
+            self.controller.log_to_console(
+                f"Reanudando campaña '{campana['nombre']}' (#{campana['id']})...")
+            threading.Thread(target=self._reanudar_campana_task,
+                             args=(campana,), daemon=True).start()
+
+        buttons = ttk.Frame(dialog)
+        buttons.pack(pady=10)
+        tk.Button(buttons, text="Reanudar", **const.BUTTON_STYLE,
+                  command=on_reanudar).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancelar", **const.BUTTON_STYLE,
+                  command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+
+    def _reanudar_campana_task(self, campana):
+        """
+        Drena lo que quedó pendiente de una campaña; los fallidos se reintentan.
+        Si se interrumpió mientras se preparaba, antes termina de encolarla. La
+        campaña se toma con DatabaseManager.claim_campaign, como hace el
+        programador, para que dos procesos no la envíen a la vez.
+        """
+        campana_id = campana['id']
+        canales = [canal for canal in campana['canales'].split(',') if canal]
+        driver = None
+        progreso = ProgressReporter(self._actualizar_progreso_envio, root=self.controller.root,
+                                    title="Envío", unit="mensajes").start()
+        runner = None
+        tomada = False
+        try:
+            db_manager = self.controller.db_manager
+            campana = db_manager.get_campaign(campana_id)
+            if campana is None:
+                raise ValueError("ya no existe")
+            if campana['estado'] == 'preparando':
+                if campana['filtros'] is None:
+                    raise ValueError("se interrumpió mientras se preparaba y no tiene guardados sus "
+                                     "destinatarios; créala de nuevo")
+                if not db_manager.is_campaign_idle(campana_id, self._minutos_inactiva()):
+                    raise ValueError("todavía se está preparando")
+            elif campana['estado'] != 'pausada':
+                raise ValueError(f"está '{campana['estado']}' y no se puede reanudar a mano")
+            elif not db_manager.claim_campaign(campana_id):
+                raise ValueError("otro proceso ya la está enviando")
+            else:
+                tomada = True
+            driver = self._iniciar_whatsapp() if 'whatsapp' in canales else None
+            runner = self._crear_runner(progreso, canales, campana['plantillas'], driver,
+                                        campana['adjuntar_estado'] and 'email' in canales)
+            if campana['estado'] == 'preparando':
+                nuevos = runner.encolar_campana(campana)
+                self.controller.log_to_console(
+                    f"Campaña #{campana_id}: preparación completada, {nuevos} mensajes más en la bandeja de salida.")
+                if not db_manager.claim_campaign(campana_id, ('preparando',)):
+                    raise ValueError("otro proceso la tomó mientras se preparaba")
+                tomada = True
+            reintentos = db_manager.requeue_failed_outbox(campana_id)
+            if reintentos:
+                self.controller.log_to_console(
+                    f"{reintentos} mensajes fallidos se reintentarán.")
+            stats = runner.drenar(campana_id)
+            tomada = False
+            self._log_estadisticas_campana(campana_id, stats)
+            progreso.finish()
+        except Exception as e:
+            if tomada:
+                self._soltar_campana(campana_id)
+            origen = "Error de BD" if isinstance(e, MySQLError) else "Error"
+            self.controller.log_to_console(
+                f"{origen} al reanudar la campaña #{campana_id}: {e}", "error")
+            progreso.finish("Error")
+        finally:
+            self._finalizar_envio(runner, driver, progreso, "Reanudación finalizada.")
+
+    def _actualizar_progreso_envio(self, snapshot):
+        """Refresca la barra y la etiqueta de progreso (se ejecuta en el hilo de Tk)."""
+        self.progress_bar.config(value=snapshot['percent'])
+        self.progress_label.config(text=format_progress(snapshot))
 
     def test_send(self):
         try:
@@ -415,9 +786,13 @@ class MensajesTab(ttk.Frame):
                     "Advertencia", "Selecciona un canal para la prueba.", parent=self.controller.root)
                 return
 
+            if not self._validar_plantillas(subject, email_body, whatsapp_msg):
+                return
+
             self.controller.log_to_console("Iniciando envío de prueba...")
             threading.Thread(target=self._enviar_mensajes_task, args=(
-                test_contact, subject, email_body, whatsapp_msg, enviar_email, enviar_whatsapp), daemon=True).start()
+                [test_contact], len(test_contact), subject, email_body, whatsapp_msg, enviar_email, enviar_whatsapp,
+                self.attach_statement_var.get()), daemon=True).start()
         except Exception as e:
             messagebox.showerror(
                 "Error", f"No se pudo realizar el envío de prueba.\nError: {e}", parent=self.controller.root)
@@ -0,0 +1,169 @@
+# message_templates.py
+"""
+Módulo de plantillas de mensajes para las campañas.
+
+Las plantillas (asunto, cuerpo del email y mensaje de WhatsApp) se analizan una
+sola vez por campaña: se validan sus placeholders y se convierten en una cadena
+de formato que luego se rellena para cada contacto con str.format_map, sin
+recorrer las plantillas ni hacer reemplazos sucesivos.
+
+Los campos derivados de las multas (total adeudado, expedientes pendientes,
+multa más antigua) salen de un resumen que se consulta en bloque para cada lote
+de destinatarios (DatabaseManager.get_pending_fine_summaries), no por contacto.
+
+Ejecutar este módulo directamente mide el renderizado de 100.000 destinatarios.
+"""
+
+import re
+
+PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+# Placeholders admitidos y su descripción para la interfaz.
+PLACEHOLDERS = {
+    'nombre_contacto': "Nombre del contacto",
+    'cedula_rif': "Cédula o RIF",
+    'cantidad_multas_pendientes': "Número de multas pendientes",
+    'total_adeudado': "Suma en Bs de las multas pendientes",
+    'expedientes_pendientes': "Lista de expedientes pendientes",
+    'fecha_multa_mas_antigua': "Fecha de la multa pendiente más antigua",
+}
+
+# Los que requieren el resumen de multas del contacto.
+FINE_PLACEHOLDERS = {
+    'cantidad_multas_pendientes', 'total_adeudado',
+    'expedientes_pendientes', 'fecha_multa_mas_antigua',
+}
+
+
+class TemplateError(ValueError):
+    """La plantilla usa placeholders que no existen."""
+
+
+class CompiledTemplate:
+    """
+    Plantilla analizada: el texto literal queda escapado y cada placeholder
+    válido se convierte en un campo de formato.
+    """
+
+    def __init__(self, text):
+        self.text = text or ""
+        self.fields = set()
+        unknown = []
+        parts = []
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(self.text):
+            name = match.group(1)
+            if name not in PLACEHOLDERS:
+                unknown.append(match.group(0))
+                continue
+            parts.append(self._escape(self.text[position:match.start()]))
+            parts.append("{" + name + "}")
+            self.fields.add(name)
+            position = match.end()
+        parts.append(self._escape(self.text[position:]))
+        if unknown:
+            raise TemplateError(
+                f"Placeholders no reconocidos: {', '.join(sorted(set(unknown)))}")
+        self._format = "".join(parts)
+        self._static = not self.fields
+
+    @staticmethod
+    def _escape(literal):
+        return literal.replace("{", "{{").replace("}", "}}")
+
+    def render(self, values):
+        """Devuelve el texto con los placeholders sustituidos por 'values'."""
+        if self._static:
+            return self.text
+        return self._format.format_map(values)
+
+
+class CompiledMessage:
+    """Las tres plantillas de una campaña (asunto, email y WhatsApp) ya compiladas."""
+
+    def __init__(self, subject, email_body, whatsapp_msg):
+        errors = []
+        compiled = []
+        for label, text in (("Asunto", subject), ("Cuerpo del email", email_body),
+                            ("Mensaje de WhatsApp", whatsapp_msg)):
+            try:
+                compiled.append(CompiledTemplate(text))
+            except TemplateError as e:
+                errors.append(f"{label}: {e}")
+        if errors:
+            raise TemplateError("\n".join(errors))
+        self.subject, self.email_body, self.whatsapp_msg = compiled
+        self.fields = self.subject.fields | self.email_body.fields | self.whatsapp_msg.fields
+        self.needs_fines = bool(self.fields & FINE_PLACEHOLDERS)
+
+    def render(self, contacto, resumen_multas=None):
+        """
+        Devuelve (asunto, cuerpo_email, mensaje_whatsapp) para un contacto.
+
+        Args:
+            contacto (dict): Claves 'id' y 'nombre'.
+            resumen_multas (dict, opcional): Resumen de multas pendientes del
+                contacto (ver get_pending_fine_summaries); None si no tiene.
+        """
+        values = valores_contacto(contacto, resumen_multas)
+        return (self.subject.render(values), self.email_body.render(values),
+                self.whatsapp_msg.render(values))
+
+
+def valores_contacto(contacto, resumen_multas=None):
+    """Construye el diccionario de valores de los placeholders para un contacto."""
+    resumen = resumen_multas or {}
+    fecha = resumen.get('fecha_mas_antigua')
+    return {
+        'nombre_contacto': contacto.get('nombre') or '',
+        'cedula_rif': contacto.get('id') or '',
+        'cantidad_multas_pendientes': resumen.get('cantidad', 0),
+        'total_adeudado': f"{resumen.get('total') or 0:,.2f}",
+        'expedientes_pendientes': resumen.get('expedientes') or '-',
+        # isoformat() da 'AAAA-MM-DD' y es varias veces más rápido que strftime
+        'fecha_multa_mas_antigua': fecha.isoformat()[:10] if fecha else '-',
+    }
+
+
+def describir_placeholders():
+    """Texto de ayuda con los placeholders disponibles, para la interfaz."""
+    return "\n".join(f"{{{name}}}: {description}" for name, description in PLACEHOLDERS.items())
+
+
+def _benchmark(n=100_000):
+    """Compara el renderizado compilado con el reemplazo sucesivo anterior."""
+    import time
+    from datetime import date
+
+    subject = "Aviso para {nombre_contacto} ({cedula_rif})"
+    body = ("Estimado/a {nombre_contacto}:\n\nSegún nuestros registros tiene "
+            "{cantidad_multas_pendientes} multa(s) pendiente(s) por {total_adeudado} Bs. "
+            "Expedientes: {expedientes_pendientes}. La más antigua es del "
+            "{fecha_multa_mas_antigua}.\n\nAtentamente, INEA.")
+    whatsapp = "Hola {nombre_contacto}, tiene {cantidad_multas_pendientes} multa(s) pendiente(s)."
+    contactos = [{'id': f"V-{i:08d}", 'nombre': f"Contacto {i}"} for i in range(n)]
+    resumen = {'cantidad': 3, 'total': 12345.5,
+               'expedientes': "EXP-1, EXP-2, EXP-3", 'fecha_mas_antigua': date(2023, 5, 17)}
+
+    started = time.perf_counter()
+    mensaje = CompiledMessage(subject, body, whatsapp)
+    for contacto in contactos:
+        mensaje.render(contacto, resumen)
+    compiled_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for contacto in contactos:
+        values = valores_contacto(contacto, resumen)
+        textos = [subject, body, whatsapp]
+        for key, value in values.items():
+            placeholder = "{" + key + "}"
+            textos = [texto.replace(placeholder, str(value)) for texto in textos]
+    replace_time = time.perf_counter() - started
+
+    print(f"{n:,} destinatarios")
+    print(f"  plantillas compiladas: {compiled_time:.2f} s ({n / compiled_time:,.0f} por segundo)")
+    print(f"  str.replace sucesivo:  {replace_time:.2f} s ({n / replace_time:,.0f} por segundo)")
+
+
+if __name__ == '__main__':
+    _benchmark()
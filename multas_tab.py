@@ -6,6 +6,7 @@ from datetime import datetime
 from tkcalendar import DateEntry
 from mysql.connector import IntegrityError, Error as MySQLError
 import ui_constants as const
+from db_manager import IMPORT_CHUNK_SIZE
 
 
 class MultasTab(ttk.Frame):
@@ -495,8 +496,16 @@ class MultasTab(ttk.Frame):
                     "Importación", "No se encontraron multas válidas para importar.", parent=self.controller.root))
                 return
 
-            insertadas_count = self.controller.db_manager.import_fines_from_list(
-                multas_a_insertar)
+            progreso = self.controller.create_progress_reporter(
+                "Importación de multas", total=len(multas_a_insertar)).start()
+            try:
+                # Una sola transacción: si falla, no queda ninguna multa importada
+                insertadas_count = self.controller.db_manager.import_fines_from_list(
+                    multas_a_insertar, progress=progreso)
+            except Exception:
+                progreso.finish("Error")
+                raise
+            progreso.finish()
             total_omitidas = len(multas_a_insertar) - \
                 insertadas_count + multas_omitidas
 
@@ -508,8 +517,8 @@ class MultasTab(ttk.Frame):
             self.controller.root.after(0, self._cargar_multas_thread)
 
         except Exception as e:
-            self.controller.root.after(0, lambda: messagebox.showerror(
-                "Error de Importación", f"Ocurrió un error inesperado.\nError: {e}", parent=self.controller.root))
+            self.controller.root.after(0, lambda err=e: messagebox.showerror(
+                "Error de Importación", f"Ocurrió un error inesperado.\nError: {err}", parent=self.controller.root))
 
     def export_multas_to_csv(self):
         """Abre el diálogo para guardar el CSV e inicia el hilo de exportación."""
@@ -549,23 +558,33 @@ class MultasTab(ttk.Frame):
             fieldnames = ['expediente_nro', 'cedula_rif', 'uc',
                           'bs', 'fecha_multa', 'fecha_pago', 'multa_pendiente']
 
-            with open(filepath, mode='w', newline='', encoding='utf-8-sig') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(multas_a_exportar)
+            progreso = self.controller.create_progress_reporter(
+                "Exportación de multas", total=len(multas_a_exportar)).start()
+            try:
+                with open(filepath, mode='w', newline='', encoding='utf-8-sig') as csvfile:
+                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                    writer.writeheader()
+                    for start in range(0, len(multas_a_exportar), IMPORT_CHUNK_SIZE):
+                        lote = multas_a_exportar[start:start + IMPORT_CHUNK_SIZE]
+                        writer.writerows(lote)
+                        progreso.advance(len(lote))
+            except Exception:
+                progreso.finish("Error")
+                raise
+            progreso.finish()
 
             self.controller.root.after(0, lambda: messagebox.showinfo(
                 "Exportación Exitosa", f"Se han exportado {len(multas_a_exportar)} multas a:\n{filepath}", parent=self.controller.root
             ))
 
         except Exception as e:
-            self.controller.root.after(0, lambda: messagebox.showerror(
-                "Error de Exportación", f"No se pudo guardar el archivo CSV.\nError: {e}", parent=self.controller.root))
+            self.controller.root.after(0, lambda err=e: messagebox.showerror(
+                "Error de Exportación", f"No se pudo guardar el archivo CSV.\nError: {err}", parent=self.controller.root))
 
     def open_report_filter_window(self):
         self.report_window = tk.Toplevel(self.controller.root)
         self.report_window.title("Generar Reporte Avanzado de Multas")
-        self.report_window.geometry("450x400")
+        self.report_window.geometry("450x470")
         self.report_window.transient(self.controller.root)
         self.report_window.grab_set()
         self.controller._center_toplevel(self.report_window)
@@ -577,6 +596,15 @@ class MultasTab(ttk.Frame):
         end_date_var = tk.StringVar()
         status_var = tk.StringVar(value="Todas")
         cedula_var = tk.StringVar()
+        tipos = {"Detalle de multas": "detalle", "Resumen por estado": "estado",
+                 "Resumen por mes": "mes", "Resumen por contacto": "contacto",
+                 "Resumen por descripción": "descripcion", "Resumen por U/C": "uc"}
+        tipo_var = tk.StringVar(value="Detalle de multas")
+
+        type_frame = ttk.LabelFrame(main_frame, text="Tipo de Reporte")
+        type_frame.pack(fill=tk.X, pady=5)
+        ttk.Combobox(type_frame, textvariable=tipo_var, values=list(tipos),
+                     state="readonly").pack(pady=5, padx=5)
 
         dates_frame = ttk.LabelFrame(
             main_frame, text="Filtrar por Rango de Fechas (Opcional)")
@@ -614,18 +642,18 @@ class MultasTab(ttk.Frame):
             cedula = cedula_var.get()
 
             self._ask_and_generate_advanced_report(
-                start_date, end_date, status, cedula)
+                start_date, end_date, status, cedula, tipos[tipo_var.get()])
             self.report_window.destroy()
 
         tk.Button(main_frame, text="Generar Reporte PDF", **
                   const.BUTTON_STYLE, command=on_generate).pack(pady=20)
 
-    def _ask_and_generate_advanced_report(self, start_date, end_date, status, cedula):
+    def _ask_and_generate_advanced_report(self, start_date, end_date, status, cedula, tipo="detalle"):
         filepath = filedialog.asksaveasfilename(
             title="Guardar Reporte de Multas",
             defaultextension=".pdf",
             filetypes=(("Archivos PDF", "*.pdf"),),
-            initialfile="Reporte_Avanzado_Multas.pdf",
+            initialfile="Reporte_Avanzado_Multas.pdf" if tipo == "detalle" else f"Resumen_Multas_{tipo}.pdf",
             parent=self.controller.root
         )
         if not filepath:
@@ -635,23 +663,43 @@ class MultasTab(ttk.Frame):
         self.controller.log_to_console(
             "Iniciando generación de reporte avanzado...")
         threading.Thread(target=self._generate_advanced_pdf_report_task,
-                         args=(filepath, start_date, end_date, status, cedula),
+                         args=(filepath, start_date, end_date, status, cedula, tipo),
                          daemon=True).start()
 
-    def _generate_advanced_pdf_report_task(self, filepath, start_date, end_date, status, cedula):
+    def _generate_advanced_pdf_report_task(self, filepath, start_date, end_date, status, cedula, tipo="detalle"):
+        """
+        Genera el reporte en un hilo. 'detalle' lista cada multa; los demás tipos
+        ('estado', 'mes', 'contacto', 'descripcion', 'uc') son resúmenes calculados en la BD, que
+        no leen las filas de detalle.
+        """
         if not self.controller.db_manager:
             self.controller.root.after(0, lambda: self.controller.log_to_console(
                 "Generación de PDF cancelada: sin conexión a la BD.", "error"))
             return
         try:
-            multas = self.controller.db_manager.get_fines_for_report(
-                start_date, end_date, status, cedula)
-            if not multas:
+            db_manager = self.controller.db_manager
+            cache = self.controller.report_cache
+            # Mismos filtros y mismos datos de multas: se copia el reporte ya generado
+            clave = cache.key(tipo, start_date, end_date, status, (cedula or "").strip(),
+                              self.controller.config.get('pdf', 'report_rows_per_volume', fallback='50000'),
+                              db_manager.get_data_version('multas'))
+            rutas = cache.get(clave, filepath)
+            if rutas is not None:
+                self.controller.root.after(0, self.controller.log_to_console,
+                                           "Reporte sin cambios desde la última vez: se reutiliza el de la caché.")
+                self._informar_reporte_guardado(filepath, rutas)
+                return
+
+            # El detalle también toma sus totales del ROLLUP: no se suman fila por fila
+            grupos, totales = db_manager.get_fines_summary(
+                "estado" if tipo == "detalle" else tipo, start_date, end_date, status, cedula)
+            total = totales['multas']
+            if not total:
                 self.controller.root.after(0, lambda: messagebox.showinfo(
                     "Sin Datos", "No se encontraron multas que coincidan con los filtros seleccionados.", parent=self.controller.root))
                 return
 
-            title = "Reporte Avanzado de Multas"
+            title = "Reporte Avanzado de Multas" if tipo == "detalle" else "Resumen de Multas"
             subtitle_parts = []
             if start_date:
                 subtitle_parts.append(f"Desde: {start_date}")
@@ -664,10 +712,43 @@ class MultasTab(ttk.Frame):
             if subtitle_parts:
                 title += f" ({', '.join(subtitle_parts)})"
 
-            self.controller.services_manager.generate_pdf_report(
-                multas, title, filepath)
-            self.controller.root.after(0, lambda: messagebox.showinfo(
-                "Éxito", f"Reporte PDF guardado en:\n{filepath}", parent=self.controller.root))
+            if tipo != "detalle":
+                self.controller.services_manager.generate_summary_report(
+                    tipo, grupos, totales, title, filepath)
+                self._guardar_en_cache(cache, clave, [filepath])
+                self._informar_reporte_guardado(filepath, [filepath])
+                return
+
+            # Las multas se leen y se dibujan por lotes: la memoria no crece con el reporte
+            progreso = self.controller.create_progress_reporter(
+                "Reporte PDF", total=total).start()
+            try:
+                rutas = self.controller.services_manager.generate_pdf_report_stream(
+                    db_manager.iter_fines_for_report(start_date, end_date, status, cedula),
+                    title, filepath, totales, progress=progreso)
+            except Exception:
+                progreso.finish("Error")
+                raise
+            progreso.finish()
+            self._guardar_en_cache(cache, clave, rutas)
+            self._informar_reporte_guardado(filepath, rutas)
         except Exception as e:
-            self.controller.root.after(0, lambda: self.controller.log_to_console(
-                f"Error al generar reporte PDF avanzado: {e}", "error"))
+            self.controller.log_to_console(
+                f"Error al generar reporte PDF avanzado: {e}", "error")
+
+    def _guardar_en_cache(self, cache, clave, rutas):
+        """Guarda el reporte en la caché; si falla (disco lleno, permisos), el reporte ya está guardado."""
+        try:
+            cache.put(clave, rutas)
+        except OSError as e:
+            self.controller.log_to_console(
+                f"No se pudo guardar el reporte en la caché: {e}", "warning")
+
+    def _informar_reporte_guardado(self, filepath, rutas):
+        if len(rutas) == 1:
+            mensaje = f"Reporte PDF guardado en:\n{filepath}"
+        else:
+            mensaje = (f"Reporte PDF guardado en {len(rutas)} volúmenes:\n"
+                       + "\n".join(rutas))
+        self.controller.root.after(0, lambda: messagebox.showinfo(
+            "Éxito", mensaje, parent=self.controller.root))
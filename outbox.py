@@ -0,0 +1,118 @@
+# outbox.py
+"""
+Módulo de apoyo para la bandeja de salida (tabla 'outbox') de las campañas.
+
+Una campaña primero escribe en la BD un mensaje ya personalizado por cada
+destinatario y canal, y después un proceso de envío drena los pendientes. Así,
+si la aplicación se cierra a mitad de campaña, se puede reanudar sin repetir a
+quienes ya recibieron el mensaje.
+
+El estado de cada envío se guarda por lotes desde un hilo propio para no hacer
+una escritura en la BD por mensaje. Si la aplicación se cierra antes de guardar
+un lote, esos mensajes siguen 'pendiente' y se reenvían al reanudar: la entrega
+es "al menos una vez", nunca se pierde un destinatario.
+
+En la misma transacción se anota cada envío en el historial (tabla
+'historial_envios'), que sobrevive a las campañas y sirve para no volver a
+notificar a quien ya se contactó hace poco.
+"""
+
+import hashlib
+import os
+import threading
+
+from mysql.connector import Error as MySQLError
+
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_ENVIADO = 'enviado'
+ESTADO_FALLIDO = 'fallido'
+
+
+def content_hash(canal, destino, asunto, cuerpo, adjunto=None):
+    """
+    Huella SHA-256 del mensaje ya personalizado. Junto con la campaña, identifica
+    un envío de forma única: volver a encolar el mismo mensaje no lo duplica.
+    El nombre del adjunto ya incluye la huella de su contenido (statements.py).
+    """
+    partes = (canal, destino or "", asunto or "", cuerpo or "")
+    if adjunto:
+        partes += (os.path.basename(adjunto),)
+    data = "\x00".join(partes)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class OutboxWriter:
+    """
+    Acumula los resultados de envío y los guarda en la tabla 'outbox' (y en el
+    historial de envíos) por lotes, cada 'flush_interval' segundos o al llegar a
+    'batch_size' resultados.
+    """
+
+    def __init__(self, db_manager, flush_interval=1.0, batch_size=200, log=None):
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.log = log or (lambda message, level="info": print(message))
+        self._buffer = []
+        self._historial = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def record(self, outbox_id, ok, error=None, attempts=1, historial=None):
+        """
+        Registra el resultado de un envío y cuántos intentos llevó. Seguro entre hilos.
+
+        Args:
+            historial (tuple, opcional): (cedula_rif, canal, plantilla, campana_id, destino)
+                para anotarlo en el historial de envíos. Los envíos cancelados antes de
+                intentarse (attempts = 0) no se anotan y siguen 'pendiente'.
+        """
+        if ok:
+            estado = ESTADO_ENVIADO
+        else:
+            estado = ESTADO_FALLIDO if attempts else ESTADO_PENDIENTE
+        with self._lock:
+            self._buffer.append((estado, error, attempts, outbox_id))
+            if historial and historial[0] and attempts:
+                self._historial.append(historial + (ok, error))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            historial, self._historial = self._historial, []
+        if not batch:
+            return
+        try:
+            self.db_manager.mark_outbox_results(batch, historial)
+        except MySQLError as e:
+            # Se devuelven al buffer para reintentarlo en el siguiente ciclo.
+            with self._lock:
+                self._buffer = batch + self._buffer
+                self._historial = historial + self._historial
+            self.log(
+                f"No se pudo guardar el estado de {len(batch)} envíos: {e}", "warning")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def close(self):
+        """Guarda los resultados pendientes y detiene el hilo."""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,186 @@
+# pdf_layout.py
+"""
+Módulo con el diseño común de los PDF de multas: encabezado institucional,
+título, tabla de multas y tabla de totales de los reportes resumidos.
+
+Lo usan los reportes de la pestaña de multas (ServicesManager.generate_pdf_report
+y generate_pdf_report_stream) y los estados de cuenta por contacto (statements.py). Estos últimos se generan
+en procesos aparte, así que aquí solo hay funciones de módulo que no dependen
+del resto de la aplicación.
+"""
+
+import warnings
+
+ANCHO_COLS = {'exp': 60, 'ced': 35, 'f_m': 30,
+              'f_p': 30, 'uc': 20, 'bs': 40, 'est': 30}
+HEADERS = ['Nro. Expediente', 'Cedula/RIF', 'Fecha Multa',
+           'Fecha Pago', 'U/C', 'Monto (Bs)', 'Estado']
+
+
+def nuevo_pdf(title, header_path=None):
+    """
+    Crea el PDF (A4 apaisado) con el encabezado institucional y el título.
+    Si no se encuentra la imagen del encabezado se escribe un aviso en su lugar.
+    """
+    from fpdf import FPDF
+    pdf = FPDF(orientation='L', unit='mm', format='A4')
+    pdf.add_page()
+
+    try:
+        if not header_path:
+            raise FileNotFoundError
+        ancho_pagina = pdf.w - pdf.l_margin - pdf.r_margin
+        pdf.image(header_path, x=pdf.l_margin,
+                  y=pdf.t_margin, w=ancho_pagina)
+        pdf.ln(25)
+    except FileNotFoundError:
+        # Si no encuentra la imagen, simplemente escribe un texto en el PDF
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(
+            0, 10, "Encabezado no disponible (header_inea.png no encontrado)", 0, 1, 'C')
+        pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, title, 0, 1, 'C')
+    pdf.ln(10)
+    return pdf
+
+
+def inicio_tabla(pdf):
+    """Posición X en la que empieza la tabla, centrada en la página."""
+    return (pdf.w - sum(ANCHO_COLS.values())) / 2
+
+
+def totales_multas(multas):
+    """
+    Totales de una lista de multas que ya está en memoria (los estados de cuenta),
+    con las mismas claves que la fila de totales de DatabaseManager.get_fines_summary.
+    Los reportes de la pestaña de multas toman los totales de la BD.
+    """
+    total = {'multas': 0, 'pagadas': 0, 'pendientes': 0,
+             'bs_pagado': 0, 'bs_pendiente': 0, 'bs_total': 0}
+    for multa in multas:
+        monto = multa.get('bs') or 0
+        if multa['multa_pendiente']:
+            total['pendientes'] += 1
+            total['bs_pendiente'] += monto
+        else:
+            total['pagadas'] += 1
+            total['bs_pagado'] += monto
+        total['multas'] += 1
+        total['bs_total'] += monto
+    return total
+
+
+def encabezado_tabla(pdf):
+    """Dibuja la fila de títulos de la tabla y deja la fuente lista para las filas."""
+    pdf.set_font("Arial", 'B', 10)
+    pdf.set_x(inicio_tabla(pdf))
+    widths = [ANCHO_COLS['exp'], ANCHO_COLS['ced'], ANCHO_COLS['f_m'],
+              ANCHO_COLS['f_p'], ANCHO_COLS['uc'], ANCHO_COLS['bs'], ANCHO_COLS['est']]
+    for i, header in enumerate(HEADERS):
+        pdf.cell(widths[i], 10, header, 1, 0, 'C')
+    pdf.ln()
+    pdf.set_font("Arial", '', 8)
+
+
+def tabla_multas(pdf, multas, progress=None):
+    """
+    Dibuja la tabla de multas.
+
+    Args:
+        progress (ProgressReporter, opcional): Recibe una unidad de avance por fila.
+    """
+    encabezado_tabla(pdf)
+    for multa in multas:
+        fila_multa(pdf, multa)
+        if progress:
+            progress.advance()
+
+
+def fila_multa(pdf, multa, repetir_encabezado=False):
+    """
+    Dibuja una fila de la tabla. Con 'repetir_encabezado', si la fila no cabe
+    en la página se empieza otra con los títulos de la tabla.
+    """
+    if repetir_encabezado and pdf.get_y() + 10 > pdf.page_break_trigger:
+        pdf.add_page()
+        encabezado_tabla(pdf)
+    posicion_x_inicio = inicio_tabla(pdf)
+    pdf.set_x(posicion_x_inicio)
+    estado = "Pendiente" if multa['multa_pendiente'] else "Pagada"
+    monto_bs_num = multa.get('bs') or 0.00
+
+    pdf.cell(ANCHO_COLS['exp'], 10, str(
+        multa['expediente_nro'])[:35], 1, 0, 'L')
+    pdf.cell(ANCHO_COLS['ced'], 10, str(
+        multa['cedula_rif']), 1, 0, 'L')
+    pdf.cell(ANCHO_COLS['f_m'], 10, multa['fecha_multa'].strftime(
+        '%Y-%m-%d') if multa.get('fecha_multa') else "-", 1, 0, 'C')
+    pdf.cell(ANCHO_COLS['f_p'], 10, multa['fecha_pago'].strftime(
+        '%Y-%m-%d') if multa.get('fecha_pago') else "---", 1, 0, 'C')
+    pdf.cell(ANCHO_COLS['uc'], 10, str(multa['uc']), 1, 0, 'C')
+    pdf.cell(ANCHO_COLS['bs'], 10, f"{monto_bs_num:,.2f}", 1, 0, 'R')
+
+    if multa['multa_pendiente']:
+        pdf.set_text_color(255, 0, 0)
+    else:
+        pdf.set_text_color(0, 128, 0)
+
+    pdf.cell(ANCHO_COLS['est'], 10, estado, 1, 0, 'C')
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln()
+
+
+def tabla_resumen(pdf, titulo_clave, filas, total):
+    """
+    Dibuja la tabla de un reporte resumido: una fila por grupo y la de totales.
+
+    Args:
+        titulo_clave (str): Título de la primera columna (p. ej. 'Mes').
+        filas (list): Tuplas (etiqueta, grupo), con 'grupo' como los de
+            DatabaseManager.get_fines_summary.
+        total (dict): Fila de totales (get_fines_summary).
+    """
+    columnas = [(titulo_clave, 85, 'L'), ('Multas', 25, 'C'), ('Pagadas', 25, 'C'),
+                ('Pendientes', 25, 'C'), ('Pagado (Bs)', 35, 'R'),
+                ('Pendiente (Bs)', 35, 'R'), ('Total (Bs)', 35, 'R')]
+    posicion_x_inicio = (pdf.w - sum(ancho for _, ancho, _ in columnas)) / 2
+
+    def encabezado():
+        pdf.set_font("Arial", 'B', 10)
+        pdf.set_x(posicion_x_inicio)
+        for titulo, ancho, _ in columnas:
+            pdf.cell(ancho, 10, titulo, 1, 0, 'C')
+        pdf.ln()
+
+    def fila(etiqueta, grupo):
+        pdf.set_x(posicion_x_inicio)
+        valores = [str(etiqueta)[:50], str(grupo['multas']), str(grupo['pagadas']),
+                   str(grupo['pendientes']), f"{grupo['bs_pagado'] or 0:,.2f}",
+                   f"{grupo['bs_pendiente'] or 0:,.2f}", f"{grupo['bs_total'] or 0:,.2f}"]
+        for valor, (_, ancho, alineacion) in zip(valores, columnas):
+            pdf.cell(ancho, 8, valor, 1, 0, alineacion)
+        pdf.ln()
+
+    encabezado()
+    pdf.set_font("Arial", '', 8)
+    for etiqueta, grupo in filas:
+        if pdf.get_y() + 8 > pdf.page_break_trigger:
+            pdf.add_page()
+            encabezado()
+            pdf.set_font("Arial", '', 8)
+        fila(etiqueta, grupo)
+    pdf.set_font("Arial", 'B', 9)
+    fila("Total", total)
+
+
+def pdf_bytes(pdf):
+    """Contenido del PDF en memoria (fpdf2 devuelve bytes; PyFPDF, una cadena latin-1)."""
+    with warnings.catch_warnings():
+        # fpdf2 marca 'dest' como obsoleto, pero PyFPDF lo necesita
+        warnings.simplefilter('ignore', DeprecationWarning)
+        data = pdf.output(dest='S')
+    if isinstance(data, str):
+        data = data.encode('latin-1')
+    return bytes(data)
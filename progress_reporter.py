@@ -0,0 +1,188 @@
+# progress_reporter.py
+"""
+Módulo para informar el progreso de tareas largas (envíos, importaciones,
+exportaciones, reportes PDF, backups) sin saturar la interfaz.
+
+Los hilos de trabajo solo actualizan contadores protegidos por un lock; la
+interfaz se refresca a una frecuencia máxima fija (por defecto 10 Hz) con el
+avance, la velocidad y el tiempo estimado restante.
+"""
+
+import threading
+import time
+
+
+def format_duration(seconds):
+    """Formatea una duración en segundos como 'HH:MM:SS' o 'MM:SS'."""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours:d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def _format_amount(value, unit):
+    if unit == "bytes":
+        for suffix in ("B", "KB", "MB", "GB"):
+            if value < 1024 or suffix == "GB":
+                return f"{value:,.0f} {suffix}" if suffix == "B" else f"{value:,.1f} {suffix}"
+            value /= 1024
+    return f"{value:,.0f}"
+
+
+def format_progress(snapshot):
+    """
+    Devuelve un texto legible para un snapshot de ProgressReporter.
+    Ejemplo: 'Envío: 120/1000 (12%) · 4.2 contactos/s · ETA 03:29'
+    """
+    unit = snapshot['unit']
+    done = _format_amount(snapshot['done'], unit)
+    parts = []
+    if snapshot['total']:
+        total = _format_amount(snapshot['total'], unit)
+        parts.append(f"{done}/{total} ({snapshot['percent']:.0f}%)")
+    else:
+        parts.append(done if unit == "bytes" else f"{done} {unit}")
+    if snapshot['rate']:
+        rate = _format_amount(snapshot['rate'], unit)
+        parts.append(f"{rate}/s" if unit == "bytes" else f"{snapshot['rate']:.1f} {unit}/s")
+    if snapshot['finished']:
+        parts.append(f"tiempo {format_duration(snapshot['elapsed'])}")
+    elif snapshot['eta'] is not None:
+        parts.append(f"ETA {format_duration(snapshot['eta'])}")
+    if snapshot['failed']:
+        parts.append(f"{snapshot['failed']} con error")
+    text = " · ".join(parts)
+    return f"{snapshot['title']}: {text}" if snapshot['title'] else text
+
+
+class ProgressReporter:
+    """
+    Acumula el progreso de una tarea desde cualquier hilo y lo entrega a un callback
+    como máximo 'max_rate_hz' veces por segundo.
+
+    Con 'root' (tk.Tk) el callback se ejecuta en el hilo de Tk mediante after(); sin
+    'root' (por ejemplo, desde la línea de comandos) se ejecuta en un hilo propio.
+    """
+
+    def __init__(self, on_update, root=None, title="", total=0, unit="elementos", max_rate_hz=10):
+        """
+        Args:
+            on_update (callable): Recibe un snapshot (dict) con el estado actual.
+            root (tk.Tk, opcional): Ventana raíz para programar los refrescos.
+            title (str): Nombre de la tarea, usado por format_progress.
+            total (int): Total esperado (0 si se desconoce).
+            unit (str): Unidad del avance ('contactos', 'filas', 'bytes', ...).
+            max_rate_hz (float): Frecuencia máxima de refresco.
+        """
+        self.on_update = on_update
+        self.root = root
+        self.title = title
+        self.unit = unit
+        self.interval = 1.0 / max_rate_hz
+
+        self._lock = threading.Lock()
+        self._total = total
+        self._done = 0
+        self._failed = 0
+        self._message = ""
+        self._dirty = True
+        self._finished = False
+        self._start_time = None
+        self._end_time = None
+        self._stop_event = threading.Event()
+
+    # --- API para los hilos de trabajo ---
+
+    def start(self):
+        """Empieza a medir el tiempo y a refrescar la interfaz periódicamente."""
+        self._start_time = time.monotonic()
+        if self.root is not None:
+            self.root.after(0, self._tick)
+        else:
+            threading.Thread(target=self._run_headless, daemon=True).start()
+        return self
+
+    def set_total(self, total):
+        with self._lock:
+            self._total = total
+            self._dirty = True
+
+    def advance(self, amount=1, failed=0, message=None):
+        """Suma 'amount' unidades completadas (de las cuales 'failed' fallaron)."""
+        with self._lock:
+            self._done += amount
+            self._failed += failed
+            if message is not None:
+                self._message = message
+            self._dirty = True
+
+    def update(self, done, message=None):
+        """Fija el avance absoluto."""
+        with self._lock:
+            self._done = done
+            if message is not None:
+                self._message = message
+            self._dirty = True
+
+    def finish(self, message=None):
+        """Marca la tarea como terminada y fuerza un último refresco."""
+        with self._lock:
+            self._finished = True
+            self._end_time = time.monotonic()
+            if message is not None:
+                self._message = message
+            self._dirty = True
+        self._stop_event.set()
+
+    def snapshot(self):
+        """Devuelve el estado actual con velocidad (unidades/s) y ETA (s) calculadas."""
+        with self._lock:
+            done, total, failed = self._done, self._total, self._failed
+            message, finished = self._message, self._finished
+            end_time = self._end_time
+        now = end_time or time.monotonic()
+        elapsed = now - self._start_time if self._start_time else 0.0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if total and rate > 0 and not finished:
+            eta = max(0.0, (total - done) / rate)
+        percent = min(100.0, (done / total) * 100) if total else 0.0
+        return {
+            'title': self.title,
+            'unit': self.unit,
+            'done': done,
+            'total': total,
+            'failed': failed,
+            'percent': percent,
+            'elapsed': elapsed,
+            'rate': rate,
+            'eta': eta,
+            'message': message,
+            'finished': finished,
+        }
+
+    # --- Refresco de la interfaz ---
+
+    def _flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        self.on_update(self.snapshot())
+
+    def _tick(self):
+        """Refresco en el hilo de Tk; se reprograma hasta que la tarea termina."""
+        self._flush()
+        if not self._stop_event.is_set():
+            self.root.after(int(self.interval * 1000), self._tick)
+        else:
+            self._flush()
+
+    def _run_headless(self):
+        while not self._stop_event.wait(self.interval):
+            self._flush()
+        self._flush()
@@ -0,0 +1,160 @@
+# report_cache.py
+"""
+Módulo con la caché en disco de los reportes PDF de multas.
+
+Generar el mismo reporte varias veces al día (p. ej. el mensual) vuelve a
+consultar y a dibujar miles de filas. La caché guarda cada reporte generado
+con una clave que combina sus filtros y la versión de los datos de multas
+(DatabaseManager.get_data_version): mientras los datos no cambien, pedir el
+mismo reporte solo copia el archivo que ya existe.
+
+- Cualquier alta, cambio o baja de multas (o de contactos) desde la aplicación
+  cambia la versión, así que nunca se devuelve un reporte desactualizado.
+- Restaurar un backup devuelve el contador al valor del backup; por eso la
+  restauración cambia la época de la versión (DatabaseManager.renew_data_epoch),
+  lo que invalida la caché de todos los equipos que comparten la BD.
+- El tamaño total está limitado ('[pdf] report_cache_mb'); al superarlo se
+  borran los reportes usados hace más tiempo.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Cambiarlo si cambia el diseño de los reportes, para no reutilizar PDF viejos.
+REPORT_CACHE_VERSION = "1"
+
+
+def ruta_volumen(filepath, numero, total):
+    """Ruta del volumen 'numero' (desde 1) de un reporte de 'total' volúmenes."""
+    if total == 1:
+        return filepath
+    base, extension = os.path.splitext(filepath)
+    return f"{base}_vol{numero:02d}{extension}"
+
+
+class ReportCache:
+    """
+    Caché de reportes PDF en una carpeta, limitada en tamaño.
+
+    Uso:
+        cache = ReportCache.from_config(config)
+        clave = cache.key('detalle', filtros, db_manager.get_data_version())
+        rutas = cache.get(clave, filepath)
+        if rutas is None:
+            rutas = generar_reporte(filepath)
+            cache.put(clave, rutas)
+    """
+
+    def __init__(self, directory, max_bytes):
+        """
+        Args:
+            directory (str): Carpeta de la caché (se crea al guardar el primer reporte).
+            max_bytes (int): Tamaño máximo de la caché; 0 = caché desactivada.
+        """
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.get('pdf', 'report_cache_dir', fallback='reportes_cache'),
+            int(config.getfloat('pdf', 'report_cache_mb', fallback=200) * 1024 * 1024))
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def key(self, *partes):
+        """Clave SHA-256 de las partes que definen un reporte (tipo, filtros, versión de datos...)."""
+        data = json.dumps((REPORT_CACHE_VERSION,) + partes, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _manifest_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, filepath):
+        """
+        Si el reporte está en la caché, lo copia a 'filepath' (y a
+        'nombre_volNN.pdf' si tiene varios volúmenes) y devuelve las rutas
+        copiadas; si no, devuelve None.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            try:
+                with open(self._manifest_path(key), encoding='utf-8') as manifest:
+                    archivos = json.load(manifest)['archivos']
+                origenes = [os.path.join(self.directory, archivo) for archivo in archivos]
+                rutas = []
+                for numero, origen in enumerate(origenes, start=1):
+                    ruta = ruta_volumen(filepath, numero, len(origenes))
+                    shutil.copyfile(origen, ruta)
+                    rutas.append(ruta)
+                # La fecha del manifiesto marca el último uso, para la expulsión
+                os.utime(self._manifest_path(key))
+            except (OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return rutas
+
+    def put(self, key, rutas):
+        """Guarda en la caché una copia de los archivos de un reporte recién generado."""
+        if not self.enabled:
+            return
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            archivos = []
+            for numero, ruta in enumerate(rutas, start=1):
+                archivo = f"{key}_{numero:02d}.pdf"
+                temp_path = os.path.join(self.directory, f"{archivo}.{os.getpid()}.tmp")
+                shutil.copyfile(ruta, temp_path)
+                os.replace(temp_path, os.path.join(self.directory, archivo))
+                archivos.append(archivo)
+            # El manifiesto se escribe al final: una entrada sin él no existe para get()
+            temp_path = f"{self._manifest_path(key)}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as manifest:
+                json.dump({'archivos': archivos}, manifest)
+            os.replace(temp_path, self._manifest_path(key))
+            self._evict()
+
+    def _evict(self):
+        """Borra las entradas usadas hace más tiempo hasta quedar por debajo de 'max_bytes'."""
+        # Cada entrada es '<clave>.json' más sus volúmenes '<clave>_NN.pdf'
+        grupos = {}
+        for nombre in os.listdir(self.directory):
+            clave = nombre.split('.', 1)[0].split('_', 1)[0]
+            grupos.setdefault(clave, []).append(os.path.join(self.directory, nombre))
+        entradas = []
+        total = 0
+        for clave, archivos in grupos.items():
+            try:
+                tamano = sum(os.path.getsize(archivo) for archivo in archivos)
+                # Sin manifiesto (p. ej. una escritura interrumpida) se borra primero
+                manifiesto = self._manifest_path(clave)
+                usado = os.path.getmtime(manifiesto) if os.path.isfile(manifiesto) else 0
+            except OSError:
+                continue
+            entradas.append((usado, tamano, archivos))
+            total += tamano
+        for _, tamano, archivos in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            for archivo in archivos:
+                try:
+                    os.remove(archivo)
+                except OSError:
+                    pass
+            total -= tamano
+
+    def clear(self):
+        """Vacía la caché (p. ej. después de restaurar un backup de la BD)."""
+        with self._lock:
+            if os.path.isdir(self.directory):
+                shutil.rmtree(self.directory, ignore_errors=True)
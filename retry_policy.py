@@ -0,0 +1,302 @@
+# retry_policy.py
+"""
+Módulo con la política de reintentos y el cortocircuito (circuit breaker) de
+los canales de envío.
+
+Los errores se clasifican en tres tipos:
+- transitorios (4xx de SMTP, desconexiones, timeouts, fallos de WhatsApp Web):
+  se reintentan con espera exponencial con jitter y cuentan para el breaker;
+- del canal (p. ej. autenticación SMTP rechazada): no se reintentan, pero
+  cuentan para el breaker porque afectarán a todos los mensajes;
+- permanentes (5xx de SMTP para ese destinatario, datos inválidos): no se
+  reintentan ni cuentan para el breaker, porque el canal funciona.
+
+Cuando la proporción de fallos recientes de un canal supera el umbral, el
+breaker se abre y pausa el canal durante un tiempo; después deja pasar un envío
+de prueba y, si funciona, el canal se reanuda.
+"""
+
+import asyncio
+import random
+import smtplib
+import threading
+import time
+from collections import deque
+
+ERROR_TRANSITORIO = 'transitorio'
+ERROR_CANAL = 'canal'
+ERROR_PERMANENTE = 'permanente'
+
+
+def clasificar_error(error):
+    """Devuelve ERROR_TRANSITORIO, ERROR_CANAL o ERROR_PERMANENTE para una excepción de envío."""
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return ERROR_CANAL
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        if codes and all(400 <= code < 500 for code in codes):
+            return ERROR_TRANSITORIO
+        return ERROR_PERMANENTE
+    if isinstance(error, smtplib.SMTPResponseException):
+        return ERROR_TRANSITORIO if 400 <= error.smtp_code < 500 else ERROR_PERMANENTE
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError)):
+        return ERROR_TRANSITORIO
+    # aiosmtplib (backend asyncio) tiene sus propias excepciones; las de
+    # conexión y timeout ya son OSError.
+    if type(error).__module__.startswith('aiosmtplib'):
+        if type(error).__name__ == 'SMTPAuthenticationError':
+            return ERROR_CANAL
+        codes = [refused.code for refused in getattr(error, 'recipients', [])]
+        codes = codes or [getattr(error, 'code', 0)]
+        if all(400 <= code < 500 for code in codes):
+            return ERROR_TRANSITORIO
+        return ERROR_PERMANENTE
+    # Selenium no se importa aquí (es pesado y opcional): sus errores (timeouts,
+    # elementos que no aparecen, navegador caído) son los típicos tropiezos de
+    # WhatsApp Web.
+    if type(error).__module__.startswith('selenium'):
+        return ERROR_TRANSITORIO
+    return ERROR_PERMANENTE
+
+
+class RetryPolicy:
+    """
+    Reintentos con espera exponencial y jitter completo: antes del reintento n se
+    espera un tiempo aleatorio entre 0 y min(max_delay, base_delay * 2**n).
+    """
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config, section):
+        return cls(
+            max_attempts=config.getint(
+                section, 'retry_max_attempts', fallback=3),
+            base_delay=config.getfloat(
+                section, 'retry_base_delay', fallback=1.0),
+            max_delay=config.getfloat(section, 'retry_max_delay', fallback=60.0))
+
+    def delay(self, attempt):
+        """Espera antes del reintento número 'attempt' (empezando en 1)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitOpenError(Exception):
+    """El canal está pausado por el breaker y se canceló la espera."""
+
+
+class CircuitBreaker:
+    """
+    Breaker por canal, compartido por todos sus hilos de envío.
+
+    Mira los últimos 'window' resultados; si hay al menos 'min_calls' y la
+    proporción de fallos llega a 'failure_rate', se abre durante 'cooldown'
+    segundos. Pasado ese tiempo queda medio abierto: un solo envío de prueba, y
+    según su resultado se cierra o se vuelve a abrir.
+    """
+
+    CERRADO = 'cerrado'
+    ABIERTO = 'abierto'
+    MEDIO_ABIERTO = 'medio abierto'
+
+    def __init__(self, name, failure_rate=0.5, window=20, min_calls=5, cooldown=60.0, log=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.log = log or (lambda message, level="info": print(message))
+
+        self._results = deque(maxlen=window)
+        self._state = self.CERRADO
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, section, name, log=None):
+        return cls(
+            name,
+            failure_rate=config.getfloat(
+                section, 'breaker_failure_rate', fallback=0.5),
+            window=config.getint(section, 'breaker_window', fallback=20),
+            min_calls=config.getint(section, 'breaker_min_calls', fallback=5),
+            cooldown=config.getfloat(
+                section, 'breaker_cooldown', fallback=60.0),
+            log=log)
+
+    @property
+    def state(self):
+        return self._state
+
+    def try_acquire(self):
+        """
+        Devuelve 0 si el canal admite un envío ahora (y lo cuenta como envío de
+        prueba si está medio abierto); si no, los segundos a esperar antes de
+        volver a preguntar. No bloquea.
+        """
+        with self._lock:
+            if self._state == self.ABIERTO:
+                wait = self._opened_at + self.cooldown - time.monotonic()
+                if wait > 0:
+                    return wait
+                self._state = self.MEDIO_ABIERTO
+                self.log(
+                    f"{self.name}: probando el canal tras la pausa...", "warning")
+            if self._state == self.CERRADO:
+                return 0.0
+            if not self._trial_running:
+                self._trial_running = True
+                return 0.0
+            # Otro envío está haciendo la prueba.
+            return 0.5
+
+    def acquire(self, stop_event=None):
+        """
+        Espera hasta que el canal admita un envío. Lanza CircuitOpenError si
+        'stop_event' se activa mientras el canal está pausado.
+        """
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    raise CircuitOpenError(
+                        f"{self.name} pausado por fallos repetidos.")
+            else:
+                time.sleep(wait)
+
+    def record(self, success):
+        """Registra el resultado de un envío que cuenta para la salud del canal."""
+        with self._lock:
+            if self._state == self.MEDIO_ABIERTO:
+                self._trial_running = False
+                if success:
+                    self._state = self.CERRADO
+                    self._results.clear()
+                    self.log(f"{self.name}: canal reanudado.")
+                else:
+                    self._open()
+                return
+            self._results.append(success)
+            if self._state == self.CERRADO and len(self._results) >= self.min_calls:
+                failures = self._results.count(False)
+                if failures / len(self._results) >= self.failure_rate:
+                    self._open()
+
+    def release(self):
+        """Libera el turno de prueba sin registrar resultado (error no imputable al canal)."""
+        with self._lock:
+            self._trial_running = False
+
+    def _open(self):
+        self._state = self.ABIERTO
+        self._opened_at = time.monotonic()
+        self.log(
+            f"{self.name}: demasiados fallos, canal en pausa {self.cooldown:.0f} s.", "warning")
+
+
+def enviar_con_reintentos(send, policy, breaker=None, stop_event=None, log=None, descripcion=""):
+    """
+    Ejecuta 'send()' aplicando la política de reintentos y el breaker del canal.
+
+    Returns:
+        int: Número de intentos realizados.
+
+    Raises:
+        La última excepción si el envío no se logró; el número de intentos queda
+        en el atributo 'attempts' de la excepción.
+    """
+    log = log or (lambda message, level="info": print(message))
+    attempt = 0
+    while True:
+        attempt += 1
+        if breaker:
+            try:
+                breaker.acquire(stop_event)
+            except CircuitOpenError as e:
+                e.attempts = attempt - 1
+                raise
+        try:
+            send()
+        except Exception as e:
+            tipo = clasificar_error(e)
+            if breaker:
+                if tipo == ERROR_PERMANENTE:
+                    breaker.release()
+                else:
+                    breaker.record(False)
+            if tipo != ERROR_TRANSITORIO or attempt >= policy.max_attempts:
+                e.attempts = attempt
+                raise
+            wait = policy.delay(attempt)
+            log(f"Reintento {attempt + 1}/{policy.max_attempts} de {descripcion} en {wait:.1f} s: {e}",
+                "warning")
+            if stop_event is not None and stop_event.wait(wait):
+                e.attempts = attempt
+                raise
+            if stop_event is None:
+                time.sleep(wait)
+        else:
+            if breaker:
+                breaker.record(True)
+            return attempt
+
+
+async def esperar_async(stop_event, timeout):
+    """Espera 'timeout' segundos; devuelve True si 'stop_event' (asyncio.Event) se activó antes."""
+    try:
+        await asyncio.wait_for(stop_event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def enviar_con_reintentos_async(send, policy, breaker=None, stop_event=None, log=None,
+                                      descripcion=""):
+    """
+    Versión para asyncio de enviar_con_reintentos: 'send' es una función que
+    devuelve una corrutina y 'stop_event' un asyncio.Event. Las esperas del
+    breaker y de los reintentos no bloquean el bucle de eventos.
+    """
+    log = log or (lambda message, level="info": print(message))
+    attempt = 0
+    while True:
+        attempt += 1
+        while breaker:
+            wait = breaker.try_acquire()
+            if wait <= 0:
+                break
+            if stop_event is not None and await esperar_async(stop_event, wait):
+                error = CircuitOpenError(f"{breaker.name} pausado por fallos repetidos.")
+                error.attempts = attempt - 1
+                raise error
+            if stop_event is None:
+                await asyncio.sleep(wait)
+        try:
+            await send()
+        except Exception as e:
+            tipo = clasificar_error(e)
+            if breaker:
+                if tipo == ERROR_PERMANENTE:
+                    breaker.release()
+                else:
+                    breaker.record(False)
+            if tipo != ERROR_TRANSITORIO or attempt >= policy.max_attempts:
+                e.attempts = attempt
+                raise
+            wait = policy.delay(attempt)
+            log(f"Reintento {attempt + 1}/{policy.max_attempts} de {descripcion} en {wait:.1f} s: {e}",
+                "warning")
+            if stop_event is not None and await esperar_async(stop_event, wait):
+                e.attempts = attempt
+                raise
+            if stop_event is None:
+                await asyncio.sleep(wait)
+        else:
+            if breaker:
+                breaker.record(True)
+            return attempt
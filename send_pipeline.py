@@ -0,0 +1,507 @@
+# send_pipeline.py
+"""
+Módulo con los canales de envío de las campañas (email y WhatsApp).
+
+Cada canal es un pipeline independiente con su propia cola, sus propios hilos y
+su propio ritmo: la pausa entre mensajes de WhatsApp no frena al email (solo se
+espera a un canal cuando su cola está llena). Un CampaignRunner recorre una única vez
+la lista de destinatarios, personaliza los textos, reparte los trabajos entre
+los canales y combina el progreso (un contacto cuenta como terminado cuando
+todos sus canales terminaron).
+
+Las campañas pasan por la bandeja de salida de la BD (ver outbox.py): primero se
+encolan los mensajes personalizados y luego se drenan los pendientes, lo que
+permite reanudarlas. Los envíos de prueba usan run(), que envía directamente.
+
+No depende de Tkinter, así que puede usarse también fuera de la interfaz.
+"""
+
+import abc
+import queue
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+
+from email_dispatcher import crear_dispatcher
+from message_templates import CompiledMessage
+from retry_policy import CircuitBreaker, RetryPolicy, enviar_con_reintentos
+from whatsapp_sender import AdaptivePacer, TimingStats
+from outbox import OutboxWriter, content_hash
+
+# Resultado de un envío en un canal. 'key' es el identificador interno del
+# contacto dentro de la campaña (o el id de la fila en la bandeja de salida).
+SendResult = namedtuple(
+    'SendResult', ['key', 'channel', 'destination', 'ok', 'error', 'elapsed', 'attempts'])
+
+_STOP = object()
+
+
+def destino_valido(value):
+    """Indica si un email o teléfono del contacto se puede usar para enviar."""
+    return bool(value) and value != "N/A"
+
+
+class ChannelPipeline(abc.ABC):
+    """
+    Canal de envío genérico: una cola propia, 'workers' hilos y una pausa mínima
+    'delay' entre envíos de cada hilo, con reintentos y breaker opcionales.
+    La cola es limitada: submit() se bloquea si está llena, así que el
+    consumo de memoria no depende del tamaño de la campaña.
+    Las subclases implementan _send().
+    """
+
+    channel = ""
+
+    def __init__(self, on_result, workers=1, delay=0.0, queue_size=None,
+                 retry_policy=None, breaker=None, log=None):
+        """
+        Args:
+            on_result (callable): Recibe un SendResult por trabajo; se llama desde
+                los hilos del canal.
+            workers (int): Hilos de envío del canal.
+            delay (float): Segundos de pausa tras cada envío, por hilo.
+            queue_size (int, opcional): Tamaño máximo de la cola; por defecto
+                workers * 50, como en EmailDispatcher.
+            retry_policy (RetryPolicy, opcional): Reintentos de errores transitorios.
+            breaker (CircuitBreaker, opcional): Pausa el canal si falla de forma continuada.
+            log (callable, opcional): log(mensaje, nivel), seguro entre hilos.
+        """
+        self.on_result = on_result
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self.breaker = breaker
+        self.log = log or (lambda message, level="info": print(message))
+        self.workers = max(1, workers)
+        self.delay = delay
+        self._queue = queue.Queue(maxsize=queue_size or self.workers * 50)
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"{self.channel}-{index + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, key, destination, payload):
+        """Encola un envío (se bloquea si la cola está llena). 'payload' depende del canal."""
+        self._queue.put((key, destination, payload))
+
+    def cancel(self):
+        """Descarta los envíos pendientes de la cola."""
+        self._stop_event.set()
+
+    def close(self):
+        """Espera a que se procesen los envíos encolados."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    @abc.abstractmethod
+    def _send(self, destination, payload):
+        """Envía 'payload' a 'destination'; lanza una excepción si falla."""
+
+    def _next_delay(self, ok):
+        """Pausa tras un envío; las subclases pueden adaptarla al resultado."""
+        return self.delay
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            key, destination, payload = item
+            if self._stop_event.is_set():
+                self.on_result(SendResult(
+                    key, self.channel, destination, False, "Envío cancelado.", 0.0, 0))
+                continue
+            started = time.monotonic()
+            ok = False
+            try:
+                attempts = enviar_con_reintentos(
+                    lambda: self._send(destination, payload), self.retry_policy, self.breaker,
+                    self._stop_event, self.log, descripcion=f"{self.channel} a {destination}")
+                ok = True
+            except Exception as e:
+                self.on_result(SendResult(key, self.channel, destination, False, str(e),
+                                          time.monotonic() - started, getattr(e, 'attempts', 1)))
+            else:
+                self.on_result(SendResult(
+                    key, self.channel, destination, True, None, time.monotonic() - started, attempts))
+            delay = self._next_delay(ok)
+            if delay and self._stop_event.wait(delay):
+                continue
+
+
+class WhatsAppPipeline(ChannelPipeline):
+    """
+    Canal de WhatsApp Web. Un único hilo, porque hay un solo navegador, con una
+    pausa adaptativa entre mensajes que parte de 'inter_message_delay'. Con la
+    cola llena, submit() espera al navegador; el email sigue enviando lo que ya
+    tiene en su propia cola. Guarda los tiempos por etapa de cada envío.
+    """
+
+    channel = "whatsapp"
+
+    def __init__(self, services_manager, driver, on_result, delay=0.0, pacer=None, **kwargs):
+        super().__init__(on_result, workers=1, delay=delay, **kwargs)
+        self.services_manager = services_manager
+        self.driver = driver
+        self.pacer = pacer
+        self.timings = TimingStats()
+
+    @classmethod
+    def from_config(cls, services_manager, driver, on_result, log=None):
+        config = services_manager.config
+        return cls(services_manager, driver, on_result,
+                   delay=config.getfloat(
+                       'selenium', 'inter_message_delay', fallback=3),
+                   pacer=AdaptivePacer.from_config(config),
+                   retry_policy=RetryPolicy.from_config(config, 'selenium'),
+                   breaker=CircuitBreaker.from_config(
+                       config, 'selenium', "WhatsApp", log=log),
+                   log=log)
+
+    def _send(self, destination, payload):
+        timings = self.services_manager.send_whatsapp_message(
+            self.driver, destination, payload)
+        if timings:
+            self.timings.record(timings)
+
+    def _next_delay(self, ok):
+        if self.pacer:
+            return self.pacer.next_delay(ok)
+        return self.delay
+
+
+class EmailPipeline:
+    """
+    Canal de email: adapta EmailDispatcher o AsyncEmailDispatcher (varias
+    conexiones SMTP con limitación de tasa) a la interfaz de los pipelines.
+    """
+
+    channel = "email"
+
+    def __init__(self, services_manager, on_result, log=None, backend=None, connections=None,
+                 db_manager=None):
+        """
+        'backend' y 'connections' sustituyen a los de [smtp]; con 'db_manager' la
+        cuota diaria descuenta lo enviado en las últimas 24 horas (ver crear_dispatcher).
+        """
+        self.on_result = on_result
+        self.dispatcher = crear_dispatcher(
+            services_manager, on_result=self._on_email_result, log=log,
+            backend=backend, connections=connections, db_manager=db_manager)
+
+    def _on_email_result(self, result):
+        self.on_result(SendResult(result.contact_id, self.channel, result.email,
+                                  result.ok, result.error, result.elapsed, result.attempts))
+
+    def start(self):
+        self.dispatcher.start()
+        return self
+
+    def submit(self, key, destination, payload):
+        subject, body, attachments = payload
+        self.dispatcher.submit(key, destination, subject, body, attachments)
+
+    def cancel(self):
+        self.dispatcher.cancel()
+
+    def close(self):
+        self.dispatcher.close()
+
+
+class CampaignRunner:
+    """
+    Reparte una campaña entre los canales y combina su progreso.
+
+    Uso:
+        runner = CampaignRunner(services_manager, db_manager, plantillas,
+                                progress=reporter, log=app.log_to_console)
+        runner.add_pipeline(EmailPipeline(services_manager, runner.on_result, log=runner.log))
+        resumen = runner.run(contactos)
+    """
+
+    def __init__(self, services_manager, db_manager, plantillas=("", "", ""), progress=None, log=None,
+                 estados_cuenta=None):
+        """
+        Args:
+            plantillas (tuple): (asunto, cuerpo_email, mensaje_whatsapp) con placeholders.
+                Se compilan aquí, así que un placeholder desconocido lanza TemplateError
+                antes de enviar nada. No hace falta para drenar una campaña ya encolada.
+            progress (ProgressReporter, opcional): Avanza una unidad por contacto terminado.
+            log (callable, opcional): log(mensaje, nivel); debe ser seguro entre hilos.
+            estados_cuenta (StatementGenerator, opcional): Si se indica, cada email
+                lleva adjunto el estado de cuenta en PDF del contacto.
+        """
+        self.services_manager = services_manager
+        self.db_manager = db_manager
+        self.estados_cuenta = estados_cuenta
+        self.mensaje = CompiledMessage(*plantillas)
+        self.progress = progress
+        self.log = log or (lambda message, level="info": print(message))
+        self.pipelines = {}
+
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._pending = {}
+        self._outbox_writer = None
+        self._campana = (None, None)
+        self.contacts = 0
+        self.contacts_failed = 0
+        self.stats = {}
+
+    def add_pipeline(self, pipeline):
+        self.pipelines[pipeline.channel] = pipeline
+        self.stats[pipeline.channel] = {'sent': 0, 'failed': 0}
+        return pipeline
+
+    # --- Personalización ---
+
+    def personalizar(self, contactos, chunk_size=500):
+        """
+        Recorre los contactos y devuelve, para cada uno, (contacto, (asunto,
+        cuerpo_email, mensaje_whatsapp), adjunto). Si las plantillas usan datos de
+        multas, el resumen se consulta una vez por lote de 'chunk_size' contactos;
+        lo mismo las multas de los estados de cuenta, que se generan por lote.
+        'adjunto' es la ruta del estado de cuenta o None.
+        """
+        contactos = iter(contactos)
+        while True:
+            lote = list(islice(contactos, chunk_size))
+            if not lote:
+                return
+            cedulas = [c['id'] for c in lote if c.get('id')]
+            resumenes = {}
+            if self.mensaje.needs_fines and self.db_manager and cedulas:
+                resumenes = self.db_manager.get_pending_fine_summaries(cedulas)
+            adjuntos = {}
+            if self.estados_cuenta and self.db_manager and cedulas:
+                adjuntos = self.estados_cuenta.generar(
+                    lote, self.db_manager.get_fines_for_contacts(cedulas))
+            for contacto in lote:
+                cedula = contacto.get('id')
+                yield contacto, self.mensaje.render(contacto, resumenes.get(cedula)), adjuntos.get(cedula)
+
+    # --- Resultados ---
+
+    def on_result(self, result):
+        """Callback de los pipelines: registra el resultado y cierra el contacto si ya terminó."""
+        with self._lock:
+            stats = self.stats[result.channel]
+            stats['sent' if result.ok else 'failed'] += 1
+            entry = self._pending[result.key]
+            entry['remaining'] -= 1
+            entry['failed'] = entry['failed'] or not result.ok
+            finished = entry['remaining'] == 0
+            if finished:
+                del self._pending[result.key]
+                if entry['failed']:
+                    self.contacts_failed += 1
+        if self._outbox_writer:
+            campana_id, plantilla = self._campana
+            self._outbox_writer.record(
+                result.key, result.ok, result.error, result.attempts,
+                historial=(entry.get('cedula'), result.channel, plantilla, campana_id, result.destination))
+        canal = "Email" if result.channel == "email" else "WhatsApp"
+        if result.ok:
+            self.log(f"{canal} enviado a {entry['nombre']}.")
+        else:
+            self.log(
+                f"Error al enviar {canal} a {entry['nombre']}: {result.error}", "error")
+        if finished and self.progress:
+            self.progress.advance(failed=1 if entry['failed'] else 0)
+
+    # --- Ejecución ---
+
+    def run(self, contactos):
+        """
+        Recorre los contactos, encola sus envíos y espera a que todos los canales
+        terminen. Devuelve un resumen con contadores por canal.
+        """
+        for pipeline in self.pipelines.values():
+            pipeline.start()
+        try:
+            for key, (contacto, textos, adjunto) in enumerate(self.personalizar(contactos)):
+                self._despachar(key, contacto, textos, adjunto)
+        finally:
+            for pipeline in self.pipelines.values():
+                pipeline.close()
+            if self.estados_cuenta:
+                self.estados_cuenta.close()
+        return self.summary()
+
+    def cancel(self):
+        self._cancelled.set()
+        for pipeline in self.pipelines.values():
+            pipeline.cancel()
+
+    def _destinos(self, contacto, canales):
+        destinos = {}
+        if 'email' in canales and destino_valido(contacto.get('email')):
+            destinos['email'] = contacto['email']
+        if 'whatsapp' in canales and destino_valido(contacto.get('telefono')):
+            destinos['whatsapp'] = contacto['telefono']
+        return destinos
+
+    def _despachar(self, key, contacto, textos, adjunto=None):
+        self.contacts += 1
+        destinos = self._destinos(contacto, self.pipelines)
+        if not destinos:
+            if self.progress:
+                self.progress.advance()
+            return
+
+        subject, email_body, whatsapp_msg = textos
+        with self._lock:
+            self._pending[key] = {'nombre': contacto.get('nombre', ''),
+                                  'remaining': len(destinos), 'failed': False}
+        if 'email' in destinos:
+            self.pipelines['email'].submit(
+                key, destinos['email'], (subject, email_body, [adjunto] if adjunto else None))
+        if 'whatsapp' in destinos:
+            self.pipelines['whatsapp'].submit(
+                key, destinos['whatsapp'], whatsapp_msg)
+
+    # --- Campañas con bandeja de salida ---
+
+    def encolar(self, campana_id, contactos, canales, chunk_size=500):
+        """
+        Personaliza los mensajes de cada contacto y los guarda en la bandeja de
+        salida de la campaña, en lotes. Es idempotente: repetirlo no duplica mensajes.
+
+        Args:
+            canales (iterable): Canales a encolar ('email', 'whatsapp').
+
+        Returns:
+            int: Número de mensajes nuevos en la bandeja de salida.
+        """
+        nuevos = 0
+        filas = []
+        try:
+            for contacto, textos, adjunto in self.personalizar(contactos, chunk_size):
+                self.contacts += 1
+                destinos = self._destinos(contacto, canales)
+                if not destinos:
+                    continue
+                subject, email_body, whatsapp_msg = textos
+                if 'email' in destinos:
+                    filas.append((campana_id, contacto.get('id'), 'email', destinos['email'], subject, email_body,
+                                  adjunto, content_hash('email', destinos['email'], subject, email_body, adjunto)))
+                if 'whatsapp' in destinos:
+                    filas.append((campana_id, contacto.get('id'), 'whatsapp', destinos['whatsapp'], None,
+                                  whatsapp_msg, None,
+                                  content_hash('whatsapp', destinos['whatsapp'], None, whatsapp_msg)))
+                if len(filas) >= chunk_size:
+                    nuevos += self.db_manager.enqueue_outbox(filas)
+                    filas = []
+        finally:
+            if self.estados_cuenta:
+                self.estados_cuenta.close()
+        if filas:
+            nuevos += self.db_manager.enqueue_outbox(filas)
+        return nuevos
+
+    def encolar_campana(self, campana, chunk_size=500):
+        """
+        Encola los destinatarios de una campaña según los filtros guardados al
+        crearla (DatabaseManager.get_campaign), saltando a los que ya están en su
+        bandeja de salida: sirve tanto para prepararla como para terminar una
+        preparación interrumpida. Las plantillas del runner deben ser las de la campaña.
+
+        Returns:
+            int: Número de mensajes nuevos en la bandeja de salida.
+        """
+        canales = [canal for canal in campana['canales'].split(',') if canal]
+        filtros = dict(campana['filtros'], excluir_campana=campana['id'])
+        lotes = self.db_manager.iter_campaign_recipients(filtros, chunk_size)
+        return self.encolar(campana['id'], (contacto for lote in lotes for contacto in lote),
+                            canales, chunk_size)
+
+    def drenar(self, campana_id, limites=None, estado_si_quedan='pausada'):
+        """
+        Envía los mensajes pendientes de la campaña por los canales configurados
+        (add_pipeline) y guarda el resultado de cada uno en la bandeja de salida y
+        en el historial de envíos.
+        Al terminar, la campaña queda 'completada' o, si quedan pendientes (p. ej.
+        un canal no disponible) o se canceló (cancel()), en 'estado_si_quedan'
+        ('pausada', para poder reanudarla, o 'programada'). Tras cancelar no se
+        envía nada más, y lo que no llegó a intentarse sigue 'pendiente'.
+
+        Args:
+            limites (dict, opcional): {canal: máximo de mensajes a enviar en esta
+                pasada}; los canales que no aparecen no tienen límite. Lo usa el
+                programador de campañas para repartir el envío en el tiempo.
+
+        Returns:
+            dict: Estadísticas de la campaña por canal y estado (get_campaign_stats).
+        """
+        canales = list(self.pipelines)
+        limites = {canal: limite for canal, limite in (limites or {}).items()
+                   if canal in canales and limite is not None}
+        if canales:
+            if self.progress:
+                if limites:
+                    self.progress.set_total(sum(
+                        min(limites.get(canal, float('inf')),
+                            self.db_manager.count_pending_outbox(campana_id, [canal]))
+                        for canal in canales))
+                else:
+                    self.progress.set_total(
+                        self.db_manager.count_pending_outbox(campana_id, canales))
+            self.db_manager.set_campaign_status(campana_id, 'enviando')
+            campana = self.db_manager.get_campaign(campana_id)
+            self._campana = (campana_id, campana['plantilla'] if campana else None)
+
+            self._outbox_writer = OutboxWriter(
+                self.db_manager, log=self.log).start()
+            for pipeline in self.pipelines.values():
+                pipeline.start()
+            enviados = dict.fromkeys(canales, 0)
+            try:
+                for lote in self.db_manager.iter_pending_outbox(campana_id, canales):
+                    if self._cancelled.is_set():
+                        break
+                    if limites and all(enviados[canal] >= limites.get(canal, float('inf'))
+                                       for canal in canales):
+                        break
+                    for fila in lote:
+                        if self._cancelled.is_set():
+                            break
+                        if enviados[fila['canal']] >= limites.get(fila['canal'], float('inf')):
+                            continue
+                        enviados[fila['canal']] += 1
+                        with self._lock:
+                            self._pending[fila['id']] = {'nombre': fila['destino'], 'cedula': fila['cedula_rif'],
+                                                         'remaining': 1, 'failed': False}
+                        if fila['canal'] == 'email':
+                            payload = (fila['asunto'] or "", fila['cuerpo'] or "",
+                                       [fila['adjunto']] if fila.get('adjunto') else None)
+                        else:
+                            payload = fila['cuerpo'] or ""
+                        self.pipelines[fila['canal']].submit(
+                            fila['id'], fila['destino'], payload)
+            finally:
+                for pipeline in self.pipelines.values():
+                    pipeline.close()
+                self._outbox_writer.close()
+                self._outbox_writer = None
+
+        stats = self.db_manager.get_campaign_stats(campana_id)
+        quedan = sum(canal['pendiente'] for canal in stats.values())
+        self.db_manager.set_campaign_status(
+            campana_id, estado_si_quedan if quedan or self._cancelled.is_set() else 'completada')
+        return stats
+
+    def summary(self):
+        with self._lock:
+            return {
+                'contacts': self.contacts,
+                'contacts_failed': self.contacts_failed,
+                'channels': {channel: dict(stats) for channel, stats in self.stats.items()},
+            }
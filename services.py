@@ -4,33 +4,22 @@ Módulo para gestionar servicios externos como el envío de emails (SMTP)
 y la automatización de WhatsApp (Selenium).
 """
 import sys
-from fpdf import FPDF
 from datetime import datetime
 
-import smtplib
-import ssl
-import urllib.parse
-import time
 import os
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import (TimeoutException, WebDriverException,
-                                        NoSuchElementException, ElementClickInterceptedException)
+from smtp_session import SMTPSession
+from whatsapp_session import WhatsAppSessionManager
+from whatsapp_sender import WhatsAppSender
+import webdriver_cache
+import pdf_layout
+import browser_profile
 
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
-
-
-import sys  # Añade este import
+# Selenium, webdriver_manager (vía webdriver_cache) y fpdf se importan dentro de los métodos que los usan:
+# cargarlos al importar este módulo retrasaba varios segundos el arranque de la app.
 
 
 def resource_path(relative_path):
@@ -48,165 +37,282 @@ class ServicesManager:
     def __init__(self, config, fernet):
         self.config = config
         self.fernet = fernet
+        # Navegador con WhatsApp Web que se mantiene abierto entre envíos
+        self.whatsapp_session = WhatsAppSessionManager(self)
+        self.whatsapp_sender = WhatsAppSender(config)
+
+    def shutdown(self):
+        """Libera los recursos externos abiertos (el navegador de WhatsApp)."""
+        self.whatsapp_session.shutdown()
 
-    def send_email(self, recipient_email, subject, body):
+    def _smtp_session_args(self):
         """
-        Envía un correo electrónico usando la configuración SMTP.
+        Parámetros de conexión de la sección [smtp]. La contraseña se descifra
+        una sola vez por sesión, no por mensaje.
         """
-        # Descifra la contraseña justo antes de usarla
         smtp_password = self.fernet.decrypt(
             self.config.get('smtp', 'password').encode()).decode()
+        return dict(
+            server=self.config['smtp']['server'],
+            port=int(self.config['smtp']['port']),
+            sender_email=self.config['smtp']['sender_email'],
+            password=smtp_password,
+            max_messages=self.config.getint(
+                'smtp', 'max_messages_per_connection', fallback=100),
+            keepalive_interval=self.config.getfloat(
+                'smtp', 'keepalive_interval', fallback=60),
+            timeout=self.config.getfloat('smtp', 'timeout', fallback=30),
+            security=self.config.get('smtp', 'security', fallback='ssl').strip().lower())
+
+    def open_email_session(self):
+        """Crea una sesión SMTP persistente con la configuración actual."""
+        return SMTPSession(**self._smtp_session_args())
+
+    def open_async_email_session(self):
+        """Como open_email_session(), para el backend asyncio (requiere aiosmtplib)."""
+        from async_email import AsyncSMTPSession
+        return AsyncSMTPSession(**self._smtp_session_args())
+
+    def build_email(self, recipient_email, subject, body, attachments=None):
+        """
+        Construye el mensaje MIME a partir de los textos ya personalizados.
 
-        msg = MIMEMultipart("alternative")
+        Args:
+            attachments (list, opcional): Rutas de archivos PDF a adjuntar.
+        """
+        msg = MIMEMultipart("mixed" if attachments else "alternative")
         msg["Subject"] = subject
         msg["From"] = self.config['smtp']['sender_email']
         msg["To"] = recipient_email
         msg.attach(MIMEText(body, "plain"))
+        for path in attachments or ():
+            if not os.path.isfile(path):
+                # ValueError y no FileNotFoundError: no es un error transitorio
+                # y no tiene sentido reintentar el envío.
+                raise ValueError(f"No existe el archivo adjunto: {path}")
+            with open(path, 'rb') as attachment_file:
+                part = MIMEApplication(attachment_file.read(), _subtype="pdf")
+            part.add_header('Content-Disposition', 'attachment',
+                            filename=os.path.basename(path))
+            msg.attach(part)
+        return msg
+
+    def send_email(self, recipient_email, subject, body, session=None, attachments=None):
+        """
+        Envía un correo electrónico usando la configuración SMTP.
+
+        Args:
+            session (SMTPSession, opcional): Sesión abierta con open_email_session()
+                para reutilizar la conexión entre mensajes. Sin ella se abre y se
+                cierra una conexión solo para este mensaje.
+            attachments (list, opcional): Rutas de archivos PDF a adjuntar, p. ej.
+                los estados de cuenta de StatementGenerator.
+        """
+        msg = self.build_email(recipient_email, subject, body, attachments)
+        if session is not None:
+            session.send_message(msg)
+            return
+        with self.open_email_session() as one_shot:
+            one_shot.send_message(msg)
+
+    async def send_email_async(self, recipient_email, subject, body, session, attachments=None):
+        """
+        Corrutina equivalente a send_email() para el backend asyncio.
 
-        with smtplib.SMTP_SSL(self.config['smtp']['server'], int(self.config['smtp']['port'])) as server:
-            server.login(self.config['smtp']['sender_email'], smtp_password)
-            server.sendmail(msg["From"], msg["To"], msg.as_string())
+        Args:
+            session (AsyncSMTPSession): Sesión abierta con open_async_email_session().
+        """
+        await session.send_message(self.build_email(recipient_email, subject, body, attachments))
 
-    def init_selenium_driver(self):
+    def init_selenium_driver(self, headless=None):
         """
         Inicializa y devuelve un driver de Selenium según la configuración.
+
+        La ruta del ejecutable del driver se toma de 'driver_path' o de la caché en
+        config.ini, sin acceder a la red; solo la primera vez (o si el driver en
+        caché ya no es compatible con el navegador) se resuelve con webdriver_manager.
+
+        Args:
+            headless (bool, opcional): Arrancar sin ventana. Por defecto lo decide
+                'profile_mode'/'headless_after_pairing' (ver browser_profile).
         """
         browser = self.config['selenium']['browser'].lower()
         if browser == 'none':
             return None
 
+        from selenium.common.exceptions import WebDriverException, SessionNotCreatedException
+        if browser not in ('firefox', 'chrome', 'brave'):
+            raise WebDriverException(f"Navegador '{browser}' no soportado.")
+        if headless is None:
+            headless = browser_profile.use_headless(self.config)
+
         try:
-            if browser == 'firefox':
-                options = FirefoxOptions()
-                if self.config['selenium'].get('firefox_profile_path'):
-                    options.add_argument(
-                        f"-profile {self.config['selenium']['firefox_profile_path']}")
-                if self.config['selenium'].get('browser_binary_location'):
-                    options.binary_location = self.config['selenium']['browser_binary_location']
-                service = FirefoxService(GeckoDriverManager().install())
-                return webdriver.Firefox(service=service, options=options)
-            elif browser in ('chrome', 'brave'):
-                options = ChromeOptions()
-                if self.config['selenium'].get('chrome_user_data_dir'):
-                    options.add_argument(
-                        f"--user-data-dir={self.config['selenium']['chrome_user_data_dir']}")
-                    options.add_argument(
-                        f"--profile-directory={self.config['selenium'].get('chrome_profile_directory', 'Default')}")
-                if self.config['selenium'].get('browser_binary_location'):
-                    options.binary_location = self.config['selenium']['browser_binary_location']
-                service = ChromeService(ChromeDriverManager().install())
-                return webdriver.Chrome(service=service, options=options)
-            else:
-                raise WebDriverException(
-                    f"Navegador '{browser}' no soportado.")
+            driver_path, origen = webdriver_cache.resolve_driver_path(
+                self.config, browser)
+            try:
+                return self._build_driver(browser, driver_path, headless)
+            except SessionNotCreatedException:
+                if origen != 'cache':
+                    raise
+                # El navegador se actualizó y el driver en caché ya no le sirve
+                webdriver_cache.invalidate_cache(self.config)
+                driver_path, _ = webdriver_cache.resolve_driver_path(
+                    self.config, browser, use_cache=False)
+                return self._build_driver(browser, driver_path, headless)
         except Exception as e:
             raise WebDriverException(f"Error al iniciar {browser}: {e}")
 
+    def _build_driver(self, browser, driver_path, headless=False):
+        """Arranca el navegador con el driver indicado y las opciones de [selenium]."""
+        from selenium import webdriver
+        if browser == 'firefox':
+            from selenium.webdriver.firefox.service import Service as FirefoxService
+            from selenium.webdriver.firefox.options import Options as FirefoxOptions
+            options = FirefoxOptions()
+            browser_profile.apply_firefox(self.config, options, headless)
+            if self.config['selenium'].get('browser_binary_location'):
+                options.binary_location = self.config['selenium']['browser_binary_location']
+            service = FirefoxService(driver_path)
+            return webdriver.Firefox(service=service, options=options)
+
+        from selenium.webdriver.chrome.service import Service as ChromeService
+        from selenium.webdriver.chrome.options import Options as ChromeOptions
+        options = ChromeOptions()
+        browser_profile.apply_chrome(self.config, options, headless)
+        if self.config['selenium'].get('browser_binary_location'):
+            options.binary_location = self.config['selenium']['browser_binary_location']
+        service = ChromeService(driver_path)
+        driver = webdriver.Chrome(service=service, options=options)
+        browser_profile.after_start(driver, browser, headless)
+        return driver
+
     def send_whatsapp_message(self, driver, phone_number, message):
         """
         Usa un driver de Selenium existente para enviar un mensaje de WhatsApp.
+        Devuelve los tiempos por etapa del envío (ver WhatsAppSender.send).
         """
-        phone_number_str = str(phone_number)
-        phone_number_digits = ''.join(filter(str.isdigit, phone_number_str))
-
-        encoded_message = urllib.parse.quote(message)
-        whatsapp_url = f"https://web.whatsapp.com/send?phone={phone_number_digits}&text={encoded_message}"
-        driver.get(whatsapp_url)
+        return self.whatsapp_sender.send(driver, phone_number, message)
 
-        wait_time = float(self.config['selenium']['element_wait_time'])
-        send_button_xpath = '//button[@aria-label="Send"] | //button[@aria-label="Enviar"] | //span[@data-icon="send"]'
-
-        send_button = WebDriverWait(driver, wait_time).until(
-            EC.element_to_be_clickable((By.XPATH, send_button_xpath))
-        )
-        # Pequeña pausa para asegurar que el botón es realmente interactuable
-        time.sleep(1)
-
-        try:
-            send_button.click()
-        except ElementClickInterceptedException:
-            print("Clic normal interceptado. Usando clic de respaldo (JavaScript)...")
-            driver.execute_script("arguments[0].click();", send_button)
-
-        # Al inicio de services.py, junto a los otros imports
-
-# Dentro de la clase ServicesManager
-    def generate_pdf_report(self, multas_data, report_title, filepath):
-        """Genera un reporte en PDF a partir de una lista de datos de multas."""
-        pdf = FPDF(orientation='L', unit='mm', format='A4')
-        pdf.add_page()
-
-        try:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            header_path = resource_path(
-                os.path.join('assets', 'header_inea.png'))
-            ancho_pagina = pdf.w - pdf.l_margin - pdf.r_margin
-            pdf.image(header_path, x=pdf.l_margin,
-                      y=pdf.t_margin, w=ancho_pagina)
-            pdf.ln(25)
-        except FileNotFoundError:
-            # Si no encuentra la imagen, simplemente escribe un texto en el PDF
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(
-                0, 10, "Encabezado no disponible (header_inea.png no encontrado)", 0, 1, 'C')
-            pdf.ln(10)
-
-        pdf.set_font("Arial", 'B', 16)
-
-        pdf.cell(0, 10, report_title, 0, 1, 'C')
-        pdf.ln(10)
+    def generate_pdf_report(self, multas_data, report_title, filepath, total, progress=None):
+        """
+        Genera un reporte en PDF a partir de una lista de datos de multas.
 
-        ancho_cols = {'exp': 60, 'ced': 35, 'f_m': 30,
-                      'f_p': 30, 'uc': 20, 'bs': 40, 'est': 30}
-        total_ancho_tabla = sum(ancho_cols.values())
-        posicion_x_inicio = (pdf.w - total_ancho_tabla) / 2
+        Args:
+            total (dict): Fila de totales de DatabaseManager.get_fines_summary
+                con los mismos filtros que las multas.
+            progress (ProgressReporter, opcional): Recibe una unidad de avance por fila.
+        """
+        pdf = pdf_layout.nuevo_pdf(report_title, self.header_image_path())
+        pdf_layout.tabla_multas(pdf, multas_data, progress)
+        self._resumen_reporte(pdf, total)
+        pdf.output(filepath)
 
-        pdf.set_font("Arial", 'B', 10)
-        pdf.set_x(posicion_x_inicio)
-        headers = ['Nro. Expediente', 'Cedula/RIF', 'Fecha Multa',
-                   'Fecha Pago', 'U/C', 'Monto (Bs)', 'Estado']
-        widths = [ancho_cols['exp'], ancho_cols['ced'], ancho_cols['f_m'],
-                  ancho_cols['f_p'], ancho_cols['uc'], ancho_cols['bs'], ancho_cols['est']]
-        for i, header in enumerate(headers):
-            pdf.cell(widths[i], 10, header, 1, 0, 'C')
-        pdf.ln()
-
-        pdf.set_font("Arial", '', 8)
-        total_bs_pagado = 0
-        for multa in multas_data:
-            pdf.set_x(posicion_x_inicio)
-            estado = "Pendiente" if multa['multa_pendiente'] else "Pagada"
-            monto_bs_num = multa.get('bs') or 0.00
-            if not multa['multa_pendiente']:
-                total_bs_pagado += monto_bs_num
-
-            pdf.cell(ancho_cols['exp'], 10, str(
-                multa['expediente_nro'])[:35], 1, 0, 'L')
-            pdf.cell(ancho_cols['ced'], 10, str(
-                multa['cedula_rif']), 1, 0, 'L')
-            pdf.cell(ancho_cols['f_m'], 10, multa['fecha_multa'].strftime(
-                '%Y-%m-%d') if multa.get('fecha_multa') else "-", 1, 0, 'C')
-            pdf.cell(ancho_cols['f_p'], 10, multa['fecha_pago'].strftime(
-                '%Y-%m-%d') if multa.get('fecha_pago') else "---", 1, 0, 'C')
-            pdf.cell(ancho_cols['uc'], 10, str(multa['uc']), 1, 0, 'C')
-            pdf.cell(ancho_cols['bs'], 10, f"{monto_bs_num:,.2f}", 1, 0, 'R')
-
-            if multa['multa_pendiente']:
-                pdf.set_text_color(255, 0, 0)
+    def generate_pdf_report_stream(self, lotes, report_title, filepath, total, progress=None,
+                                   rows_per_volume=None):
+        """
+        Genera un reporte en PDF recorriendo las multas por lotes (p. ej.
+        DatabaseManager.iter_fines_for_report), sin tener la lista completa en memoria.
+
+        fpdf guarda en memoria el documento hasta escribirlo, así que el reporte se
+        divide en volúmenes de 'rows_per_volume' filas: cada volumen se escribe en
+        disco al llenarse y se libera antes de empezar el siguiente. Si hace falta
+        más de uno, los archivos se llaman 'nombre_vol01.pdf', 'nombre_vol02.pdf'...
+        y los totales de todo el reporte van al final del último.
+
+        Args:
+            total (dict): Fila de totales de DatabaseManager.get_fines_summary con
+                los mismos filtros que los lotes; los totales no se suman en Python.
+            rows_per_volume (int, opcional): Filas por volumen; por defecto
+                '[pdf] report_rows_per_volume'. 0 = un solo archivo.
+            progress (ProgressReporter, opcional): Recibe una unidad de avance por fila.
+
+        Returns:
+            list: Rutas de los archivos generados.
+        """
+        if rows_per_volume is None:
+            rows_per_volume = self.config.getint('pdf', 'report_rows_per_volume', fallback=50000)
+        base, extension = os.path.splitext(filepath)
+        header_path = self.header_image_path()
+        rutas = []
+        pdf = None
+        filas_volumen = 0
+
+        def cerrar_volumen(ultimo):
+            if not ultimo:
+                pdf.ln(5)
+                pdf.set_x(pdf_layout.inicio_tabla(pdf))
+                pdf.set_font("Arial", 'I', 10)
+                pdf.cell(0, 10, f"Continúa en el volumen {len(rutas) + 2}.", 0, 1, 'L')
+            if len(rutas) == 1:
+                # Hay más de un volumen: el primero, ya escrito, también lleva el número
+                os.replace(rutas[0], f"{base}_vol01{extension}")
+                rutas[0] = f"{base}_vol01{extension}"
+            ruta = f"{base}_vol{len(rutas) + 1:02d}{extension}" if rutas else filepath
+            pdf.output(ruta)
+            rutas.append(ruta)
+
+        for lote in lotes:
+            for multa in lote:
+                if pdf is None or (rows_per_volume and filas_volumen >= rows_per_volume):
+                    if pdf is not None:
+                        cerrar_volumen(ultimo=False)
+                    titulo = report_title if not rutas else f"{report_title} - Volumen {len(rutas) + 1}"
+                    pdf = pdf_layout.nuevo_pdf(titulo, header_path)
+                    pdf_layout.encabezado_tabla(pdf)
+                    filas_volumen = 0
+                pdf_layout.fila_multa(pdf, multa, repetir_encabezado=True)
+                filas_volumen += 1
+                if progress:
+                    progress.advance()
+
+        if pdf is None:
+            # Sin multas: un reporte con la tabla vacía
+            pdf = pdf_layout.nuevo_pdf(report_title, header_path)
+            pdf_layout.encabezado_tabla(pdf)
+        self._resumen_reporte(pdf, total)
+        cerrar_volumen(ultimo=True)
+        return rutas
+
+    def generate_summary_report(self, agrupar, grupos, total, report_title, filepath):
+        """
+        Genera un reporte resumido en PDF con los totales de
+        DatabaseManager.get_fines_summary: una fila por estado, mes, contacto,
+        descripción o U/C.
+        """
+        titulos = {'estado': "Estado", 'mes': "Mes", 'contacto': "Contacto",
+                   'descripcion': "Descripción", 'uc': "U/C"}
+        filas = []
+        for grupo in grupos:
+            clave = grupo['clave']
+            if agrupar == 'estado':
+                etiqueta = "Pendientes" if clave else "Pagadas"
+            elif agrupar == 'mes':
+                etiqueta = f"{clave // 100}-{clave % 100:02d}" if clave else "Sin fecha"
+            elif agrupar == 'contacto':
+                etiqueta = f"{clave} - {grupo.get('nombre') or ''}"
+            elif agrupar == 'descripcion':
+                etiqueta = clave or "Sin descripción"
             else:
-                pdf.set_text_color(0, 128, 0)
+                etiqueta = f"{clave} U/C" if clave >= 0 else "Sin U/C"
+            filas.append((etiqueta, grupo))
 
-            pdf.cell(ancho_cols['est'], 10, estado, 1, 0, 'C')
-            pdf.set_text_color(0, 0, 0)
-            pdf.ln()
+        pdf = pdf_layout.nuevo_pdf(report_title, self.header_image_path())
+        pdf_layout.tabla_resumen(pdf, titulos[agrupar], filas, total)
+        pdf.output(filepath)
 
+    def _resumen_reporte(self, pdf, total):
+        """Totales al pie del reporte, de la fila del ROLLUP de get_fines_summary."""
+        posicion_x_inicio = pdf_layout.inicio_tabla(pdf)
         pdf.ln(10)
         pdf.set_x(posicion_x_inicio)
         pdf.set_font("Arial", 'B', 12)
         pdf.cell(
-            0, 10, f"Multas totales del mes: {len(multas_data)}", 0, 1, 'L')
+            0, 10, f"Multas totales del mes: {total['multas']}", 0, 1, 'L')
         pdf.set_x(posicion_x_inicio)
         pdf.cell(
-            0, 10, f"Monto total pagado en el mes: {total_bs_pagado:,.2f} Bs.", 0, 1, 'L')
+            0, 10, f"Monto total pagado en el mes: {total['bs_pagado'] or 0:,.2f} Bs.", 0, 1, 'L')
 
-        pdf.output(filepath)
+    def header_image_path(self):
+        """Ruta de la imagen del encabezado de los PDF, o None si no existe."""
+        header_path = resource_path(os.path.join('assets', 'header_inea.png'))
+        return header_path if os.path.isfile(header_path) else None
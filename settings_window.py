@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 
+from config_handler import guardar_configuracion
+
 
 class SettingsWindow(tk.Toplevel):
     """
@@ -29,6 +31,10 @@ class SettingsWindow(tk.Toplevel):
         self._create_tab("selenium", "WhatsApp (Selenium)")
         self._create_tab("login", "Usuario App")
         self._create_tab("test_recipient", "Destinatario de Prueba")
+        self._create_tab("app", "Aplicación")
+        self._create_tab("scheduler", "Programador")
+        self._create_tab("history", "Historial")
+        self._create_tab("pdf", "Reportes PDF")
 
         self._load_settings()
 
@@ -106,8 +112,7 @@ class SettingsWindow(tk.Toplevel):
                     self.controller.config.set(section, option, new_value)
 
             # Escribimos los cambios en el archivo config.ini
-            with open('config.ini', 'w', encoding='utf-8') as configfile:
-                self.controller.config.write(configfile)
+            guardar_configuracion(self.controller.config)
 
             messagebox.showinfo("Configuración Guardada",
                                 "Los cambios se han guardado correctamente.\n\nAlgunos cambios (como los de la base de datos) pueden requerir que reinicies la aplicación.",
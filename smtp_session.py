@@ -0,0 +1,181 @@
+# smtp_session.py
+"""
+Módulo con la sesión SMTP persistente usada en los envíos masivos de email.
+
+En lugar de abrir una conexión, negociar TLS e iniciar sesión por cada mensaje,
+una SMTPSession se conecta una vez y reutiliza la conexión para muchos envíos.
+Se reconecta sola si el servidor cierra la conexión o impone un límite de
+mensajes por sesión, y envía NOOP para comprobar conexiones que llevan tiempo
+inactivas antes de usarlas.
+"""
+
+import smtplib
+import ssl
+import threading
+import time
+
+# Códigos con los que el servidor indica que cierra la sesión o que no acepta más
+# mensajes en ella (p. ej. Gmail: '421 4.7.0 Try again later, closing connection').
+RECONNECT_CODES = (421, 451, 454)
+
+
+class SMTPSession:
+    """
+    Conexión SMTP reutilizable para varios mensajes.
+
+    No es necesario llamar a open(): la conexión se abre en el primer envío. Es
+    segura entre hilos (los envíos de una misma sesión se serializan), aunque lo
+    habitual es una sesión por hilo de envío.
+    """
+
+    def __init__(self, server, port, sender_email, password, max_messages=100,
+                 keepalive_interval=60, timeout=30, security='ssl'):
+        """
+        Args:
+            server (str): Servidor SMTP.
+            port (int): Puerto SMTP.
+            sender_email (str): Usuario y remitente.
+            password (str): Contraseña ya descifrada.
+            max_messages (int): Mensajes por conexión antes de reconectar (0 = sin límite).
+            keepalive_interval (float): Segundos de inactividad tras los cuales se
+                comprueba la conexión con NOOP antes de enviar.
+            timeout (float): Timeout de socket en segundos.
+            security (str): 'ssl' (SMTP sobre SSL), 'starttls' o 'none' (sin
+                cifrado; solo para servidores locales como el del benchmark).
+        """
+        self.server = server
+        self.port = port
+        self.sender_email = sender_email
+        self.password = password
+        self.max_messages = max_messages
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        self.security = security
+
+        self._smtp = None
+        self._lock = threading.Lock()
+        self._sent_in_connection = 0
+        self._last_activity = 0.0
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # --- Conexión ---
+
+    def open(self):
+        """Abre la conexión e inicia sesión si no hay una abierta."""
+        with self._lock:
+            self._ensure_connected()
+
+    def _connect(self):
+        if self.security == 'ssl':
+            smtp = smtplib.SMTP_SSL(
+                self.server, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.security == 'starttls':
+                smtp.starttls(context=ssl.create_default_context())
+            smtp.login(self.sender_email, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self._sent_in_connection = 0
+        self._last_activity = time.monotonic()
+        self.connections_opened += 1
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            # La conexión ya estaba rota; basta con cerrar el socket.
+            try:
+                self._smtp.close()
+            except OSError:
+                pass
+        self._smtp = None
+
+    def _is_alive(self):
+        """Comprueba con NOOP una conexión que lleva tiempo sin usarse."""
+        try:
+            code, _ = self._smtp.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        self._last_activity = time.monotonic()
+        return code == 250
+
+    def _ensure_connected(self):
+        if self._smtp is not None:
+            if self.max_messages and self._sent_in_connection >= self.max_messages:
+                self._disconnect()
+            elif (time.monotonic() - self._last_activity) >= self.keepalive_interval \
+                    and not self._is_alive():
+                self._disconnect()
+        if self._smtp is None:
+            self._connect()
+
+    def keepalive(self):
+        """
+        Envía NOOP si la conexión lleva inactiva más de 'keepalive_interval'.
+        Útil entre lotes largos para que el servidor no la cierre por inactividad.
+        """
+        with self._lock:
+            if self._smtp is None:
+                return
+            if (time.monotonic() - self._last_activity) >= self.keepalive_interval \
+                    and not self._is_alive():
+                self._disconnect()
+
+    def close(self):
+        """Cierra la conexión (QUIT)."""
+        with self._lock:
+            self._disconnect()
+
+    # --- Envío ---
+
+    def send_message(self, msg):
+        """
+        Envía un mensaje (email.message) reutilizando la conexión.
+
+        Si el servidor cerró la conexión o rechaza el mensaje con un código de
+        reconexión (421/451/454), se reconecta y se reintenta una sola vez.
+        Los rechazos definitivos (destinatario inválido, autenticación...) se
+        propagan sin reintentar.
+        """
+        with self._lock:
+            for attempt in range(2):
+                self._ensure_connected()
+                try:
+                    self._smtp.sendmail(msg["From"], msg["To"], msg.as_string())
+                except smtplib.SMTPServerDisconnected:
+                    self._smtp = None
+                    if attempt:
+                        raise
+                    continue
+                except smtplib.SMTPResponseException as e:
+                    if e.smtp_code not in RECONNECT_CODES or attempt:
+                        raise
+                    self._disconnect()
+                    continue
+                except smtplib.SMTPException:
+                    # Destinatarios rechazados y demás errores SMTP: la conexión
+                    # sigue sana (SMTPException hereda de OSError).
+                    raise
+                except OSError:
+                    # Socket caído (timeout, reset): se descarta la conexión.
+                    self._disconnect()
+                    if attempt:
+                        raise
+                    continue
+                self._sent_in_connection += 1
+                self._last_activity = time.monotonic()
+                self.messages_sent += 1
+                return
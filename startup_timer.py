@@ -0,0 +1,61 @@
+# startup_timer.py
+"""
+Módulo para medir el tiempo de arranque de la aplicación.
+
+Debe importarse lo antes posible en main.py: el instante de su importación se toma
+como el inicio del programa. Cada fase del arranque registra una marca y al final
+se genera un reporte legible con la duración de cada una.
+"""
+
+import time
+
+_PROGRAM_START = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    Registra marcas de tiempo con nombre desde el inicio del programa.
+    """
+
+    def __init__(self, start=_PROGRAM_START):
+        self.start = start
+        self.marks = []
+
+    def mark(self, name, user_wait=False):
+        """
+        Registra el instante actual con el nombre de la fase que acaba de terminar.
+
+        Args:
+            user_wait (bool): Si la fase fue una espera del usuario (p. ej. escribir la
+                clave en el login); se muestra pero no cuenta en el total.
+        """
+        self.marks.append((name, time.perf_counter(), user_wait))
+
+    def elapsed(self):
+        """Segundos transcurridos desde el inicio del programa."""
+        return time.perf_counter() - self.start
+
+    def report(self):
+        """
+        Devuelve un texto con la duración de cada fase y el total, p. ej.:
+        'Arranque en 1.42 s (login visible: 0.35 s, [login: 4.10 s], ventana principal: 0.20 s, ...)'
+        Las fases entre corchetes son esperas del usuario y no suman al total.
+        """
+        if not self.marks:
+            return f"Arranque en {self.elapsed():.2f} s"
+        phases = []
+        total = 0.0
+        previous = self.start
+        for name, instant, user_wait in self.marks:
+            duration = instant - previous
+            if user_wait:
+                phases.append(f"[{name}: {duration:.2f} s]")
+            else:
+                phases.append(f"{name}: {duration:.2f} s")
+                total += duration
+            previous = instant
+        return f"Arranque en {total:.2f} s ({', '.join(phases)})"
+
+
+# Instancia única compartida por main.py y app_gui.py
+startup_timer = StartupTimer()
@@ -0,0 +1,103 @@
+# webdriver_cache.py
+"""
+Módulo para resolver la ruta del ejecutable del WebDriver (geckodriver o
+chromedriver) sin acceder a la red en cada arranque del navegador.
+
+Orden de resolución:
+1. 'driver_path' de [selenium], si está configurado: se usa tal cual.
+2. La ruta guardada en caché ('driver_cache_path'), si el archivo existe, es del
+   mismo tipo de driver y su versión ('<driver> --version') coincide con la
+   registrada ('driver_cache_version'). Esta comprobación es local.
+3. webdriver_manager (descarga o consulta en internet). El resultado se guarda
+   en config.ini para los siguientes arranques.
+
+Si el navegador se actualizó y el driver en caché ya no es compatible,
+ServicesManager.init_selenium_driver invalida la caché y vuelve a resolver.
+"""
+
+import os
+import re
+import subprocess
+
+from config_handler import guardar_configuracion
+
+VERSION_RE = re.compile(r"(\d+(?:\.\d+)+)")
+
+
+def driver_kind(browser):
+    """Tipo de driver que usa cada navegador soportado."""
+    return 'geckodriver' if browser == 'firefox' else 'chromedriver'
+
+
+def driver_version(path):
+    """Devuelve la versión que informa el ejecutable del driver, o None si no responde."""
+    try:
+        result = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10,
+                                creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_RE.search(result.stdout or "")
+    return match.group(1) if match else None
+
+
+def _cached_driver(config, kind):
+    path = config.get('selenium', 'driver_cache_path', fallback='').strip()
+    if not path or config.get('selenium', 'driver_cache_browser', fallback='') != kind:
+        return None
+    if not os.path.isfile(path):
+        return None
+    expected = config.get('selenium', 'driver_cache_version', fallback='')
+    if not expected or driver_version(path) != expected:
+        return None
+    return path
+
+
+def _download_driver(kind):
+    """Resuelve el driver con webdriver_manager. Accede a la red."""
+    if kind == 'geckodriver':
+        from webdriver_manager.firefox import GeckoDriverManager
+        return GeckoDriverManager().install()
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+def resolve_driver_path(config, browser, use_cache=True, log=None):
+    """
+    Devuelve (ruta, origen) del driver para 'browser'. 'origen' es 'config',
+    'cache' o 'download'.
+    """
+    log = log or print
+    explicit = config.get('selenium', 'driver_path', fallback='').strip()
+    if explicit:
+        if not os.path.isfile(explicit):
+            raise FileNotFoundError(
+                f"El driver configurado en 'driver_path' no existe: {explicit}")
+        return explicit, 'config'
+
+    kind = driver_kind(browser)
+    if use_cache:
+        cached = _cached_driver(config, kind)
+        if cached:
+            return cached, 'cache'
+
+    log(f"Resolviendo {kind} con webdriver_manager (requiere conexión)...")
+    path = _download_driver(kind)
+    version = driver_version(path) or ''
+    config.set('selenium', 'driver_cache_path', path)
+    config.set('selenium', 'driver_cache_version', version)
+    config.set('selenium', 'driver_cache_browser', kind)
+    try:
+        guardar_configuracion(config)
+    except OSError as e:
+        log(f"No se pudo guardar la caché del driver en config.ini: {e}")
+    return path, 'download'
+
+
+def invalidate_cache(config):
+    """Olvida el driver en caché (p. ej. tras un error de versión incompatible)."""
+    for option in ('driver_cache_path', 'driver_cache_version', 'driver_cache_browser'):
+        config.set('selenium', option, '')
+    try:
+        guardar_configuracion(config)
+    except OSError:
+        pass
@@ -0,0 +1,245 @@
+# whatsapp_sender.py
+"""
+Módulo con el envío de mensajes por WhatsApp Web sobre un driver ya abierto.
+
+Para abrir cada chat no se recarga la aplicación web completa: se inserta en la
+página un enlace 'send?phone=...&text=...' y se hace clic en él, de modo que
+WhatsApp Web abre el chat con el texto ya escrito sin navegar (modo 'in_app').
+Si el chat no aparece a tiempo se recurre a la navegación completa con
+driver.get() (modo 'url'), y tras varios fallos seguidos del modo in_app se usa
+'url' durante el resto de la sesión.
+
+No hay pausas fijas: se espera a que el compositor tenga el texto, a que el
+botón de enviar sea clicable y a que el mensaje enviado muestre su marca de
+enviado. Cada envío devuelve los tiempos de sus etapas, y AdaptivePacer ajusta
+la pausa entre mensajes según los resultados.
+"""
+
+import random
+import threading
+import time
+import urllib.parse
+
+DEFAULT_BASE_URL = "https://web.whatsapp.com/"
+
+SEND_BUTTON_XPATH = '//button[@aria-label="Send"] | //button[@aria-label="Enviar"] | //span[@data-icon="send"]'
+
+# Devuelve el texto del compositor del chat abierto ('' si está vacío) o null si
+# no hay compositor, y marca si WhatsApp mostró el aviso de número inválido.
+COMPOSER_STATE_JS = """
+const popup = document.querySelector('[data-animate-modal-popup="true"]');
+if (popup && !document.querySelector('footer')) { return {invalid: popup.innerText}; }
+const composer = document.querySelector('footer div[contenteditable="true"]');
+return {text: composer ? composer.innerText : null};
+"""
+
+OUTGOING_COUNT_JS = "return document.querySelectorAll('div.message-out').length;"
+
+# Estado del último mensaje saliente: 'sent' con una o dos marcas, 'pending' con
+# el reloj, null si aún no hay mensaje nuevo.
+LAST_OUTGOING_STATUS_JS = """
+const messages = document.querySelectorAll('div.message-out');
+if (messages.length <= arguments[0]) { return null; }
+const last = messages[messages.length - 1];
+if (last.querySelector('[data-icon="msg-check"], [data-icon="msg-dblcheck"], [data-icon="msg-dblcheck-ack"]')) {
+    return 'sent';
+}
+return 'pending';
+"""
+
+OPEN_CHAT_JS = """
+const link = document.createElement('a');
+link.href = arguments[0];
+link.style.display = 'none';
+document.body.appendChild(link);
+link.click();
+link.remove();
+"""
+
+
+def _normalizar(texto):
+    return " ".join((texto or "").split())
+
+
+class WhatsAppNumberError(ValueError):
+    """WhatsApp indicó que el número no está registrado. No tiene sentido reintentar."""
+
+
+class WhatsAppSender:
+    """
+    Envía mensajes con un driver que ya tiene WhatsApp Web cargado.
+    """
+
+    IN_APP_FAILURES_BEFORE_FALLBACK = 3
+
+    def __init__(self, config, base_url=None):
+        self.mode = config.get(
+            'selenium', 'whatsapp_navigation', fallback='in_app')
+        self.element_wait = float(
+            config.get('selenium', 'element_wait_time', fallback=20))
+        self.in_app_timeout = config.getfloat(
+            'selenium', 'whatsapp_in_app_timeout', fallback=5)
+        self.sent_timeout = config.getfloat(
+            'selenium', 'whatsapp_sent_timeout', fallback=15)
+        base_url = base_url or config.get(
+            'selenium', 'whatsapp_base_url', fallback=DEFAULT_BASE_URL)
+        self.base_url = base_url.rstrip('/') + '/'
+        self._in_app_failures = 0
+
+    def _send_url(self, phone_digits, message):
+        return f"{self.base_url}send?phone={phone_digits}&text={urllib.parse.quote(message)}"
+
+    def _wait_composer(self, driver, message, timeout):
+        """Espera a que el compositor del chat tenga el texto del mensaje."""
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.common.exceptions import JavascriptException
+
+        esperado = _normalizar(message)[:40]
+
+        def composer_ready(d):
+            state = d.execute_script(COMPOSER_STATE_JS)
+            if state.get('invalid'):
+                raise WhatsAppNumberError(
+                    f"Número no válido en WhatsApp: {_normalizar(state['invalid'])}")
+            text = state.get('text')
+            return text is not None and _normalizar(text).startswith(esperado)
+
+        # Mientras WhatsApp cambia de chat (o recarga) el script puede fallar
+        WebDriverWait(driver, timeout, poll_frequency=0.1,
+                      ignored_exceptions=(JavascriptException,)).until(composer_ready)
+
+    def _open_chat(self, driver, phone_digits, message):
+        """Abre el chat con el texto escrito; devuelve el modo que funcionó."""
+        from selenium.common.exceptions import TimeoutException
+
+        url = self._send_url(phone_digits, message)
+        if self.mode == 'in_app' and self._in_app_failures < self.IN_APP_FAILURES_BEFORE_FALLBACK:
+            try:
+                driver.execute_script(OPEN_CHAT_JS, url)
+                self._wait_composer(driver, message, self.in_app_timeout)
+                self._in_app_failures = 0
+                return 'in_app'
+            except TimeoutException:
+                self._in_app_failures += 1
+        driver.get(url)
+        self._wait_composer(driver, message, self.element_wait)
+        return 'url'
+
+    def send(self, driver, phone_number, message):
+        """
+        Envía 'message' a 'phone_number' y espera la marca de enviado.
+
+        Un error antes del clic deja el mensaje sin enviar (se puede reintentar).
+        Si tras el clic la marca de enviado no llega a tiempo, el mensaje ya salió
+        del compositor: no se lanza error, para no duplicarlo al reintentar, y se
+        indica con 'confirmado' = False.
+
+        Returns:
+            dict: Tiempos en segundos ('abrir_chat', 'enviar', 'confirmacion',
+                'total'), el modo de navegación usado ('modo') y 'confirmado'.
+        """
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import ElementClickInterceptedException, TimeoutException
+
+        phone_digits = ''.join(filter(str.isdigit, str(phone_number)))
+        started = time.monotonic()
+
+        modo = self._open_chat(driver, phone_digits, message)
+        chat_ready = time.monotonic()
+
+        before = driver.execute_script(OUTGOING_COUNT_JS)
+        send_button = WebDriverWait(driver, self.element_wait, poll_frequency=0.1).until(
+            EC.element_to_be_clickable((By.XPATH, SEND_BUTTON_XPATH)))
+        try:
+            send_button.click()
+        except ElementClickInterceptedException:
+            driver.execute_script("arguments[0].click();", send_button)
+        clicked = time.monotonic()
+
+        try:
+            WebDriverWait(driver, self.sent_timeout, poll_frequency=0.1).until(
+                lambda d: d.execute_script(LAST_OUTGOING_STATUS_JS, before) == 'sent')
+            confirmado = True
+        except TimeoutException:
+            confirmado = False
+        confirmed = time.monotonic()
+
+        return {
+            'modo': modo,
+            'confirmado': confirmado,
+            'abrir_chat': chat_ready - started,
+            'enviar': clicked - chat_ready,
+            'confirmacion': confirmed - clicked,
+            'total': confirmed - started,
+        }
+
+
+class AdaptivePacer:
+    """
+    Pausa entre mensajes de WhatsApp que se adapta a los resultados: baja poco a
+    poco mientras los envíos salen bien y se duplica ante un fallo, siempre entre
+    'min_delay' y 'max_delay', con un ±20 % aleatorio para no enviar a ritmo fijo.
+    """
+
+    def __init__(self, initial_delay, min_delay, max_delay):
+        self.min_delay = min_delay
+        self.max_delay = max(min_delay, max_delay)
+        self.delay = min(self.max_delay, max(self.min_delay, initial_delay))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.getfloat('selenium', 'inter_message_delay', fallback=3),
+            config.getfloat('selenium', 'whatsapp_min_delay', fallback=1),
+            config.getfloat('selenium', 'whatsapp_max_delay', fallback=20))
+
+    def next_delay(self, ok):
+        with self._lock:
+            if ok:
+                self.delay = max(self.min_delay, self.delay * 0.9)
+            else:
+                self.delay = min(self.max_delay, self.delay * 2)
+            return self.delay * random.uniform(0.8, 1.2)
+
+
+class TimingStats:
+    """Acumula los tiempos por etapa de los envíos y los resume (media y p95)."""
+
+    STAGES = ('abrir_chat', 'enviar', 'confirmacion', 'total')
+
+    def __init__(self):
+        self._samples = {stage: [] for stage in self.STAGES}
+        self._modes = {}
+        self._unconfirmed = 0
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        with self._lock:
+            for stage in self.STAGES:
+                self._samples[stage].append(timings[stage])
+            self._modes[timings['modo']] = self._modes.get(
+                timings['modo'], 0) + 1
+            if not timings.get('confirmado', True):
+                self._unconfirmed += 1
+
+    def summary(self):
+        """Texto con la media y el percentil 95 de cada etapa."""
+        with self._lock:
+            count = len(self._samples['total'])
+            if not count:
+                return "sin envíos completados"
+            parts = []
+            for stage in self.STAGES:
+                values = sorted(self._samples[stage])
+                mean = sum(values) / count
+                p95 = values[min(count - 1, int(count * 0.95))]
+                parts.append(f"{stage} {mean:.2f}s (p95 {p95:.2f}s)")
+            modes = ", ".join(f"{mode}: {n}" for mode, n in self._modes.items())
+            unconfirmed = self._unconfirmed
+        text = f"{count} mensajes · " + " · ".join(parts) + f" · modos {modes}"
+        if unconfirmed:
+            text += f" · {unconfirmed} sin marca de enviado"
+        return text
@@ -0,0 +1,182 @@
+# whatsapp_session.py
+"""
+Módulo con la sesión de WhatsApp Web compartida entre trabajos de envío.
+
+Abrir el navegador y esperar a que WhatsApp Web cargue cuesta varios segundos,
+así que el driver no se cierra al terminar un envío: queda abierto para el
+siguiente. Antes de reutilizarlo se comprueba que sigue respondiendo; si la
+página se perdió se recarga WhatsApp y, si el navegador murió, se arranca uno
+nuevo. La aplicación lo cierra al salir (App.on_closing).
+
+Con el perfil de automatización (ver browser_profile) se recuerda si la sesión
+quedó vinculada; si un arranque sin ventana encuentra la sesión caducada, se
+vuelve a abrir el navegador con ventana para escanear el código QR.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import browser_profile
+
+WHATSAPP_URL = "https://web.whatsapp.com/"
+
+# Panel lateral con la lista de chats: solo existe con la sesión iniciada.
+SIDE_PANEL_XPATH = '//*[@id="side"]'
+
+
+def _print_log(message, level="info"):
+    print(f"[{level.upper()}] {message}")
+
+
+class WhatsAppSessionManager:
+    """
+    Mantiene un único driver de Selenium con WhatsApp Web cargado.
+
+    Solo un trabajo de envío puede usarlo a la vez: acquire() (o lease()) lo
+    reserva y espera si otro trabajo lo está usando.
+    """
+
+    def __init__(self, services_manager):
+        self.services_manager = services_manager
+        self._driver = None
+        self._state_lock = threading.Lock()
+        self._job_lock = threading.Lock()
+        self.starts = 0
+
+    # --- Reserva por trabajo ---
+
+    def acquire(self, log=None):
+        """
+        Reserva la sesión y devuelve el driver con WhatsApp Web listo, o None si el
+        navegador está desactivado en la configuración ('browser = none').
+        Hay que llamar a release() al terminar, aunque falle.
+        """
+        log = log or _print_log
+        if not self._job_lock.acquire(blocking=False):
+            log("Esperando a que termine el envío de WhatsApp en curso...")
+            self._job_lock.acquire()
+        try:
+            return self._ensure_ready(log)
+        except Exception:
+            self._job_lock.release()
+            raise
+
+    def release(self):
+        """Libera la sesión para el siguiente trabajo; el navegador sigue abierto."""
+        self._job_lock.release()
+
+    @contextmanager
+    def lease(self, log=None):
+        driver = self.acquire(log)
+        try:
+            yield driver
+        finally:
+            self.release()
+
+    # --- Estado del navegador ---
+
+    def _probe(self):
+        """
+        Comprueba el driver sin navegar: 'ok' si WhatsApp está cargado, 'page' si
+        el navegador responde pero la página no es la de WhatsApp con sesión, y
+        'dead' si el navegador no responde.
+        """
+        try:
+            loaded = self._driver.execute_script(
+                "return !!document.getElementById('side');")
+        except Exception:
+            return 'dead'
+        return 'ok' if loaded else 'page'
+
+    def _load_whatsapp(self, driver, timeout=None):
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.by import By
+
+        driver.get(self.services_manager.config.get(
+            'selenium', 'whatsapp_base_url', fallback=WHATSAPP_URL))
+        if timeout is None:
+            timeout = float(
+                self.services_manager.config['selenium']['page_load_timeout'])
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, SIDE_PANEL_XPATH)))
+
+    def _start(self, log):
+        from selenium.common.exceptions import TimeoutException
+
+        config = self.services_manager.config
+        lean = browser_profile.lean_mode(config)
+        headless = browser_profile.use_headless(config)
+        driver = self.services_manager.init_selenium_driver(headless=headless)
+        if driver is None:
+            return None
+        self.starts += 1
+        log("Driver de Selenium inicializado. Cargando WhatsApp Web...")
+        timeout = None
+        if lean and not browser_profile.is_paired(config):
+            # Perfil sin vincular: hay que dar tiempo a escanear el código QR
+            timeout = config.getfloat('selenium', 'pairing_timeout', fallback=120)
+            log("Escanea el código QR de WhatsApp Web en el navegador para vincular el perfil.",
+                "warning")
+        try:
+            self._load_whatsapp(driver, timeout)
+        except TimeoutException:
+            driver.quit()
+            if not headless:
+                raise
+            log("La sesión de WhatsApp del perfil ya no está vinculada; "
+                "abriendo el navegador con ventana para escanear el código QR...", "warning")
+            browser_profile.set_paired(config, False)
+            return self._start(log)
+        except Exception:
+            driver.quit()
+            raise
+        if lean:
+            browser_profile.set_paired(config, True)
+        log("WhatsApp Web cargado. Asegúrate de tener la sesión iniciada.")
+        return driver
+
+    def _ensure_ready(self, log):
+        with self._state_lock:
+            if self._driver is not None:
+                estado = self._probe()
+                if estado == 'ok':
+                    log("Reutilizando la sesión de WhatsApp Web abierta.")
+                    return self._driver
+                if estado == 'page':
+                    log("Recargando WhatsApp Web en el navegador abierto...")
+                    try:
+                        self._load_whatsapp(self._driver)
+                        return self._driver
+                    except Exception as e:
+                        log(f"No se pudo recargar WhatsApp Web ({e}); reiniciando el navegador...",
+                            "warning")
+                else:
+                    log("El navegador no responde; reiniciándolo...", "warning")
+                self._quit()
+            self._driver = self._start(log)
+            return self._driver
+
+    def _quit(self):
+        if self._driver is None:
+            return
+        try:
+            self._driver.quit()
+        except Exception:
+            # El proceso del navegador ya no existe.
+            pass
+        self._driver = None
+
+    @property
+    def is_running(self):
+        return self._driver is not None
+
+    def restart(self):
+        """Cierra el navegador actual para que el siguiente acquire() arranque uno nuevo."""
+        with self._state_lock:
+            self._quit()
+
+    def shutdown(self):
+        """Cierra el navegador. Se llama al salir de la aplicación."""
+        with self._state_lock:
+            self._quit()